@@ -3,18 +3,35 @@ from flask_socketio import SocketIO, emit
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 import os
+import time
 import logging
 from werkzeug.utils import secure_filename
 import validators
 
-from config import cfg
-from auth import bp_auth, login_required, init_db, ensure_admin, get_bot_commands, save_bot_commands, BotCommands
+from config import cfg, ensure_dirs
+from auth import bp_auth, login_required, current_user, bind_socket, unbind_socket, socket_user, init_db, ensure_admin, get_bot_commands, save_bot_commands, load_bot_commands, upsert_bot_commands_many, reset_bot_commands as reset_commands_profile
+from render_cache import FragmentCache
+import rate_limit_storage  # noqa: F401  регистрирует схему sqlite:// в limits
+from startup import StartupManager
+from health import get_health_checker
+from docker_events import get_event_dispatcher
+from supervisor import get_supervisor
+from hibernation import get_hibernator
+from warm_pool import get_warm_pool, is_pool_member
+from image_catalog import get_image_catalog, get_image_prepuller
+import resources
+import metrics
+import profiler
 
 app = Flask(__name__)
 app.config.from_object('config.Config')
+metrics.init_app(app)
+profiler.init_app(app)
 app.register_blueprint(bp_auth)
+app.register_blueprint(profiler.bp_profiler)
 
 # Настройка логирования
+ensure_dirs()
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s: %(message)s',
@@ -27,7 +44,7 @@ logger = logging.getLogger(__name__)
 
 # Импортируем Docker API с обработкой ошибок
 try:
-    from docker_api import list_bots, start_bot, stop_bot, restart_bot, remove_bot, create_bot_from_repo, ensure_network, create_workspace, list_workspaces, get_available_images, get_bot_logs, get_bot_info, get_client
+    from docker_api import list_bots, start_bot, stop_bot, restart_bot, remove_bot, create_bot_from_repo, ensure_network, create_workspace, create_workspace_from_template, get_workspace_templates, list_workspaces, get_available_images, get_bot_logs, get_bot_info, get_client, client_for, get_state_version
     DOCKER_AVAILABLE = True
 except Exception as e:
     logger.warning(f'Docker API недоступно: {e}')
@@ -39,13 +56,19 @@ except Exception as e:
     def restart_bot(name): raise RuntimeError("Docker недоступен")
     def remove_bot(name, force=False): raise RuntimeError("Docker недоступен")
     def create_bot_from_repo(*args, **kwargs): raise RuntimeError("Docker недоступен")
-    def ensure_network(): pass  # Не падаем, просто пропускаем
+    def ensure_network(strict=False):
+        if strict:
+            raise RuntimeError("Docker недоступен")
     def create_workspace(*args, **kwargs): raise RuntimeError("Docker недоступен")
+    def create_workspace_from_template(*args, **kwargs): raise RuntimeError("Docker недоступен")
+    def get_workspace_templates(): return {}
     def list_workspaces(): return []
     def get_available_images(): return []
     def get_bot_logs(name, tail=100): return "Docker недоступен"
     def get_bot_info(name): return {'error': 'Docker недоступен'}
-    def get_client(): raise RuntimeError("Docker недоступен")
+    def get_client(node=None): raise RuntimeError("Docker недоступен")
+    def client_for(name): raise RuntimeError("Docker недоступен")
+    def get_state_version(): return 0
 
 try:
     from terminal_manager import start_terminal_session, handle_terminal_input, close_session, start_server_console_session, handle_server_console_input, close_server_console_session
@@ -60,70 +83,95 @@ except Exception as e:
     def handle_server_console_input(*args): pass
     def close_server_console_session(*args): pass
 
+
+def _session_gauge(module: str, attr: str):
+    def count():
+        import importlib
+        return len(getattr(importlib.import_module(module), attr))
+    return count
+
+
+metrics.gauge_func('bot_manager_terminal_sessions', 'Открытые сессии терминала контейнеров',
+                   _session_gauge('terminal_manager', 'TERMINAL_SESSIONS'))
+metrics.gauge_func('bot_manager_server_console_sessions', 'Открытые сессии консоли сервера',
+                   _session_gauge('terminal_manager', 'SERVER_CONSOLE_SESSIONS'))
+metrics.gauge_func('bot_manager_logs_follow_sessions', 'Активные подписки на live-логи',
+                   _session_gauge('log_stream', 'FOLLOW_SESSIONS'))
+
 # Rate limiting
 limiter = Limiter(
     key_func=get_remote_address,
-    default_limits=["100 per hour"]
+    default_limits=[cfg.RATELIMIT_DEFAULT],
+    storage_uri=cfg.RATELIMIT_STORAGE_URI,
+    strategy=cfg.RATELIMIT_STRATEGY,
 )
 limiter.init_app(app)
 
+
+@limiter.request_filter
+def _rate_limit_exempt():
+    """Опрос списка ботов и редеплоя, health и статика не расходуют лимит и не трогают хранилище"""
+    return request.endpoint in cfg.RATELIMIT_EXEMPT_ENDPOINTS
+
 socketio = SocketIO(app, async_mode='eventlet')
 
-ALLOWED_FRONTEND_EXT = {'.html', '.css', '.js'}
 
-# Глобальная переменная для отслеживания успешности инициализации
-startup_success = False
+@app.context_processor
+def _docker_nodes():
+    """Имена Docker-узлов для выбора при создании (пусто, если узел один)"""
+    from nodes import get_node_registry
+    registry = get_node_registry()
+    return {'docker_nodes': [node.name for node in registry.nodes()] if registry.multi else []}
 
 
-def startup():
-    """Инициализация приложения с обработкой ошибок"""
-    errors = []
-    
-    try:
-        logger.info("Инициализация базы данных...")
-        init_db()
-        logger.info("База данных инициализирована успешно")
-    except Exception as e:
-        error_msg = f'Ошибка инициализации БД: {e}'
-        logger.error(error_msg)
-        errors.append(error_msg)
-    
-    try:
-        logger.info("Проверка/создание администратора...")
-        ensure_admin()
-        logger.info("Администратор настроен успешно")
-    except Exception as e:
-        error_msg = f'Ошибка настройки администратора: {e}'
-        logger.error(error_msg)
-        errors.append(error_msg)
-    
-    try:
-        logger.info("Проверка Docker сети...")
-        ensure_network()
-        logger.info("Docker сеть настроена успешно")
-    except Exception as e:
-        error_msg = f'Ошибка Docker сети: {e}'
-        logger.warning(error_msg)  # Warning, а не Error, так как Docker может быть недоступен
-        errors.append(error_msg)
-    
-    if errors:
-        logger.warning(f'Startup завершен с ошибками: {len(errors)} проблем')
-        for error in errors:
-            logger.warning(f'  - {error}')
-    else:
-        logger.info('Startup завершен успешно')
-    
-    return len(errors) == 0
+ALLOWED_FRONTEND_EXT = {'.html', '.css', '.js'}
 
+# Кэш отрендеренной таблицы контейнеров дашборда
+dashboard_cache = FragmentCache(ttl=cfg.DASHBOARD_CACHE_TTL)
+
+def _start_log_collector():
+    from log_archive import start_log_collector
+    if start_log_collector():
+        logger.info("Сборщик архива логов запущен")
+
+
+# Инициализация идёт в фоне: сервер принимает соединения сразу,
+# а Docker может подняться позже — шаг сети повторяется до успеха
+startup_tasks = StartupManager()
+startup_tasks.add('database', init_db)
+startup_tasks.add('admin', ensure_admin, depends=['database'])
+startup_tasks.add('docker_network', lambda: ensure_network(strict=True), retry=True)
+startup_tasks.add('log_collector', _start_log_collector, depends=['database'])
+startup_tasks.add('docker_events', lambda: get_event_dispatcher().start())
+if cfg.SUPERVISOR_ENABLED:
+    # Сверка с Docker повторяется, пока демон недоступен
+    startup_tasks.add('supervisor', lambda: get_supervisor().start(), depends=['database'], retry=True)
+if cfg.HIBERNATE_IDLE_SECONDS > 0:
+    startup_tasks.add('hibernation', lambda: get_hibernator().start(), depends=['database'])
+# Каталог образов для формы создания: кэш сбрасывается по событиям образов Docker
+startup_tasks.add('image_catalog', lambda: get_image_catalog().start())
+if cfg.IMAGE_PREPULL:
+    startup_tasks.add('image_prepull', lambda: get_image_prepuller().start(), depends=['image_catalog'])
+if cfg.WARM_POOL:
+    # Заготовки подключаются к сети менеджера — ждём её создания
+    startup_tasks.add('warm_pool', lambda: get_warm_pool().start(), depends=['docker_network'])
+_process_started_at = time.time()
+if cfg.STARTUP_AUTORUN:
+    startup_tasks.start()
+    get_health_checker().start()
 
-# Вызываем startup при инициализации
-startup_success = False
-try:
-    with app.app_context():
-        startup_success = startup()
-except Exception as e:
-    logger.critical(f'Критическая ошибка при инициализации: {e}')
-    # Продолжаем работу, но отмечаем проблему
+
+@app.before_request
+def wait_for_database():
+    """Первые запросы после старта дожидаются базы и учётной записи администратора"""
+    if request.endpoint in ('health', 'ready', 'static') or startup_tasks.is_settled('admin'):
+        return None
+    deadline = time.time() + cfg.STARTUP_REQUEST_WAIT
+    while not startup_tasks.is_settled('admin') and time.time() < deadline:
+        socketio.sleep(0.05)
+    if not startup_tasks.is_settled('admin'):
+        return jsonify({'status': 'error', 'error': 'Сервис запускается, повторите запрос позже'}), 503
+    return None
 
 
 # Глобальная проверка авторизации
@@ -132,12 +180,12 @@ def require_login():
     """Требовать авторизацию для всех страниц кроме разрешенных"""
     # Список разрешенных endpoints без авторизации
     allowed_endpoints = [
-        'login', 'static', 'health'
+        'login', 'static', 'health', 'ready', 'metrics'
     ]
     
     # Список разрешенных путей без авторизации
     allowed_paths = [
-        '/login', '/static/', '/health', '/socket.io/'
+        '/login', '/static/', '/health', '/ready', '/socket.io/'
     ]
     
     # Проверяем, нужна ли авторизация
@@ -149,7 +197,7 @@ def require_login():
             return None
     
     # Если пользователь не авторизован - редирект на логин
-    if 'user_id' not in session:
+    if current_user() is None:
         if request.method == 'POST' or request.is_json:
             # Для API запросов возвращаем JSON ошибку
             return jsonify({
@@ -164,9 +212,14 @@ def require_login():
 
 @app.route('/')
 def dashboard():
-    bots = list_bots()
-    workspaces = list_workspaces()
-    return render_template('dashboard.html', bots=bots, workspaces=workspaces)
+    def render_containers():
+        bots = list_bots()
+        workspaces = list_workspaces()
+        return render_template('dashboard_containers.html', bots=bots, workspaces=workspaces)
+
+    # Фрагмент перерисовывается только при смене версии состояния контейнеров
+    containers_html = dashboard_cache.get_or_render('containers', get_state_version(), render_containers)
+    return render_template('dashboard.html', containers_html=containers_html)
 
 
 @app.route('/bots/create', methods=['POST'])
@@ -189,7 +242,7 @@ def create_bot():
             return jsonify({'status': 'error', 'error': 'Имя бота слишком длинное'}), 400
         
         logger.info(f"Создание бота из {git_url}, имя: {bot_name}, ветка: {branch}")
-        cid = create_bot_from_repo(git_url, bot_name=bot_name, branch=branch)
+        cid = create_bot_from_repo(git_url, bot_name=bot_name, branch=branch, node=data.get('node') or None)
         logger.info(f"Бот создан успешно, container_id: {cid}")
         return jsonify({'status': 'ok', 'container_id': cid})
         
@@ -199,6 +252,19 @@ def create_bot():
         return jsonify({'status': 'error', 'error': str(e)}), 400
 
 
+def _workspace_form(**kwargs):
+    try:
+        not_pulled = set(get_image_catalog().not_pulled())
+    except Exception:
+        not_pulled = set()
+    return render_template('create_workspace.html',
+                           available_images=get_available_images(),
+                           not_pulled=not_pulled,
+                           workspace_templates=get_workspace_templates(),
+                           warm_templates=[key for key, size in get_warm_pool().sizes.items() if size],
+                           **kwargs)
+
+
 @app.route('/workspace/create', methods=['GET', 'POST'])
 @limiter.limit("10 per minute")
 def create_workspace_page():
@@ -214,18 +280,14 @@ def create_workspace_page():
                 if request.content_type and 'application/json' in request.content_type:
                     return jsonify({'status': 'error', 'error': error_msg}), 400
                 else:
-                    return render_template('create_workspace.html', 
-                                         error=error_msg,
-                                         available_images=get_available_images())
+                    return _workspace_form(error=error_msg)
             
             if len(workspace_name) > 50:
                 error_msg = 'Имя workspace слишком длинное'
                 if request.content_type and 'application/json' in request.content_type:
                     return jsonify({'status': 'error', 'error': error_msg}), 400
                 else:
-                    return render_template('create_workspace.html', 
-                                         error=error_msg,
-                                         available_images=get_available_images())
+                    return _workspace_form(error=error_msg)
             
             # Порты (optional)
             port_mappings = {}
@@ -242,16 +304,26 @@ def create_workspace_page():
                     if request.content_type and 'application/json' in request.content_type:
                         return jsonify({'status': 'error', 'error': error_msg}), 400
                     else:
-                        return render_template('create_workspace.html', 
-                                             error=error_msg,
-                                             available_images=get_available_images())
+                        return _workspace_form(error=error_msg)
             
-            logger.info(f"Создание workspace: {workspace_name}, образ: {base_image}")
-            container_id = create_workspace(
-                workspace_name=workspace_name,
-                base_image=base_image if base_image else None,
-                port_mappings=port_mappings if port_mappings else None
-            )
+            template = data.get('template', '').strip()
+            if template:
+                # Шаблон задаёт образ и настройку; из тёплого пула — за секунды
+                logger.info(f"Создание workspace: {workspace_name}, шаблон: {template}")
+                container_id = create_workspace_from_template(
+                    template,
+                    workspace_name,
+                    port_mappings=port_mappings if port_mappings else None,
+                    node=data.get('node') or None,
+                )
+            else:
+                logger.info(f"Создание workspace: {workspace_name}, образ: {base_image}")
+                container_id = create_workspace(
+                    workspace_name=workspace_name,
+                    base_image=base_image if base_image else None,
+                    port_mappings=port_mappings if port_mappings else None,
+                    node=data.get('node') or None,
+                )
             logger.info(f"Workspace создан успешно, container_id: {container_id}")
             
             if request.content_type and 'application/json' in request.content_type:
@@ -265,11 +337,9 @@ def create_workspace_page():
             if request.content_type and 'application/json' in request.content_type:
                 return jsonify({'status': 'error', 'error': str(e)}), 400
             else:
-                return render_template('create_workspace.html', 
-                                     error=str(e),
-                                     available_images=get_available_images())
+                return _workspace_form(error=str(e))
     
-    return render_template('create_workspace.html', available_images=get_available_images())
+    return _workspace_form()
 
 
 @app.route('/bots/<name>/<action>', methods=['POST'])
@@ -360,8 +430,7 @@ def bot_commands_config(name):
     container_status = 'unknown'
     
     try:
-        from docker_api import get_client
-        container = get_client().containers.get(name)
+        container = client_for(name).containers.get(name)
         container_status = container.status
     except Exception:
         pass
@@ -377,8 +446,7 @@ def bot_commands_config(name):
 def reset_bot_commands(name):
     """Сбросить команды бота к стандартным значениям"""
     try:
-        commands = BotCommands.get_or_create(name)
-        commands.update_commands(start_cmd=None, stop_cmd=None, restart_cmd=None, launch_cmd=None)
+        reset_commands_profile(name)
         flash(f'Команды для "{name}" сброшены к стандартным значениям!', 'success')
         return redirect(url_for('bot_commands_config', name=name))
     except Exception as e:
@@ -386,6 +454,22 @@ def reset_bot_commands(name):
         return redirect(url_for('bot_commands_config', name=name))
 
 
+@app.route('/api/bot-commands/import', methods=['POST'])
+@login_required
+def api_import_bot_commands():
+    """Импорт профилей команд для многих контейнеров: {"имя": {"start_command": "...", ...}}"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not all(isinstance(v, dict) for v in data.values()):
+        return jsonify({'status': 'error', 'error': 'Ожидается объект {контейнер: {поле: команда}}'}), 400
+    try:
+        saved = upsert_bot_commands_many(data)
+        return jsonify({'status': 'ok', 'saved': sorted(saved)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
 @app.route('/bots')
 @login_required
 def bots_management():
@@ -398,18 +482,23 @@ def bots_management():
 def api_bots_list():
     """API для получения списка всех ботов"""
     try:
-        # Получаем все контейнеры
-        containers = get_client().containers.list(all=True)
+        # Контейнеры всех узлов (списки запрашиваются параллельно)
+        from nodes import get_node_registry
+        registry = get_node_registry()
+        containers, node_errors = registry.list_containers(all=True)
+        if node_errors and not containers:
+            raise RuntimeError('; '.join(node_errors.values()))
         
         all_containers = []
-        for c in containers:
+        running = []
+        for node, c in containers:
             # Определяем тип контейнера по labels
             labels = c.attrs.get('Config', {}).get('Labels', {})
             is_workspace = labels.get('workspace') == '1'
             is_bot_manager = labels.get('bot-manager') == '1'
             
-            # Пропускаем контейнеры, не созданные нашим менеджером
-            if not is_bot_manager:
+            # Пропускаем контейнеры, не созданные нашим менеджером, и заготовки тёплого пула
+            if not is_bot_manager or is_pool_member(c.name):
                 continue
             
             # Определяем тип
@@ -428,37 +517,57 @@ def api_bots_list():
                 'image': c.image.tags[0] if c.image.tags else c.image.short_id,
                 'created': c.attrs.get('Created'),
                 'type': container_type,
-                'has_workspace': has_workspace_files if is_workspace else False
+                'has_workspace': has_workspace_files if is_workspace else False,
+                'node': node.name,
             }
-            
-            # Добавляем статистику ресурсов если контейнер запущен
             if c.status == 'running':
-                try:
-                    stats = c.stats(stream=False)
-                    if stats:
-                        cpu_stats = stats.get('cpu_stats', {})
-                        precpu_stats = stats.get('precpu_stats', {})
-                        memory_stats = stats.get('memory_stats', {})
-                        
-                        if cpu_stats and precpu_stats:
-                            cpu_delta = cpu_stats.get('cpu_usage', {}).get('total_usage', 0) - precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
-                            system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
-                            if system_delta > 0:
-                                container_info['cpu_percent'] = round((cpu_delta / system_delta) * 100, 2)
-                        
-                        if memory_stats:
-                            container_info['memory_usage'] = memory_stats.get('usage', 0)
-                            container_info['memory_limit'] = memory_stats.get('limit', 0)
-                            if container_info['memory_limit'] > 0:
-                                container_info['memory_percent'] = round((container_info['memory_usage'] / container_info['memory_limit']) * 100, 2)
-                except:
-                    pass
+                running.append((c, container_info))
+            
+            if cfg.SUPERVISOR_ENABLED:
+                supervised = get_supervisor().describe(c.name)
+                container_info['supervisor'] = {k: supervised[k] for k in ('state', 'restart_count', 'crash_loop')}
             
             all_containers.append(container_info)
         
+        # Статистика ресурсов запущенных контейнеров: запросы stats идут параллельно
+        stats_list = registry.map(lambda c: c.stats(stream=False), [c for c, _ in running])
+        for (c, container_info), stats in zip(running, stats_list):
+            if not stats or isinstance(stats, Exception):
+                continue
+            try:
+                cpu_stats = stats.get('cpu_stats', {})
+                precpu_stats = stats.get('precpu_stats', {})
+                memory_stats = stats.get('memory_stats', {})
+            
+                if cpu_stats and precpu_stats:
+                    cpu_delta = cpu_stats.get('cpu_usage', {}).get('total_usage', 0) - precpu_stats.get('cpu_usage', {}).get('total_usage', 0)
+                    system_delta = cpu_stats.get('system_cpu_usage', 0) - precpu_stats.get('system_cpu_usage', 0)
+                    if system_delta > 0:
+                        container_info['cpu_percent'] = round((cpu_delta / system_delta) * 100, 2)
+            
+                if memory_stats:
+                    container_info['memory_usage'] = memory_stats.get('usage', 0)
+                    container_info['memory_limit'] = memory_stats.get('limit', 0)
+                    if container_info['memory_limit'] > 0:
+                        container_info['memory_percent'] = round((container_info['memory_usage'] / container_info['memory_limit']) * 100, 2)
+            except Exception:
+                pass
+        
+        # Профили команд для всех контейнеров одним запросом
+        try:
+            profiles = load_bot_commands(c['name'] for c in all_containers)
+            for container_info in all_containers:
+                commands = profiles.get(container_info['name'])
+                container_info['has_custom_commands'] = bool(commands and (
+                    commands.launch_command or commands.start_command
+                    or commands.stop_command or commands.restart_command))
+        except Exception as e:
+            logger.warning(f'Не удалось загрузить профили команд: {e}')
+        
         return jsonify({
             'status': 'ok',
-            'containers': all_containers
+            'containers': all_containers,
+            'node_errors': node_errors,
         })
     except Exception as e:
         return jsonify({
@@ -470,13 +579,82 @@ def api_bots_list():
 @app.route('/api/bot/<name>/logs')
 @login_required
 def api_bot_logs(name):
-    """API для получения логов бота"""
+    """API для получения логов бота (tail, since/until, курсор after, бюджет max_bytes; from/to — из архива)"""
+    try:
+        from log_stream import read_logs, parse_time_param
+        try:
+            if 'from' in request.args or 'to' in request.args:
+                # Диапазон времени читаем из локального архива — работает и для удалённых контейнеров
+                from log_archive import get_log_archive
+                start = parse_time_param(request.args.get('from'))
+                end = parse_time_param(request.args.get('to'))
+                result = get_log_archive().read(
+                    name,
+                    from_ns=int(start * 1_000_000_000) if start is not None else None,
+                    to_ns=int(end * 1_000_000_000) if end is not None else None,
+                    limit=request.args.get('limit', type=int),
+                    max_bytes=request.args.get('max_bytes', type=int),
+                )
+                return jsonify({
+                    'status': 'ok',
+                    'source': 'archive',
+                    'logs': '\n'.join(result['lines']),
+                    'lines': result['lines'],
+                    'truncated': result['truncated']
+                })
+            result = read_logs(
+                name,
+                tail=request.args.get('tail', 100, type=int),
+                since=parse_time_param(request.args.get('since')),
+                until=parse_time_param(request.args.get('until')),
+                after=request.args.get('after'),
+                max_bytes=request.args.get('max_bytes', type=int),
+            )
+        except ValueError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 400
+        return jsonify({
+            'status': 'ok',
+            'logs': '\n'.join(result['lines']),
+            'lines': result['lines'],
+            'cursor': result['cursor'],
+            'truncated': result['truncated']
+        })
+    except Exception as e:
+        return jsonify({
+            'status': 'error',
+            'error': str(e)
+        }), 500
+
+
+@app.route('/api/logs/search')
+@login_required
+def api_logs_search():
+    """Полнотекстовый поиск по логам всех ботов (q, from/to, container, limit)"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'status': 'error', 'error': 'Пустой запрос'}), 400
     try:
-        tail = request.args.get('tail', 100, type=int)
-        logs = get_bot_logs(name, tail=tail)
+        from log_stream import parse_time_param
+        from log_search import get_log_search_index
+        try:
+            start = parse_time_param(request.args.get('from'))
+            end = parse_time_param(request.args.get('to'))
+        except ValueError as e:
+            return jsonify({'status': 'error', 'error': str(e)}), 400
+
+        import time
+        started = time.perf_counter()
+        matches = get_log_search_index().search(
+            query,
+            from_ns=int(start * 1_000_000_000) if start is not None else None,
+            to_ns=int(end * 1_000_000_000) if end is not None else None,
+            containers=request.args.getlist('container') or None,
+            limit=request.args.get('limit', 100, type=int),
+        )
         return jsonify({
             'status': 'ok',
-            'logs': logs
+            'matches': matches,
+            'took_ms': round((time.perf_counter() - started) * 1000, 2)
         })
     except Exception as e:
         return jsonify({
@@ -513,9 +691,13 @@ def api_bot_exec(name):
         if not command:
             return jsonify({'status': 'error', 'error': 'Команда не задана'}), 400
         
-        # Выполняем команду через exec_backend
-        from exec_backend import get_backend
-        backend = get_backend()
+        # Усыплённый по простою workspace сначала будится (через tpool, хаб не блокируется)
+        from terminal_manager import _wake
+        resumed = _wake(name)
+
+        # Выполняем команду через exec_backend (docker CLI — на узле контейнера)
+        from nodes import get_node_registry
+        backend = get_node_registry().locate(name).exec_backend()
         
         # Используем docker exec для выполнения команды внутри контейнера
         full_command = f"docker exec {name} {command}"
@@ -525,7 +707,8 @@ def api_bot_exec(name):
             'status': 'ok',
             'exit_code': exit_code,
             'output': stdout,
-            'error': stderr
+            'error': stderr,
+            'resumed': resumed,
         })
     except Exception as e:
         return jsonify({
@@ -534,6 +717,167 @@ def api_bot_exec(name):
         }), 500
 
 
+@app.route('/api/supervisor')
+@login_required
+def api_supervisor():
+    """Состояние супервизора: поток событий и статистика перезапусков по контейнерам"""
+    return jsonify({'status': 'ok', **get_supervisor().status()})
+
+
+@app.route('/api/hibernation')
+@login_required
+def api_hibernation():
+    """Усыпление workspace по простою: настройки, последняя активность и время пробуждения"""
+    try:
+        return jsonify({'status': 'ok', **get_hibernator().status()})
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/warm-pool')
+@login_required
+def api_warm_pool():
+    """Тёплый пул workspace: готовые и готовящиеся заготовки по шаблонам, выдачи и время создания"""
+    try:
+        return jsonify({'status': 'ok', **get_warm_pool().status()})
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/images')
+@login_required
+def api_images():
+    """Каталог образов по узлам (из кэша) и состояние фоновой загрузки образов заранее"""
+    try:
+        return jsonify({'status': 'ok', 'catalog': get_image_catalog().status(),
+                        'prepull': get_image_prepuller().status()})
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/template-images', methods=['GET', 'POST'])
+@login_required
+def api_template_images():
+    """
+    Образы шаблонов workspace: теги по хешу шаблона, узлы со сборкой и сэкономленное время.
+    POST {"template": "...", "node": "..."} — собрать (пересобрать) образ сейчас, не дожидаясь создания workspace
+    """
+    try:
+        from template_images import get_template_images
+        images = get_template_images()
+        if request.method == 'POST':
+            from nodes import get_node_registry
+            data = request.get_json(silent=True) or request.form
+            template_key = (data.get('template') or '').strip()
+            templates = get_workspace_templates()
+            if template_key not in templates:
+                return jsonify({'status': 'error', 'error': f'Неизвестный шаблон: {template_key}'}), 400
+            node = get_node_registry().get(data.get('node') or None)
+            images.build(node, template_key, templates[template_key])
+        return jsonify({'status': 'ok', **images.report()})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/bot/<name>/restart-policy', methods=['GET', 'POST'])
+@login_required
+def api_bot_restart_policy(name):
+    """Политика перезапуска контейнера: policy (no/on-failure/always), max_restarts, backoff_max, restart_on_unhealthy"""
+    if request.method == 'GET':
+        return jsonify({'status': 'ok', 'supervisor': get_supervisor().describe(name)})
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'status': 'error', 'error': 'Ожидается JSON-объект'}), 400
+    try:
+        return jsonify({'status': 'ok', 'supervisor': get_supervisor().set_policy(name, data)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/bot/<name>/redeploy', methods=['GET'])
+@login_required
+def api_bot_redeploy_status(name):
+    """Идёт ли редеплой и последние редеплои с результатом и длительностями фаз (опрос страницы ботов)"""
+    import redeploy
+    try:
+        return jsonify({'status': 'ok', **redeploy.redeploy_status(name)})
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/bot/<name>/redeploy', methods=['POST'])
+@login_required
+def api_bot_redeploy(name):
+    """
+    Начать пересборку и перезапуск бота без простоя в фоне (branch — необязательно,
+    по умолчанию текущая ветка), ответ 202; ход и итог — GET того же адреса
+    """
+    import redeploy
+    data = request.get_json(silent=True) or {}
+    try:
+        started = redeploy.start_redeploy(name, branch=(data.get('branch') or '').strip() or None)
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+    return jsonify({'status': 'ok', 'in_progress': True, 'redeploy': started}), 202
+
+
+@app.route('/resources')
+@login_required
+def resources_page():
+    from nodes import get_node_registry
+    return render_template('resources.html', kinds=resources.KINDS,
+                           nodes=[node.name for node in get_node_registry().nodes()])
+
+
+@app.route('/api/resources')
+@login_required
+def api_resources():
+    """Упаковка на узле (?node=, по умолчанию основной): выделенные лимиты против ёмкости хоста"""
+    try:
+        return jsonify({'status': 'ok', **resources.packing(request.args.get('node') or None)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/bot/<name>/resources', methods=['GET', 'POST'])
+@login_required
+def api_bot_resources(name):
+    """
+    Профиль ресурсов контейнера (или профиля по умолчанию '@bot' / '@workspace'):
+    mem_limit ('512m'), cpus ('1.5'), cpuset_cpus ('0-3'), pids_limit, blkio_weight.
+    Пустое значение — наследовать, 0 — без ограничения; apply=false — только сохранить.
+    """
+    try:
+        if request.method == 'GET':
+            return jsonify({'status': 'ok', **resources.describe(name)})
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict):
+            return jsonify({'status': 'error', 'error': 'Ожидается JSON-объект'}), 400
+        apply = data.pop('apply', True) not in (False, 0, '0', 'false')
+        return jsonify({'status': 'ok', **resources.set_profile(name, data, apply=apply)})
+    except ValueError as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'status': 'error', 'error': str(e)}), 500
+
+
+@app.route('/api/nodes')
+@login_required
+def api_nodes():
+    """Docker-узлы: доступность, ёмкость и выделенное запущенным контейнерам"""
+    from nodes import get_node_registry
+    registry = get_node_registry()
+    return jsonify({'status': 'ok', 'multi': registry.multi, 'nodes': registry.status()})
+
+
 # Frontend override upload
 @app.route('/upload/frontend', methods=['GET', 'POST'])
 def upload_frontend():
@@ -562,13 +906,15 @@ def overridden_static(filename):
 # SocketIO events
 @socketio.on('connect')
 def on_connect():
-    pass
+    metrics.SOCKET_CONNECTIONS.inc()
+    # Пользователь определяется один раз на соединение, а не на каждое сообщение
+    bind_socket(request.sid, session.get('user_id'))
 
 
 @socketio.on('terminal_start')
 def on_terminal_start(data):
     # Проверяем авторизацию для WebSocket
-    if 'user_id' not in session:
+    if socket_user(request.sid) is None:
         emit('terminal_output', {'data': 'Ошибка: требуется авторизация\n'})
         return
         
@@ -582,7 +928,7 @@ def on_terminal_start(data):
 @socketio.on('server_console_start')
 def on_server_console_start():
     # Проверяем авторизацию для WebSocket
-    if 'user_id' not in session:
+    if socket_user(request.sid) is None:
         emit('server_console_output', {'data': 'Ошибка: требуется авторизация\n'})
         return
 
@@ -593,7 +939,7 @@ def on_server_console_start():
 @socketio.on('terminal_input')
 def on_terminal_input(data):
     # Проверяем авторизацию для WebSocket
-    if 'user_id' not in session:
+    if socket_user(request.sid) is None:
         emit('terminal_output', {'data': 'Ошибка: требуется авторизация\n'})
         return
         
@@ -611,7 +957,7 @@ def on_terminal_input(data):
 @socketio.on('server_console_input')
 def on_server_console_input(data):
     # Проверяем авторизацию для WebSocket
-    if 'user_id' not in session:
+    if socket_user(request.sid) is None:
         emit('server_console_output', {'data': 'Ошибка: требуется авторизация\n'})
         return
 
@@ -626,37 +972,80 @@ def on_server_console_input(data):
     handle_server_console_input(request.sid, command)
 
 
+@socketio.on('logs_follow')
+def on_logs_follow(data):
+    # Проверяем авторизацию для WebSocket
+    if socket_user(request.sid) is None:
+        emit('logs_error', {'error': 'Требуется авторизация'})
+        return
+
+    data = data if isinstance(data, dict) else {}
+    container = data.get('container')
+    if not container:
+        emit('logs_error', {'error': 'Не указан контейнер'})
+        return
+
+    from log_stream import start_follow
+    sid = request.sid
+
+    def send(event, payload):
+        metrics.record_emit(event, payload)
+        socketio.emit(event, payload, to=sid)
+    try:
+        start_follow(sid, container, data.get('after'), send)
+    except ValueError as e:
+        emit('logs_error', {'container': container, 'error': str(e)})
+
+
+@socketio.on('logs_unfollow')
+def on_logs_unfollow(data=None):
+    from log_stream import stop_follow
+    stop_follow(request.sid)
+
+
 @socketio.on('disconnect')
 def on_disconnect():
+    metrics.SOCKET_CONNECTIONS.dec()
+    unbind_socket(request.sid)
     close_session(request.sid)
     close_server_console_session(request.sid)
+    try:
+        from log_stream import stop_follow
+        stop_follow(request.sid)
+    except Exception:
+        pass
 
 
 @app.route('/health')
 def health():
-    status = {
-        'status': 'ok' if startup_success else 'warning',
-        'startup_success': startup_success,
-        'timestamp': os.path.getmtime(__file__) if os.path.exists(__file__) else None
+    """Liveness: процесс жив и обслуживает запросы; внешние зависимости не трогаются"""
+    return jsonify({'status': 'ok', 'uptime': round(time.time() - _process_started_at, 1)}), 200
+
+
+@app.route('/metrics', endpoint='metrics')
+def metrics_endpoint():
+    """Метрики менеджера в формате Prometheus (сессия или Bearer-токен METRICS_TOKEN)"""
+    token = cfg.METRICS_TOKEN
+    authorized = bool(token) and request.headers.get('Authorization', '') == f'Bearer {token}'
+    if not authorized and current_user() is None:
+        return jsonify({'status': 'error', 'error': 'Требуется авторизация'}), 401
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@app.route('/ready')
+def ready():
+    """Readiness: результаты фоновых проверок базы и Docker плюс состояние инициализации"""
+    checks = get_health_checker().snapshot()
+    startup_status = startup_tasks.status()
+    # Docker учитывается проверкой docker (если она в HEALTH_REQUIRED), а не шагом сети
+    is_ready = checks['ready'] and all(startup_tasks.is_ready(n) for n in ('database', 'admin'))
+    body = {
+        'status': 'ok' if is_ready else 'unavailable',
+        'ready': is_ready,
+        'checks': checks,
+        'startup': startup_status,
     }
-    
-    # Проверяем основные компоненты
-    try:
-        from docker_api import list_bots
-        list_bots()
-        status['docker'] = 'ok'
-    except Exception as e:
-        status['docker'] = f'error: {str(e)}'
-    
-    try:
-        from auth import SessionLocal
-        db = SessionLocal()
-        db.close()
-        status['database'] = 'ok'
-    except Exception as e:
-        status['database'] = f'error: {str(e)}'
-    
-    return jsonify(status), 200
+    return jsonify(body), 200 if is_ready else 503
 
 
 # Обработчики ошибок
@@ -689,8 +1078,9 @@ if __name__ == '__main__':
         print(f'Ошибка создания папок: {e}')
     
     logger.info('Starting Bot Manager on 0.0.0.0:5000')
-    if not startup_success:
-        logger.warning('Приложение запускается с ошибками инициализации')
+    # Ничего не делают, если уже запущены при импорте
+    startup_tasks.start()
+    get_health_checker().start()
     
     try:
         socketio.run(app, host='0.0.0.0', port=5000, debug=False)
@@ -1,17 +1,147 @@
 import os
 import re
+import json
+import time
+import random
 import logging
+import threading
 import bcrypt
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from functools import wraps
-from flask import Blueprint, request, session, redirect, url_for, render_template, flash
-from sqlalchemy import Column, Integer, String, create_engine, select, Text
+from typing import Dict, Iterable, List, Optional
+from flask import Blueprint, request, session, redirect, url_for, render_template, flash, g
+from sqlalchemy import Boolean, Column, Float, Integer, String, create_engine, select, Text, event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import declarative_base, sessionmaker, scoped_session
 from config import cfg
+import profiler
+from profiler import profiled
 
-engine = create_engine(cfg.SQLALCHEMY_DATABASE_URI, echo=False, future=True)
+try:
+    from eventlet import tpool  # type: ignore
+    import greenlet  # type: ignore
+except ImportError:  # без eventlet хеширование уходит в обычный пул
+    tpool = None
+    greenlet = None
+
+engine = create_engine(
+    cfg.SQLALCHEMY_DATABASE_URI,
+    echo=False,
+    future=True,
+    # Соединения используются из разных потоков (фоновые задачи, SocketIO)
+    connect_args={'check_same_thread': False, 'timeout': cfg.DB_BUSY_TIMEOUT},
+    pool_size=cfg.DB_POOL_SIZE,
+    max_overflow=cfg.DB_MAX_OVERFLOW,
+    pool_timeout=cfg.DB_POOL_TIMEOUT,
+)
 Base = declarative_base()
 SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
 
+
+@event.listens_for(engine, 'connect')
+def _configure_sqlite(dbapi_conn, connection_record):
+    """WAL: читатели не блокируют писателя; synchronous=NORMAL достаточно надёжен в режиме WAL"""
+    cursor = dbapi_conn.cursor()
+    cursor.execute(f'PRAGMA journal_mode={cfg.DB_JOURNAL_MODE}')
+    cursor.execute(f'PRAGMA synchronous={cfg.DB_SYNCHRONOUS}')
+    cursor.execute(f'PRAGMA busy_timeout={int(cfg.DB_BUSY_TIMEOUT * 1000)}')
+    cursor.close()
+
+
+profiler.instrument_engine(engine)
+
+
+def _is_busy_error(error: OperationalError) -> bool:
+    message = str(error.orig).lower()
+    return 'database is locked' in message or 'database is busy' in message
+
+
+def retry_on_busy(func):
+    """Повторить операцию с экспоненциальной задержкой, если SQLite занят другим писателем"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        delay = cfg.DB_BUSY_BACKOFF
+        for attempt in range(cfg.DB_BUSY_RETRIES + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if attempt >= cfg.DB_BUSY_RETRIES or not _is_busy_error(e):
+                    raise
+                logging.getLogger(__name__).warning(
+                    f'SQLite занят ({func.__name__}), повтор {attempt + 1}/{cfg.DB_BUSY_RETRIES}')
+                time.sleep(delay * (1 + random.random()))
+                delay *= 2
+    return wrapper
+
+# --- Хеширование паролей вне цикла событий ---------------------------------
+# bcrypt с BCRYPT_ROUNDS=12 занимает ~250 мс CPU; выполненный прямо в greenlet'е
+# eventlet он останавливает все терминалы и SocketIO-потоки на это время.
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+
+
+def _bcrypt_hash(password: bytes, rounds: int) -> str:
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds=rounds)).decode()
+
+
+def _bcrypt_check(password: bytes, password_hash: bytes) -> bool:
+    return bcrypt.checkpw(password, password_hash)
+
+
+def _in_green_thread() -> bool:
+    # Greenthread'ы eventlet запускаются хабом: у текущего greenlet'а есть родитель
+    return tpool is not None and greenlet.getcurrent().parent is not None
+
+
+def _get_hash_executor():
+    global _hash_executor
+    with _hash_executor_lock:
+        if _hash_executor is None:
+            if cfg.BCRYPT_EXECUTOR == 'process':
+                _hash_executor = ProcessPoolExecutor(max_workers=cfg.BCRYPT_WORKERS)
+            else:
+                _hash_executor = ThreadPoolExecutor(max_workers=cfg.BCRYPT_WORKERS,
+                                                    thread_name_prefix='bcrypt')
+        return _hash_executor
+
+
+@profiled('auth', 'bcrypt')
+def _run_hashing(func, *args):
+    """
+    Выполнить bcrypt в пуле: 'auto' — tpool eventlet внутри greenthread'а,
+    иначе пул потоков; 'thread'/'process' — соответствующий пул; 'inline' — на месте.
+    Из greenthread'а результат пула ждётся через tpool, чтобы не блокировать хаб.
+    """
+    mode = cfg.BCRYPT_EXECUTOR
+    if mode == 'inline':
+        return func(*args)
+    green = _in_green_thread()
+    if mode == 'auto' and green:
+        return tpool.execute(func, *args)
+    future = _get_hash_executor().submit(func, *args)
+    if green:
+        return tpool.execute(future.result)
+    return future.result()
+
+
+def hash_password(password: str) -> str:
+    return _run_hashing(_bcrypt_hash, password.encode(), cfg.BCRYPT_ROUNDS)
+
+
+def check_password(password: str, password_hash: str) -> bool:
+    return _run_hashing(_bcrypt_check, password.encode(), password_hash.encode())
+
+
+def hash_rounds(password_hash: str) -> Optional[int]:
+    """Стоимость bcrypt-хеша ('$2b$12$...' -> 12)"""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError, AttributeError):
+        return None
+
+
 class BotCommands(Base):
     __tablename__ = 'bot_commands'
     id = Column(Integer, primary_key=True)
@@ -22,6 +152,7 @@ class BotCommands(Base):
     launch_command = Column(Text, nullable=True)
     
     @staticmethod
+    @retry_on_busy
     def get_or_create(container_name: str):
         """Получить или создать команды для контейнера"""
         db = SessionLocal()
@@ -33,10 +164,12 @@ class BotCommands(Base):
                 db.add(commands)
                 db.commit()
                 db.refresh(commands)
+            _cache_commands(container_name, commands)
             return commands
         finally:
             db.close()
     
+    @retry_on_busy
     def update_commands(self, start_cmd=None, stop_cmd=None, restart_cmd=None, launch_cmd=None):
         """Обновить команды"""
         db = SessionLocal()
@@ -51,9 +184,87 @@ class BotCommands(Base):
                 self.launch_command = launch_cmd
             db.merge(self)
             db.commit()
+            _cache_commands(self.container_name, self)
         finally:
             db.close()
 
+class RestartPolicy(Base):
+    """Политика перезапуска контейнера супервизором и накопленная статистика перезапусков"""
+    __tablename__ = 'restart_policies'
+    id = Column(Integer, primary_key=True)
+    container_name = Column(String(255), unique=True, nullable=False)
+    # None — значение по умолчанию из конфигурации (SUPERVISOR_*)
+    policy = Column(String(16), nullable=True)
+    max_restarts = Column(Integer, nullable=True)
+    backoff_max = Column(Integer, nullable=True)
+    restart_on_unhealthy = Column(Boolean, nullable=True)
+    restart_count = Column(Integer, nullable=False, default=0)
+    downtime_seconds = Column(Float, nullable=False, default=0.0)
+    last_exit_code = Column(Integer, nullable=True)
+    last_restart_at = Column(Float, nullable=True)
+    crash_loop = Column(Boolean, nullable=False, default=False)
+
+
+class StopRequest(Base):
+    """Последняя намеренная остановка контейнера через менеджер (из любого воркера)"""
+    __tablename__ = 'stop_requests'
+    id = Column(Integer, primary_key=True)
+    container_name = Column(String(255), unique=True, nullable=False)
+    requested_at = Column(Float, nullable=False)
+
+
+class RedeployRecord(Base):
+    """Запись о редеплое бота: result 'running' — идёт, иначе итог; data — запись целиком (JSON)"""
+    __tablename__ = 'redeploys'
+    id = Column(Integer, primary_key=True)
+    container_name = Column(String(255), nullable=False, index=True)
+    result = Column(String(16), nullable=False)
+    data = Column(Text, nullable=False)
+
+
+class ResourceProfile(Base):
+    """
+    Ограничения ресурсов контейнера. Строки '@bot' и '@workspace' — профили
+    по умолчанию для своего типа; None в поле — взять значение уровнем выше.
+    """
+    __tablename__ = 'resource_profiles'
+    id = Column(Integer, primary_key=True)
+    container_name = Column(String(255), unique=True, nullable=False)
+    mem_limit = Column(Integer, nullable=True)  # байты
+    nano_cpus = Column(Integer, nullable=True)  # 1e9 = одно ядро
+    cpuset_cpus = Column(String(64), nullable=True)  # '0-3,6'
+    pids_limit = Column(Integer, nullable=True)
+    blkio_weight = Column(Integer, nullable=True)  # 10..1000
+
+
+class WorkspaceActivity(Base):
+    """Последняя активность workspace (терминал, exec) и усыпление по простою"""
+    __tablename__ = 'workspace_activity'
+    id = Column(Integer, primary_key=True)
+    container_name = Column(String(255), unique=True, nullable=False)
+    last_activity_at = Column(Float, nullable=True)
+    # Не None — контейнер усыплён менеджером и будет разбужен при обращении
+    hibernated_at = Column(Float, nullable=True)
+    mode = Column(String(8), nullable=True)  # 'stop' | 'pause'
+    hibernate_count = Column(Integer, nullable=False, default=0)
+    resume_count = Column(Integer, nullable=False, default=0)
+    last_resume_ms = Column(Integer, nullable=True)
+
+
+class TemplateImage(Base):
+    """Образ шаблона workspace с выполненной настройкой и экономия времени от его использования"""
+    __tablename__ = 'template_images'
+    id = Column(Integer, primary_key=True)
+    template_key = Column(String(64), unique=True, nullable=False)
+    image_hash = Column(String(64), nullable=False)  # хеш определения шаблона
+    image_tag = Column(String(255), nullable=False)
+    build_seconds = Column(Float, nullable=False, default=0.0)  # последняя сборка
+    built_at = Column(Float, nullable=True)
+    build_count = Column(Integer, nullable=False, default=0)
+    use_count = Column(Integer, nullable=False, default=0)
+    saved_seconds = Column(Float, nullable=False, default=0.0)
+
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True)
@@ -62,10 +273,14 @@ class User(Base):
 
     @staticmethod
     def create(username: str, password: str):
+        # bcrypt — один раз: повтор при занятой базе касается только записи
+        return User._insert(username, hash_password(password))
+
+    @staticmethod
+    @retry_on_busy
+    def _insert(username: str, password_hash: str):
         db = SessionLocal()
         try:
-            salt = bcrypt.gensalt(rounds=cfg.BCRYPT_ROUNDS)
-            password_hash = bcrypt.hashpw(password.encode(), salt).decode()
             user = User(username=username, password_hash=password_hash)
             db.add(user)
             db.commit()
@@ -74,20 +289,28 @@ class User(Base):
             db.close()
 
     def verify(self, password: str) -> bool:
-        return bcrypt.checkpw(password.encode(), self.password_hash.encode())
+        return check_password(password, self.password_hash)
+
+    def needs_rehash(self) -> bool:
+        """Хеш создан с другим BCRYPT_ROUNDS, чем задан сейчас"""
+        return hash_rounds(self.password_hash) != cfg.BCRYPT_ROUNDS
     
     def change_password(self, new_password: str):
         """Изменить пароль пользователя"""
+        self._store_password_hash(hash_password(new_password))
+        invalidate_principal(self.id)
+
+    @retry_on_busy
+    def _store_password_hash(self, new_hash: str):
         db = SessionLocal()
         try:
-            salt = bcrypt.gensalt(rounds=cfg.BCRYPT_ROUNDS)
-            new_hash = bcrypt.hashpw(new_password.encode(), salt).decode()
             self.password_hash = new_hash
             db.merge(self)
             db.commit()
         finally:
             db.close()
     
+    @retry_on_busy
     def change_username(self, new_username: str):
         """Изменить имя пользователя"""
         db = SessionLocal()
@@ -102,12 +325,14 @@ class User(Base):
             db.commit()
         finally:
             db.close()
+        invalidate_principal(self.id)
 
 
 def init_db():
     Base.metadata.create_all(bind=engine)
 
 
+@retry_on_busy
 def get_user_by_username(username: str):
     db = SessionLocal()
     try:
@@ -118,6 +343,7 @@ def get_user_by_username(username: str):
         db.close()
 
 
+@retry_on_busy
 def get_user_by_id(user_id: int):
     db = SessionLocal()
     try:
@@ -127,6 +353,60 @@ def get_user_by_id(user_id: int):
     finally:
         db.close()
 
+
+# Кэш аутентифицированных пользователей: user_id -> User (отсоединённый объект).
+# HTTP-запрос получает пользователя один раз (flask.g), сокет — при подключении;
+# смена пароля или имени сбрасывает запись, и следующий доступ перечитывает строку.
+_principals: Dict[int, User] = {}
+_socket_principals: Dict[str, int] = {}
+_principals_lock = threading.Lock()
+
+
+def get_principal(user_id: int) -> Optional[User]:
+    """Пользователь по id из кэша; при промахе — из базы"""
+    user = _principals.get(user_id)
+    if user is not None:
+        return user
+    user = get_user_by_id(user_id)
+    if user is not None:
+        with _principals_lock:
+            _principals[user_id] = user
+    return user
+
+
+def invalidate_principal(user_id: int):
+    with _principals_lock:
+        _principals.pop(user_id, None)
+
+
+def current_user() -> Optional[User]:
+    """Пользователь текущего HTTP-запроса (разрешается один раз за запрос)"""
+    if '_principal' not in g:
+        user_id = session.get('user_id')
+        g._principal = get_principal(user_id) if user_id else None
+    return g._principal
+
+
+def bind_socket(sid: str, user_id: Optional[int]):
+    """Запомнить пользователя сокета при подключении"""
+    if user_id and get_principal(user_id) is not None:
+        with _principals_lock:
+            _socket_principals[sid] = user_id
+
+
+def unbind_socket(sid: str):
+    with _principals_lock:
+        _socket_principals.pop(sid, None)
+
+
+def socket_user(sid: str) -> Optional[User]:
+    """Пользователь сокета без обращения к сессии и базе на каждое сообщение"""
+    user_id = _socket_principals.get(sid)
+    if user_id is None:
+        return None
+    return _principals.get(user_id) or get_principal(user_id)
+
+
 # Blueprint
 bp_auth = Blueprint('auth', __name__)
 logger = logging.getLogger(__name__)
@@ -135,7 +415,7 @@ logger = logging.getLogger(__name__)
 def login_required(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
-        if not session.get('user_id'):
+        if current_user() is None:
             return redirect(url_for('auth.login'))
         return f(*args, **kwargs)
     return wrapper
@@ -148,6 +428,12 @@ def login():
         password = request.form.get('password', '')
         user = get_user_by_username(username)
         if user and user.verify(password):
+            if user.needs_rehash():
+                # Прозрачно переводим хеш на текущий BCRYPT_ROUNDS
+                try:
+                    user.change_password(password)
+                except Exception as e:
+                    logger.warning(f'Не удалось обновить хеш пароля {user.username}: {e}')
             session['user_id'] = user.id
             session['username'] = user.username
             return redirect(url_for('dashboard'))
@@ -158,57 +444,54 @@ def login():
 @bp_auth.route('/logout')
 def logout():
     session.clear()
+    g.pop('_principal', None)
     return redirect(url_for('auth.login'))
 
 
 @bp_auth.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    user_id = session.get('user_id')
-    db = SessionLocal()
-    try:
-        user = db.execute(select(User).where(User.id == user_id)).scalar_one_or_none()
-        if not user:
-            flash('Пользователь не найден', 'danger')
-            return redirect(url_for('auth.logout'))
-        
-        if request.method == 'POST':
-            action = request.form.get('action')
-            
-            if action == 'change_password':
-                current_password = request.form.get('current_password', '')
-                new_password = request.form.get('new_password', '')
-                confirm_password = request.form.get('confirm_password', '')
-                
-                if not user.verify(current_password):
-                    flash('Неверный текущий пароль', 'danger')
-                elif len(new_password) < 4:
-                    flash('Пароль должен содержать минимум 4 символа', 'danger')
-                elif new_password != confirm_password:
-                    flash('Пароли не совпадают', 'danger')
-                else:
-                    user.change_password(new_password)
-                    flash('Пароль успешно изменён', 'success')
-            
-            elif action == 'change_username':
-                new_username = request.form.get('new_username', '').strip()
-                
-                if len(new_username) < 3:
-                    flash('Имя пользователя должно содержать минимум 3 символа', 'danger')
-                else:
-                    try:
-                        user.change_username(new_username)
-                        session['username'] = new_username
-                        flash('Имя пользователя успешно изменено', 'success')
-                    except ValueError as e:
-                        flash(str(e), 'danger')
-        
-        # Обновляем объект user после возможных изменений
-        db.refresh(user)
-        return render_template('profile.html', user=user)
-    
-    finally:
-        db.close()
+    user = current_user()
+    if not user:
+        flash('Пользователь не найден', 'danger')
+        return redirect(url_for('auth.logout'))
+
+    if request.method == 'POST':
+        action = request.form.get('action')
+
+        if action == 'change_password':
+            current_password = request.form.get('current_password', '')
+            new_password = request.form.get('new_password', '')
+            confirm_password = request.form.get('confirm_password', '')
+
+            if not user.verify(current_password):
+                flash('Неверный текущий пароль', 'danger')
+            elif len(new_password) < 4:
+                flash('Пароль должен содержать минимум 4 символа', 'danger')
+            elif new_password != confirm_password:
+                flash('Пароли не совпадают', 'danger')
+            else:
+                user.change_password(new_password)
+                flash('Пароль успешно изменён', 'success')
+
+        elif action == 'change_username':
+            new_username = request.form.get('new_username', '').strip()
+
+            if len(new_username) < 3:
+                flash('Имя пользователя должно содержать минимум 3 символа', 'danger')
+            else:
+                try:
+                    user.change_username(new_username)
+                    session['username'] = new_username
+                    flash('Имя пользователя успешно изменено', 'success')
+                except ValueError as e:
+                    flash(str(e), 'danger')
+
+        # Изменения сбросили кэш — перечитываем пользователя
+        g.pop('_principal', None)
+        user = current_user() or user
+
+    return render_template('profile.html', user=user)
 
 
 # Utility to ensure an admin user exists (called from install script or startup)
@@ -219,8 +502,50 @@ def ensure_admin():
         User.create(admin_user, admin_pass)
 
 
+# Кэш профилей команд: container_name -> (BotCommands или None, время загрузки).
+# Изменения через BotCommands.update_commands/get_or_create записываются в кэш сразу,
+# TTL страхует от правок из других процессов.
+_commands_cache: Dict[str, tuple] = {}
+_commands_cache_lock = threading.Lock()
+
+
+def _cache_commands(container_name: str, commands):
+    with _commands_cache_lock:
+        _commands_cache[container_name] = (commands, time.monotonic())
+
+
+def _cached_commands(container_name: str):
+    """Вернуть (найдено, значение) из кэша профилей команд"""
+    entry = _commands_cache.get(container_name)
+    if entry is None:
+        return False, None
+    commands, loaded_at = entry
+    if time.monotonic() - loaded_at > cfg.COMMANDS_CACHE_TTL:
+        return False, None
+    return True, commands
+
+
+def invalidate_bot_commands(container_name: Optional[str] = None):
+    """Сбросить кэш профиля команд (или весь кэш)"""
+    with _commands_cache_lock:
+        if container_name is None:
+            _commands_cache.clear()
+        else:
+            _commands_cache.pop(container_name, None)
+
+
 def get_bot_commands(container_name: str):
     """Получить команды для контейнера"""
+    found, commands = _cached_commands(container_name)
+    if found:
+        return commands
+    commands = _select_bot_commands(container_name)
+    _cache_commands(container_name, commands)
+    return commands
+
+
+@retry_on_busy
+def _select_bot_commands(container_name: str):
     db = SessionLocal()
     try:
         stmt = select(BotCommands).where(BotCommands.container_name == container_name)
@@ -229,8 +554,412 @@ def get_bot_commands(container_name: str):
         db.close()
 
 
-def save_bot_commands(container_name: str, start_cmd: str = None, stop_cmd: str = None, restart_cmd: str = None, launch_cmd: str = None):
-    """Сохранить команды для контейнера"""
-    commands = BotCommands.get_or_create(container_name)
-    commands.update_commands(start_cmd, stop_cmd, restart_cmd, launch_cmd)
+@retry_on_busy
+def _select_bot_commands_many(container_names: List[str]) -> Dict[str, 'BotCommands']:
+    db = SessionLocal()
+    try:
+        loaded = {}
+        # SQLite ограничивает число параметров запроса
+        for i in range(0, len(container_names), 500):
+            chunk = container_names[i:i + 500]
+            stmt = select(BotCommands).where(BotCommands.container_name.in_(chunk))
+            for commands in db.execute(stmt).scalars():
+                loaded[commands.container_name] = commands
+        return loaded
+    finally:
+        db.close()
+
+
+def load_bot_commands(container_names: Iterable[str]) -> Dict[str, Optional['BotCommands']]:
+    """Получить команды для многих контейнеров: отсутствующие в кэше загружаются одним запросом"""
+    names = list(dict.fromkeys(container_names))
+    result = {}
+    missing = []
+    for name in names:
+        found, commands = _cached_commands(name)
+        if found:
+            result[name] = commands
+        else:
+            missing.append(name)
+
+    if missing:
+        loaded = _select_bot_commands_many(missing)
+        for name in missing:
+            commands = loaded.get(name)
+            _cache_commands(name, commands)
+            result[name] = commands
+    return result
+
+
+BOT_COMMAND_FIELDS = ('start_command', 'stop_command', 'restart_command', 'launch_command')
+
+
+def _upsert_statement(fields, model=None):
+    """INSERT ... ON CONFLICT(container_name) DO UPDATE только для переданных полей"""
+    model = model or BotCommands
+    stmt = sqlite_insert(model)
+    # Пустой набор полей: «пустое» обновление, чтобы RETURNING вернул существующую строку
+    update_fields = fields or ('container_name',)
+    return stmt.on_conflict_do_update(
+        index_elements=[model.container_name],
+        set_={field: stmt.excluded[field] for field in update_fields},
+    ).returning(model)
+
+
+def _check_command_fields(values: Dict[str, Optional[str]]):
+    unknown = set(values) - set(BOT_COMMAND_FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля команд: {", ".join(sorted(unknown))}')
+
+
+@retry_on_busy
+def upsert_bot_commands(container_name: str, values: Dict[str, Optional[str]]):
+    """
+    Атомарно создать или обновить профиль команд одним запросом.
+
+    Записываются только переданные поля; значение None очищает команду.
+    """
+    _check_command_fields(values)
+    fields = tuple(sorted(values))
+    db = SessionLocal()
+    try:
+        stmt = _upsert_statement(fields).values(container_name=container_name, **values)
+        commands = db.scalars(stmt, execution_options={'populate_existing': True}).one()
+        db.expunge(commands)  # отвязываем до commit, чтобы атрибуты не были сброшены
+        db.commit()
+    finally:
+        db.close()
+    _cache_commands(container_name, commands)
     return commands
+
+
+@retry_on_busy
+def upsert_bot_commands_many(profiles: Dict[str, Dict[str, Optional[str]]]):
+    """
+    Импортировать профили команд для многих контейнеров в одной транзакции.
+
+    ``profiles``: container_name -> {поле: значение}. Профили группируются по
+    набору полей, каждая группа записывается многострочным upsert.
+    """
+    groups: Dict[tuple, list] = {}
+    for container_name, values in profiles.items():
+        _check_command_fields(values)
+        fields = tuple(sorted(values))
+        groups.setdefault(fields, []).append(dict(values, container_name=container_name))
+
+    saved = {}
+    db = SessionLocal()
+    try:
+        for fields, rows in groups.items():
+            # SQLite ограничивает число параметров запроса
+            for i in range(0, len(rows), 500):
+                stmt = _upsert_statement(fields).values(rows[i:i + 500])
+                for commands in db.scalars(stmt, execution_options={'populate_existing': True}):
+                    saved[commands.container_name] = commands
+        for commands in saved.values():
+            db.expunge(commands)
+        db.commit()
+    finally:
+        db.close()
+    for container_name, commands in saved.items():
+        _cache_commands(container_name, commands)
+    return saved
+
+
+def save_bot_commands(container_name: str, start_cmd: str = None, stop_cmd: str = None, restart_cmd: str = None, launch_cmd: str = None):
+    """Сохранить команды для контейнера (None — оставить команду без изменений)"""
+    values = {
+        'start_command': start_cmd,
+        'stop_command': stop_cmd,
+        'restart_command': restart_cmd,
+        'launch_command': launch_cmd,
+    }
+    return upsert_bot_commands(container_name, {k: v for k, v in values.items() if v is not None})
+
+
+def reset_bot_commands(container_name: str):
+    """Очистить все кастомные команды контейнера"""
+    return upsert_bot_commands(container_name, {field: None for field in BOT_COMMAND_FIELDS})
+
+
+RESTART_POLICY_FIELDS = ('policy', 'max_restarts', 'backoff_max', 'restart_on_unhealthy')
+RESTART_STATS_FIELDS = ('restart_count', 'downtime_seconds', 'last_exit_code', 'last_restart_at', 'crash_loop')
+
+
+@retry_on_busy
+def load_restart_policies() -> Dict[str, RestartPolicy]:
+    """Все политики перезапуска: container_name -> RestartPolicy (отсоединённые объекты)"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(RestartPolicy)).scalars().all()
+        for row in rows:
+            db.expunge(row)
+        return {row.container_name: row for row in rows}
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def upsert_restart_policy(container_name: str, values: Dict[str, object]) -> RestartPolicy:
+    """Создать или обновить политику и/или статистику перезапусков (только переданные поля)"""
+    unknown = set(values) - set(RESTART_POLICY_FIELDS) - set(RESTART_STATS_FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля политики: {", ".join(sorted(unknown))}')
+    fields = tuple(sorted(values))
+    db = SessionLocal()
+    try:
+        stmt = _upsert_statement(fields, RestartPolicy).values(container_name=container_name, **values)
+        row = db.scalars(stmt, execution_options={'populate_existing': True}).one()
+        db.expunge(row)
+        db.commit()
+    finally:
+        db.close()
+    return row
+
+
+@retry_on_busy
+def record_stop_request(container_name: str, requested_at: float):
+    db = SessionLocal()
+    try:
+        stmt = _upsert_statement(('requested_at',), StopRequest).values(
+            container_name=container_name, requested_at=requested_at)
+        db.execute(stmt)
+        db.commit()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def get_stop_request(container_name: str) -> Optional[float]:
+    """Время последней намеренной остановки контейнера или None"""
+    db = SessionLocal()
+    try:
+        stmt = select(StopRequest.requested_at).where(StopRequest.container_name == container_name)
+        return db.execute(stmt).scalar_one_or_none()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def add_redeploy_record(container_name: str, data: Dict) -> int:
+    """
+    Записать начатый редеплой. Вызывающий держит блокировку редеплоя бота,
+    поэтому оставшиеся 'running' — от прерванного процесса: они закрываются как 'failed'.
+    """
+    db = SessionLocal()
+    try:
+        stale = db.execute(select(RedeployRecord).where(
+            RedeployRecord.container_name == container_name, RedeployRecord.result == 'running')).scalars()
+        for row in stale:
+            record = json.loads(row.data)
+            record.update(result='failed', error='прерван: процесс менеджера остановлен')
+            row.result = 'failed'
+            row.data = json.dumps(record)
+        row = RedeployRecord(container_name=container_name, result='running', data=json.dumps(data))
+        db.add(row)
+        db.commit()
+        return row.id
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def finish_redeploy_record(record_id: int, data: Dict, keep: int):
+    """Сохранить итог редеплоя и оставить у бота только keep последних записей"""
+    db = SessionLocal()
+    try:
+        row = db.get(RedeployRecord, record_id)
+        if row is None:
+            return
+        row.result = data['result']
+        row.data = json.dumps(data)
+        older = select(RedeployRecord.id).where(RedeployRecord.container_name == row.container_name) \
+            .order_by(RedeployRecord.id.desc()).offset(keep)
+        db.query(RedeployRecord).filter(RedeployRecord.id.in_(older)).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def load_redeploy_records(container_name: str, limit: int) -> List[Dict]:
+    """Последние редеплои бота, новые первыми (включая идущий, result='running')"""
+    db = SessionLocal()
+    try:
+        stmt = select(RedeployRecord.data).where(RedeployRecord.container_name == container_name) \
+            .order_by(RedeployRecord.id.desc()).limit(limit)
+        return [json.loads(data) for data in db.execute(stmt).scalars()]
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def delete_restart_policy(container_name: str):
+    db = SessionLocal()
+    try:
+        db.query(RestartPolicy).filter(RestartPolicy.container_name == container_name).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+RESOURCE_FIELDS = ('mem_limit', 'nano_cpus', 'cpuset_cpus', 'pids_limit', 'blkio_weight')
+
+
+@retry_on_busy
+def load_resource_profiles(container_names: Optional[Iterable[str]] = None) -> Dict[str, ResourceProfile]:
+    """Профили ресурсов (все или для указанных имён): container_name -> ResourceProfile"""
+    db = SessionLocal()
+    try:
+        stmt = select(ResourceProfile)
+        if container_names is not None:
+            stmt = stmt.where(ResourceProfile.container_name.in_(list(container_names)))
+        rows = db.execute(stmt).scalars().all()
+        for row in rows:
+            db.expunge(row)
+        return {row.container_name: row for row in rows}
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def upsert_resource_profile(container_name: str, values: Dict[str, object]) -> ResourceProfile:
+    """Создать или обновить профиль ресурсов (только переданные поля; None — наследовать)"""
+    unknown = set(values) - set(RESOURCE_FIELDS)
+    if unknown:
+        raise ValueError(f'Неизвестные поля профиля: {", ".join(sorted(unknown))}')
+    fields = tuple(sorted(values))
+    db = SessionLocal()
+    try:
+        stmt = _upsert_statement(fields, ResourceProfile).values(container_name=container_name, **values)
+        row = db.scalars(stmt, execution_options={'populate_existing': True}).one()
+        db.expunge(row)
+        db.commit()
+    finally:
+        db.close()
+    return row
+
+
+@retry_on_busy
+def load_workspace_activity(container_names: Optional[Iterable[str]] = None) -> Dict[str, WorkspaceActivity]:
+    """Активность и усыпление workspace (все или для указанных имён): container_name -> WorkspaceActivity"""
+    db = SessionLocal()
+    try:
+        stmt = select(WorkspaceActivity)
+        if container_names is not None:
+            stmt = stmt.where(WorkspaceActivity.container_name.in_(list(container_names)))
+        rows = db.execute(stmt).scalars().all()
+        for row in rows:
+            db.expunge(row)
+        return {row.container_name: row for row in rows}
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def touch_workspace_activity(container_name: str, at: float):
+    """Отметить активность (более раннее время не перезаписывает более позднее)"""
+    db = SessionLocal()
+    try:
+        stmt = sqlite_insert(WorkspaceActivity).values(container_name=container_name, last_activity_at=at)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[WorkspaceActivity.container_name],
+            set_={'last_activity_at': stmt.excluded.last_activity_at},
+            where=(WorkspaceActivity.last_activity_at.is_(None)) | (WorkspaceActivity.last_activity_at < at),
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def mark_workspace_hibernated(container_name: str, mode: str, at: float):
+    db = SessionLocal()
+    try:
+        stmt = sqlite_insert(WorkspaceActivity).values(container_name=container_name, hibernated_at=at, mode=mode,
+                                                       hibernate_count=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[WorkspaceActivity.container_name],
+            set_={'hibernated_at': at, 'mode': mode,
+                  'hibernate_count': WorkspaceActivity.hibernate_count + 1},
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def mark_workspace_awake(container_name: str, resume_ms: Optional[int] = None) -> bool:
+    """
+    Снять отметку усыпления; с resume_ms — учесть пробуждение менеджером (даже
+    если отметку уже снял обработчик события start). False — нечего обновлять.
+    """
+    db = SessionLocal()
+    try:
+        query = db.query(WorkspaceActivity).filter(WorkspaceActivity.container_name == container_name)
+        values = {'hibernated_at': None}
+        if resume_ms is not None:
+            values.update(last_resume_ms=resume_ms, resume_count=WorkspaceActivity.resume_count + 1,
+                          last_activity_at=time.time())
+        else:
+            query = query.filter(WorkspaceActivity.hibernated_at.is_not(None))
+        updated = query.update(values, synchronize_session=False)
+        db.commit()
+        return updated > 0
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def delete_workspace_activity(container_name: str):
+    db = SessionLocal()
+    try:
+        db.query(WorkspaceActivity).filter(WorkspaceActivity.container_name == container_name).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def load_template_images() -> Dict[str, TemplateImage]:
+    """Собранные образы шаблонов: template_key -> TemplateImage"""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(TemplateImage)).scalars().all()
+        for row in rows:
+            db.expunge(row)
+        return {row.template_key: row for row in rows}
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def record_template_build(template_key: str, image_hash: str, image_tag: str, build_seconds: float):
+    db = SessionLocal()
+    try:
+        now = time.time()
+        stmt = sqlite_insert(TemplateImage).values(template_key=template_key, image_hash=image_hash,
+                                                   image_tag=image_tag, build_seconds=build_seconds,
+                                                   built_at=now, build_count=1)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[TemplateImage.template_key],
+            set_={'image_hash': image_hash, 'image_tag': image_tag, 'build_seconds': build_seconds,
+                  'built_at': now, 'build_count': TemplateImage.build_count + 1},
+        ))
+        db.commit()
+    finally:
+        db.close()
+
+
+@retry_on_busy
+def record_template_use(template_key: str, saved_seconds: float):
+    """Workspace создан из готового образа шаблона: +1 использование и сэкономленное время"""
+    db = SessionLocal()
+    try:
+        db.query(TemplateImage).filter(TemplateImage.template_key == template_key).update(
+            {'use_count': TemplateImage.use_count + 1,
+             'saved_seconds': TemplateImage.saved_seconds + saved_seconds},
+            synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк горячих путей менеджера против поддельного Docker (benchmarks/fake_docker.py).
+
+Для каждого размера (по умолчанию 10/100/1000 контейнеров) в отдельном процессе
+поднимается fake daemon на unix-сокете, приложение импортируется с DOCKER_HOST на
+него и FakeExecBackend вместо настоящего exec. Замеряются:
+
+  list_bots            — docker_api.list_bots() напрямую
+  GET /api/bots        — список с stats запущенных контейнеров
+  GET / (cold)         — дашборд со сброшенным кэшем фрагмента
+  GET / (cached)       — дашборд при неизменной версии состояния
+  POST stop / start    — действия над контейнером (start_bot содержит ожидание 3 с)
+  terminal roundtrip   — terminal_input -> terminal_command_result через Socket.IO
+  terminal burst       — пачка команд без ожидания, команд в секунду
+
+Работает без сети и без Docker:
+
+    python benchmarks/bench_hot_paths.py --sizes 10,100,1000 --stats-latency 0.005
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def summarize(samples, wall=None):
+    total = wall if wall is not None else sum(samples)
+    return {
+        'n': len(samples),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        'ops_per_sec': round(len(samples) / total, 1) if total else 0.0,
+    }
+
+
+def timed(func, iterations):
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return summarize(samples)
+
+
+def wait_for(client, event, count=1, timeout=30.0):
+    """
+    Дождаться ``count`` событий ``event`` в тестовом клиенте Socket.IO.
+    Команды выполняются в greenthread'ах, поэтому ждём через eventlet.sleep.
+    """
+    import eventlet
+    seen = 0
+    deadline = time.time() + timeout
+    while seen < count:
+        for message in client.get_received():
+            if message['name'] == event:
+                seen += 1
+        if seen < count:
+            if time.time() > deadline:
+                raise TimeoutError(f'{event}: получено {seen} из {count}')
+            eventlet.sleep(0.0005)
+
+
+def run_worker(args):
+    """Выполняется в дочернем процессе: окружение уже указывает на временные пути"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    from fake_docker import FakeDockerDaemon, FakeDockerState, FakeExecBackend
+
+    state = FakeDockerState(args.containers, stats_latency=args.stats_latency)
+    daemon = FakeDockerDaemon(os.path.join(os.getcwd(), 'docker.sock'), state).start()
+    os.environ['DOCKER_HOST'] = daemon.docker_host
+
+    import app as app_module
+    import exec_backend
+
+    exec_backend._backend_singleton = FakeExecBackend(state, latency=args.exec_latency)
+    app_module.startup_tasks.start()
+    while not app_module.startup_tasks.is_settled('admin'):
+        time.sleep(0.01)
+
+    flask_app = app_module.app
+    client = flask_app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin'})
+
+    iterations = max(3, min(args.iterations, int(args.iterations * 100 / max(args.containers, 1))))
+    results = {}
+
+    from docker_api import list_bots
+    results['list_bots'] = timed(list_bots, iterations)
+
+    def api_bots():
+        response = client.get('/api/bots')
+        assert response.status_code == 200, response.data[:200]
+    results['GET /api/bots'] = timed(api_bots, iterations)
+
+    def dashboard_cold():
+        app_module.dashboard_cache.invalidate()
+        assert client.get('/').status_code == 200
+    results['GET / (cold)'] = timed(dashboard_cold, iterations)
+    results['GET / (cached)'] = timed(lambda: client.get('/'), iterations * 5)
+
+    running = [c['Name'] for c in state.containers.values() if c['Running'] and 'workspace' not in c['Labels']]
+    targets = running[:args.actions]
+
+    def action(kind):
+        name = targets.pop(0) if kind == 'stop' else stopped.pop(0)
+        response = client.post(f'/bots/{name}/{kind}')
+        assert response.get_json()['status'] == 'ok', response.data[:200]
+        (stopped if kind == 'stop' else targets).append(name)
+
+    stopped = []
+    results['POST /bots/<name>/stop'] = timed(lambda: action('stop'), len(targets))
+    results['POST /bots/<name>/start'] = timed(lambda: action('start'), min(len(stopped), 3))
+
+    sio = app_module.socketio.test_client(flask_app, flask_test_client=client)
+    sio.emit('terminal_start', {'container': running[0]})
+    sio.get_received()
+
+    def roundtrip():
+        sio.emit('terminal_input', {'data': 'echo hi'})
+        wait_for(sio, 'terminal_command_result')
+    results['terminal roundtrip'] = timed(roundtrip, args.commands)
+
+    started = time.perf_counter()
+    for _ in range(args.commands):
+        sio.emit('terminal_input', {'data': 'echo burst'})
+    wait_for(sio, 'terminal_command_result', args.commands)
+    wall = time.perf_counter() - started
+    results['terminal burst'] = {'n': args.commands, 'p50_ms': '-', 'p99_ms': '-',
+                                 'ops_per_sec': round(args.commands / wall, 1)}
+
+    results['_docker_requests'] = state.requests
+    sio.disconnect()
+    daemon.stop()
+    print(json.dumps(results))
+
+
+def run_size(containers: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.makedirs(os.path.join(tmp, 'logs'))
+        env = dict(os.environ)
+        env.update({
+            'DB_PATH': os.path.join(tmp, 'app.db'),
+            'BCRYPT_ROUNDS': '4',
+            'STARTUP_AUTORUN': '0',
+            'LOG_ARCHIVE_ENABLED': '0',
+            'DISK_USAGE_INOTIFY': '0',
+            'RATELIMIT_STORAGE_URI': 'memory://',
+            'RATELIMIT_DEFAULT': '1000000 per hour',
+        })
+        cmd = [sys.executable, os.path.abspath(__file__), '--worker',
+               '--containers', str(containers), '--iterations', str(args.iterations),
+               '--stats-latency', str(args.stats_latency), '--exec-latency', str(args.exec_latency),
+               '--actions', str(args.actions), '--commands', str(args.commands)]
+        proc = subprocess.run(cmd, env=env, capture_output=True, text=True, cwd=tmp)
+        if proc.returncode != 0:
+            raise RuntimeError(f'{containers}: {proc.stderr.strip()[-2000:]}')
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк горячих путей против fake Docker')
+    parser.add_argument('--sizes', default='10,100,1000', help='числа контейнеров через запятую')
+    parser.add_argument('--iterations', type=int, default=50, help='итераций на 100 контейнеров (меньше для больших)')
+    parser.add_argument('--stats-latency', type=float, default=0.0, help='задержка stats в fake daemon, секунды')
+    parser.add_argument('--exec-latency', type=float, default=0.0, help='задержка команды FakeExecBackend, секунды')
+    parser.add_argument('--actions', type=int, default=5, help='сколько раз выполнить stop/start')
+    parser.add_argument('--commands', type=int, default=100, help='команд терминала')
+    parser.add_argument('--containers', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args)
+        return 0
+
+    print(f"stats latency: {args.stats_latency}s, exec latency: {args.exec_latency}s")
+    print(f"{'контейнеров':>11} {'сценарий':<26} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'ops/s':>9}")
+    for size in [int(s) for s in args.sizes.split(',') if s]:
+        res = run_size(size, args)
+        docker_requests = res.pop('_docker_requests')
+        for name, r in res.items():
+            print(f"{size:>11} {name:<26} {r['n']:>5} {r['p50_ms']:>9} {r['p99_ms']:>9} {r['ops_per_sec']:>9}")
+        print(f"{size:>11} {'запросов к Docker API':<26} {docker_requests:>5}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
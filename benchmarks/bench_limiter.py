@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Накладные расходы Flask-Limiter на запрос для разных хранилищ и проверка
+общих счётчиков между процессами.
+
+1. Минимальное Flask-приложение с одним маршрутом обслуживает N запросов через
+   test client: без лимитера, с memory:// и с sqlite:// (rate_limit_storage).
+   Отдельно замеряется эндпоинт, освобождённый через request_filter.
+2. Несколько процессов одновременно расходуют лимит "100 per minute" в общей
+   базе SQLite — суммарно должно пройти ровно 100 запросов.
+
+    python benchmarks/bench_limiter.py --requests 5000 --procs 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import rate_limit_storage  # noqa: E402,F401  регистрирует sqlite://
+
+
+def build_app(storage_uri):
+    from flask import Flask, request
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+
+    app = Flask(__name__)
+
+    @app.route('/ping')
+    def ping():
+        return 'ok'
+
+    @app.route('/poll')
+    def poll():
+        return 'ok'
+
+    if storage_uri:
+        limiter = Limiter(key_func=get_remote_address, default_limits=['1000000 per hour'],
+                          storage_uri=storage_uri, strategy='sliding-window-counter')
+        limiter.init_app(app)
+
+        @limiter.request_filter
+        def exempt():
+            return request.endpoint == 'poll'
+    return app
+
+
+def measure(app, path, requests):
+    client = app.test_client()
+    for _ in range(50):
+        client.get(path)
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        client.get(path)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1e6, sorted(samples)[int(len(samples) * 0.99)] * 1e6
+
+
+def consume(args):
+    uri, attempts, start_at = args
+    from limits import parse
+    from limits.storage import storage_from_string
+    from limits.strategies import SlidingWindowCounterRateLimiter
+
+    limiter = SlidingWindowCounterRateLimiter(storage_from_string(uri))
+    item = parse('100 per minute')
+    while time.time() < start_at:
+        time.sleep(0.001)
+    return sum(1 for _ in range(attempts) if limiter.hit(item, 'bench', 'shared'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк накладных расходов лимитера')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--procs', type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sqlite_uri = 'sqlite://' + os.path.join(tmp, 'ratelimit.db')
+        print(f"Запросов: {args.requests}")
+        print(f"{'хранилище':<12} {'маршрут':<8} {'p50 мкс':>9} {'p99 мкс':>9} {'+p50 мкс':>9}")
+        base_p50 = None
+        for label, uri in (('нет', None), ('memory', 'memory://'), ('sqlite', sqlite_uri)):
+            app = build_app(uri)
+            paths = ['/ping'] if uri is None else ['/ping', '/poll']
+            for path in paths:
+                p50, p99 = measure(app, path, args.requests)
+                if base_p50 is None:
+                    base_p50 = p50
+                print(f"{label:<12} {path:<8} {p50:>9.1f} {p99:>9.1f} {p50 - base_p50:>9.1f}")
+
+        shared_uri = 'sqlite://' + os.path.join(tmp, 'shared.db')
+        rate_limit_storage.SQLiteStorage(shared_uri)  # создать схему до старта процессов
+        start_at = time.time() + 0.5
+        with multiprocessing.Pool(args.procs) as pool:
+            accepted = pool.map(consume, [(shared_uri, 100, start_at)] * args.procs)
+        total = sum(accepted)
+        print(f"\nОбщий лимит 100/мин, {args.procs} процессов по 100 попыток: "
+              f"пропущено {total} ({'ok' if total == 100 else 'ОШИБКА'}), по процессам {accepted}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк входа под нагрузкой: N одновременных логинов в greenthread'ах eventlet
+и «тикер», который просыпается каждые 10 мс и замеряет задержку цикла событий.
+
+Сравнивает хеширование прямо в greenthread'е (BCRYPT_EXECUTOR=inline) с выносом
+bcrypt в пул: auto — tpool eventlet, thread/process — пул потоков или процессов.
+Каждый режим запускается в отдельном процессе на временной базе. Логин
+повторяет путь /login: поиск пользователя и проверка пароля.
+
+    python benchmarks/bench_login.py --logins 20 --rounds 12
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ['inline', 'auto', 'thread', 'process']
+TICK = 0.01
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def run_worker(logins: int):
+    """Выполняется в дочернем процессе: DB_PATH и BCRYPT_* уже заданы"""
+    sys.path.insert(0, ROOT)
+    import eventlet
+    import auth
+
+    auth.init_db()
+    auth.User.create('bench', 'bench-password')
+
+    latencies = []
+    stalls = []
+    done = eventlet.event.Event()
+
+    def ticker():
+        last = time.perf_counter()
+        while not done.ready():
+            eventlet.sleep(TICK)
+            now = time.perf_counter()
+            stalls.append(now - last - TICK)
+            last = now
+
+    def login():
+        started = time.perf_counter()
+        user = auth.get_user_by_username('bench')
+        assert user and user.verify('bench-password')
+        latencies.append(time.perf_counter() - started)
+
+    tick = eventlet.spawn(ticker)
+    eventlet.sleep(TICK * 2)
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(logins)
+    for _ in range(logins):
+        pool.spawn(login)
+    pool.waitall()
+    total = time.perf_counter() - started
+    done.send(True)
+    tick.wait()
+
+    print(json.dumps({
+        'total_s': round(total, 3),
+        'login_p50_ms': round(percentile(latencies, 50) * 1000, 1),
+        'login_p99_ms': round(percentile(latencies, 99) * 1000, 1),
+        'stall_max_ms': round(max(stalls, default=0) * 1000, 1),
+        'stall_p99_ms': round(percentile(stalls, 99) * 1000, 1),
+    }))
+
+
+def run_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env['DB_PATH'] = os.path.join(tmp, 'bench.db')
+        env['BCRYPT_ROUNDS'] = str(args.rounds)
+        env['BCRYPT_EXECUTOR'] = mode
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', '--logins', str(args.logins)],
+            env=env, capture_output=True, text=True, cwd=tmp,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f'{mode}: {proc.stderr.strip()}')
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк логинов и задержки цикла событий')
+    parser.add_argument('--logins', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=12)
+    parser.add_argument('--mode', choices=['all'] + MODES, default='all')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.logins)
+        return 0
+
+    modes = MODES if args.mode == 'all' else [args.mode]
+    print(f"Логинов: {args.logins}, BCRYPT_ROUNDS: {args.rounds}")
+    print(f"{'режим':<8} {'всего s':>8} {'p50 ms':>8} {'p99 ms':>8} {'stall max':>10} {'stall p99':>10}")
+    for mode in modes:
+        r = run_mode(mode, args)
+        print(f"{mode:<8} {r['total_s']:>8} {r['login_p50_ms']:>8} {r['login_p99_ms']:>8} "
+              f"{r['stall_max_ms']:>10} {r['stall_p99_ms']:>10}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест базы данных: много клиентов одновременно читают пользователей
+и сохраняют профили команд через функции auth.py.
+
+Сравнивает настройки по умолчанию (WAL, synchronous=NORMAL, повторы при busy)
+с прежним поведением SQLite (journal_mode=DELETE, synchronous=FULL, без повторов).
+Каждый режим запускается в отдельном процессе на временной базе.
+
+    python benchmarks/bench_sqlite.py --clients 32 --duration 5 --write-ratio 0.2
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'tuned': {},
+    'legacy': {
+        'DB_JOURNAL_MODE': 'DELETE',
+        'DB_SYNCHRONOUS': 'FULL',
+        'DB_BUSY_RETRIES': '0',
+        'DB_POOL_SIZE': '5',
+        'DB_MAX_OVERFLOW': '10',
+    },
+}
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def run_worker(clients: int, duration: float, write_ratio: float):
+    """Выполняется в дочернем процессе: DB_PATH уже указывает на временную базу"""
+    sys.path.insert(0, ROOT)
+    from sqlalchemy.exc import OperationalError
+    import auth
+
+    auth.init_db()
+    auth.User.create('bench', 'bench')
+    user_id = auth.get_user_by_username('bench').id
+    names = [f'bench-bot-{i}' for i in range(50)]
+
+    stats = {'read': [], 'write': [], 'errors': 0, 'locked': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    start_barrier = threading.Barrier(clients)
+
+    def client(seed):
+        rnd = random.Random(seed)
+        reads, writes, errors, locked = [], [], 0, 0
+        start_barrier.wait()
+        while time.perf_counter() < deadline:
+            is_write = rnd.random() < write_ratio
+            started = time.perf_counter()
+            try:
+                if is_write:
+                    commands = auth.BotCommands.get_or_create(rnd.choice(names))
+                    commands.update_commands(start_cmd=f'echo {rnd.random()}')
+                else:
+                    auth.get_user_by_id(user_id)
+                elapsed = time.perf_counter() - started
+                (writes if is_write else reads).append(elapsed)
+            except OperationalError as e:
+                errors += 1
+                if 'locked' in str(e):
+                    locked += 1
+        with lock:
+            stats['read'].extend(reads)
+            stats['write'].extend(writes)
+            stats['errors'] += errors
+            stats['locked'] += locked
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    result = {'errors': stats['errors'], 'locked': stats['locked']}
+    for kind in ('read', 'write'):
+        values = stats[kind]
+        result[kind] = {
+            'ops': len(values),
+            'ops_per_sec': round(len(values) / duration, 1),
+            'p50_ms': round(percentile(values, 50) * 1000, 2),
+            'p99_ms': round(percentile(values, 99) * 1000, 2),
+            'mean_ms': round(statistics.mean(values) * 1000, 2) if values else 0.0,
+        }
+    print(json.dumps(result))
+
+
+def run_mode(mode: str, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ)
+        env.update(MODES[mode])
+        env['DB_PATH'] = os.path.join(tmp, 'bench.db')
+        env['BCRYPT_ROUNDS'] = '4'
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker',
+             '--clients', str(args.clients), '--duration', str(args.duration),
+             '--write-ratio', str(args.write_ratio)],
+            env=env, capture_output=True, text=True, cwd=tmp,
+        )
+        if proc.returncode != 0:
+            raise RuntimeError(f'{mode}: {proc.stderr.strip()}')
+        return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк конкурентного доступа к SQLite')
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--mode', choices=['all'] + list(MODES), default='all')
+    parser.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.clients, args.duration, args.write_ratio)
+        return 0
+
+    modes = list(MODES) if args.mode == 'all' else [args.mode]
+    print(f"Клиентов: {args.clients}, длительность: {args.duration}s, доля записей: {args.write_ratio}")
+    print(f"{'режим':<8} {'тип':<6} {'ops/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'ошибок':>7}")
+    for mode in modes:
+        res = run_mode(mode, args)
+        for kind in ('read', 'write'):
+            r = res[kind]
+            errors = res['errors'] if kind == 'write' else ''
+            print(f"{mode:<8} {kind:<6} {r['ops_per_sec']:>9} {r['p50_ms']:>8} {r['p99_ms']:>8} {errors:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,870 @@
+#!/usr/bin/env python3
+"""
+Поддельный Docker daemon для бенчмарков: HTTP API на unix-сокете с N контейнерами.
+
+Отвечает на запросы, которые делает менеджер через docker SDK: список и inspect
+контейнеров, inspect образов, создание, stats (с настраиваемой задержкой),
+start/stop/restart, update, удаление, логи, поток /events, /info, сети и ping; docker pull
+берёт образы из FakeRegistry (локальный реестр с задержкой загрузки). Состояние
+хранится в памяти; FakeExecBackend выполняет CLI-команды (`docker ps/start/stop/logs/exec ...`)
+над тем же состоянием, поэтому start_bot/stop_bot и терминал работают без настоящего Docker.
+Несколько демонов на разных сокетах изображают несколько Docker-узлов (DOCKER_NODES).
+
+    python benchmarks/fake_docker.py --socket /tmp/fake-docker.sock --containers 100
+    DOCKER_HOST=unix:///tmp/fake-docker.sock docker ps   # проверка любым клиентом
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shlex
+import socketserver
+import struct
+import tarfile
+import threading
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+API_VERSION = '1.45'
+_VERSION_PREFIX = re.compile(r'^/v[0-9.]+')
+_DOCKER_HOST_PREFIX = re.compile(r'^export DOCKER_HOST=(\S+); ')
+
+
+def _sha(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f000Z')
+
+
+class FakeRegistry:
+    """
+    Реестр для docker pull (общий для нескольких демонов): образ -> размер.
+    Загрузка длится pull_latency секунд; pulls — журнал, peak — наибольшее
+    число одновременных загрузок.
+    """
+
+    def __init__(self, images=(), pull_latency: float = 0.0):
+        self.images: Dict[str, int] = {self.normalize(ref): 100_000_000 for ref in images}
+        self.pull_latency = pull_latency
+        self.lock = threading.Lock()
+        self.pulls = []
+        self.active = 0
+        self.peak = 0
+
+    @staticmethod
+    def normalize(ref: str) -> str:
+        return ref if ':' in ref.rsplit('/', 1)[-1] else ref + ':latest'
+
+    def fetch(self, ref: str) -> Optional[int]:
+        ref = self.normalize(ref)
+        with self.lock:
+            if ref not in self.images:
+                return None
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            if self.pull_latency:
+                time.sleep(self.pull_latency)
+        finally:
+            with self.lock:
+                self.active -= 1
+                self.pulls.append(ref)
+        return self.images[ref]
+
+
+class FakeDockerState:
+    """Контейнеры и образы поддельного демона"""
+
+    def __init__(self, containers: int, running_ratio: float = 0.8, stats_latency: float = 0.0,
+                 workspace_ratio: float = 0.2, prefix: str = 'bench', host_cpus: int = 8,
+                 host_memory: int = 16 * 1024 ** 3):
+        self.stats_latency = stats_latency
+        self.lock = threading.Lock()
+        self.images: Dict[str, dict] = {}
+        self.containers: Dict[str, dict] = {}
+        self.by_name: Dict[str, str] = {}
+        self.networks: Dict[str, dict] = {}
+        self.requests = 0
+        self.build_latency = 0.0
+        self.registry: Optional[FakeRegistry] = None
+        # Сборки: тег, метки и Dockerfile из контекста; build_handler(dockerfile) -> текст ошибки или None
+        self.builds = []
+        self.build_handler = None
+        # exec через API (exec_run): exec_handler(контейнер, cmd) -> (код, вывод), по умолчанию (0, '')
+        self.execs: Dict[str, dict] = {}
+        self.exec_latency = 0.0
+        self.exec_handler = None
+        # Ёмкость хоста для /info
+        self.host_cpus = host_cpus
+        self.host_memory = host_memory
+        # Журнал событий для /events; crash() и set_health() имитируют падение и healthcheck
+        self.events = []
+        self.events_cond = threading.Condition()
+        now = time.time()
+        for tag in ('python:3.11-slim', 'node:20-slim', 'bot-base:latest'):
+            image_id = 'sha256:' + _sha(tag)
+            self.images[image_id] = {'Id': image_id, 'RepoTags': [tag], 'Created': _iso(now - 86400),
+                                     'Size': 150_000_000}
+        image_ids = list(self.images)
+        running_cut = int(containers * running_ratio)
+        workspace_cut = int(containers * workspace_ratio)
+        for i in range(containers):
+            name = f'{prefix}-ws-{i}' if i < workspace_cut else f'{prefix}-bot-{i}'
+            labels = {'bot-manager': '1'}
+            if i < workspace_cut:
+                labels['workspace'] = '1'
+            self.add_container(name, image_ids[i % len(image_ids)], labels,
+                               running=i < running_cut, created=now - 3600 - i)
+
+    def add_container(self, name: str, image_id: str, labels: dict, running: bool, created: float) -> dict:
+        cid = _sha(name)
+        if cid in self.containers:
+            # Имя освободилось и занято снова (rename, пересоздание) — новый Id
+            cid = _sha(f'{name}-{time.time_ns()}')
+        c = {
+            'Id': cid,
+            'Name': name,
+            'Image': image_id,
+            'Labels': labels,
+            'Created': created,
+            'Running': running,
+            'StartedAt': created + 1 if running else 0,
+            'ExitCode': 0,
+            'Logs': [f'{_iso(created + k)} line {k} of {name}' for k in range(50)],
+        }
+        self.containers[cid] = c
+        self.by_name[name] = cid
+        return c
+
+    def find(self, ref: str) -> Optional[dict]:
+        with self.lock:
+            cid = self.by_name.get(ref.lstrip('/'))
+            if cid:
+                return self.containers.get(cid)
+            if ref in self.containers:
+                return self.containers[ref]
+            for cid, c in self.containers.items():
+                if cid.startswith(ref):
+                    return c
+        return None
+
+    def publish(self, c: dict, action: str, **attributes):
+        now = time.time()
+        event = {
+            'Type': 'container', 'Action': action, 'status': action, 'id': c['Id'],
+            'Actor': {'ID': c['Id'], 'Attributes': dict(c['Labels'], name=c['Name'], image=c['Image'],
+                                                        **{k: str(v) for k, v in attributes.items()})},
+            'time': int(now), 'timeNano': int(now * 1e9),
+        }
+        with self.events_cond:
+            self.events.append(event)
+            self.events_cond.notify_all()
+
+    def set_running(self, ref: str, running: bool) -> bool:
+        c = self.find(ref)
+        if c is None:
+            return False
+        if running and not c['Running']:
+            c['Running'] = True
+            c['StartedAt'] = time.time()
+            self.publish(c, 'start')
+        elif not running and c['Running']:
+            c['Running'] = False
+            c['Paused'] = False
+            c['ExitCode'] = 143
+            self.publish(c, 'kill', signal=15)
+            self.publish(c, 'die', exitCode=143)
+            self.publish(c, 'stop')
+        return True
+
+    def append_log(self, ref: str, text: str) -> bool:
+        """Дописать строку в лог контейнера (её получат подписчики logs?follow=1)"""
+        c = self.find(ref)
+        if c is None:
+            return False
+        with self.lock:
+            c['Logs'].append(f'{_iso(time.time())} {text}')
+        return True
+
+    def set_paused(self, ref: str, paused: bool) -> bool:
+        c = self.find(ref)
+        if c is None or not c['Running'] or bool(c.get('Paused')) == paused:
+            return False
+        c['Paused'] = paused
+        self.publish(c, 'pause' if paused else 'unpause')
+        return True
+
+    def crash(self, ref: str, exit_code: int = 1) -> bool:
+        """Процесс контейнера завершился сам: только событие die"""
+        c = self.find(ref)
+        if c is None or not c['Running']:
+            return False
+        c['Running'] = False
+        c['ExitCode'] = exit_code
+        self.publish(c, 'die', exitCode=exit_code)
+        return True
+
+    def set_health(self, ref: str, status: str) -> bool:
+        c = self.find(ref)
+        if c is None:
+            return False
+        c['Health'] = status
+        self.publish(c, f'health_status: {status}')
+        return True
+
+    def run_exec(self, exec_id: str) -> Optional[dict]:
+        """Выполнить созданный exec: код и вывод от exec_handler, команда — в c['Execs']"""
+        record = self.execs.get(exec_id)
+        if record is None:
+            return None
+        c = self.containers[record['ContainerID']]
+        if self.exec_latency:
+            time.sleep(self.exec_latency)
+        exit_code, output = self.exec_handler(c, record['Cmd']) if self.exec_handler else (0, '')
+        with self.lock:
+            c.setdefault('Execs', []).append(record['Cmd'])
+            record.update(Running=False, ExitCode=exit_code)
+        return {'ExitCode': exit_code, 'Output': output}
+
+    def rename(self, c: dict, name: str) -> bool:
+        old = c['Name']
+        with self.lock:
+            if name in self.by_name:
+                return False
+            self.by_name.pop(old, None)
+            self.by_name[name] = c['Id']
+            c['Name'] = name
+        self.publish(c, 'rename', oldName='/' + old)
+        return True
+
+    def find_image(self, ref: str) -> Optional[dict]:
+        tagged = ref if ':' in ref.rsplit('/', 1)[-1] else ref + ':latest'
+        with self.lock:
+            for image in self.images.values():
+                if ref == image['Id'] or tagged in image['RepoTags'] or image['Id'].startswith('sha256:' + ref):
+                    return image
+        return None
+
+    def publish_image(self, action: str, image: dict, name: Optional[str] = None):
+        """
+        Событие образа как у dockerd: Actor.ID — id образа, в атрибутах метки образа
+        и name — ссылка для pull/tag, а для untag/delete — тот же id образа.
+        """
+        now = time.time()
+        attributes = dict((image.get('Config') or {}).get('Labels') or {}, name=name or image['Id'])
+        event = {'Type': 'image', 'Action': action, 'status': action, 'id': image['Id'],
+                 'Actor': {'ID': image['Id'], 'Attributes': attributes},
+                 'time': int(now), 'timeNano': int(now * 1e9)}
+        with self.events_cond:
+            self.events.append(event)
+            self.events_cond.notify_all()
+
+    def tag_image(self, image: dict, repo: str, tag: str):
+        """Тег переходит на образ (у прежнего владельца снимается)"""
+        name = f'{repo}:{tag}'
+        with self.lock:
+            for other in self.images.values():
+                if name in other['RepoTags']:
+                    other['RepoTags'].remove(name)
+            image['RepoTags'].append(name)
+        self.publish_image('tag', image, name)
+
+    def pull_image(self, repo: str, tag: str) -> Optional[dict]:
+        """docker pull из FakeRegistry; None — образа в реестре нет"""
+        ref = f'{repo}:{tag}'
+        size = self.registry.fetch(ref) if self.registry else None
+        if size is None:
+            return None
+        image_id = 'sha256:' + _sha(f'registry-{ref}')
+        with self.lock:
+            image = self.images.setdefault(image_id, {'Id': image_id, 'RepoTags': [], 'Created': _iso(time.time()),
+                                                      'Size': size})
+        if ref not in image['RepoTags']:
+            self.tag_image(image, repo, tag)
+        self.publish_image('pull', image, ref)
+        return image
+
+    def untag_image(self, image: dict, ref: str) -> list:
+        """docker rmi: снимается тег, образ без тегов удаляется"""
+        name = ref if ':' in ref.rsplit('/', 1)[-1] else ref + ':latest'
+        with self.lock:
+            if name in image['RepoTags']:
+                image['RepoTags'].remove(name)
+            result = [{'Untagged': name}]
+            if not image['RepoTags']:
+                self.images.pop(image['Id'], None)
+                result.append({'Deleted': image['Id']})
+        self.publish_image('untag', image)
+        if len(result) > 1:
+            self.publish_image('delete', image)
+        return result
+
+    def remove(self, ref: str) -> bool:
+        c = self.find(ref)
+        if c is None:
+            return False
+        with self.lock:
+            self.containers.pop(c['Id'], None)
+            self.by_name.pop(c['Name'], None)
+        self.publish(c, 'destroy')
+        return True
+
+    # --- Представления API --------------------------------------------------
+
+    @staticmethod
+    def state_name(c: dict) -> str:
+        if c['Running']:
+            return 'paused' if c.get('Paused') else 'running'
+        return 'exited'
+
+    @staticmethod
+    def status_text(c: dict) -> str:
+        if c.get('Paused'):
+            return 'Up {} minutes (Paused)'.format(max(1, int((time.time() - c['StartedAt']) // 60)))
+        if c['Running']:
+            return 'Up {} minutes'.format(max(1, int((time.time() - c['StartedAt']) // 60)))
+        return f"Exited ({c['ExitCode']}) 5 minutes ago"
+
+    def summary(self, c: dict) -> dict:
+        image = self.images.get(c['Image'], {})
+        return {
+            'Id': c['Id'],
+            'Names': ['/' + c['Name']],
+            'Image': (image.get('RepoTags') or [c['Image']])[0],
+            'ImageID': c['Image'],
+            'Command': 'python main.py',
+            'Created': int(c['Created']),
+            'State': self.state_name(c),
+            'Status': self.status_text(c),
+            'Labels': c['Labels'],
+            'Ports': [],
+        }
+
+    def inspect(self, c: dict) -> dict:
+        return {
+            'Id': c['Id'],
+            'Name': '/' + c['Name'],
+            'Created': _iso(c['Created']),
+            'Image': c['Image'],
+            'State': {
+                'Status': self.state_name(c),
+                'Running': c['Running'],
+                'Paused': bool(c.get('Paused')),
+                'ExitCode': c['ExitCode'],
+                'StartedAt': _iso(c['StartedAt']) if c['StartedAt'] else '0001-01-01T00:00:00Z',
+                **({'Health': {'Status': c['Health']}} if c.get('Health') else {}),
+            },
+            'Config': {
+                'Labels': c['Labels'],
+                'Image': (self.images.get(c['Image'], {}).get('RepoTags') or [c['Image']])[0],
+                'Cmd': ['python', 'main.py'],
+                'Env': ['PATH=/usr/local/bin:/usr/bin', 'PYTHONUNBUFFERED=1'],
+                'WorkingDir': '/app',
+                'Tty': False,
+            },
+            'HostConfig': {'RestartPolicy': {'Name': 'unless-stopped'}, 'NetworkMode': 'bots_net',
+                           'Memory': 0, 'NanoCpus': 0, 'CpusetCpus': '', 'PidsLimit': None, 'BlkioWeight': 0,
+                           **c.get('Resources', {})},
+            'NetworkSettings': {'Ports': {}},
+            'Mounts': c.get('Mounts', []),
+        }
+
+    @staticmethod
+    def stats() -> dict:
+        return {
+            'read': _iso(time.time()),
+            'cpu_stats': {'cpu_usage': {'total_usage': 2_000_000_000}, 'system_cpu_usage': 400_000_000_000,
+                          'online_cpus': 4},
+            'precpu_stats': {'cpu_usage': {'total_usage': 1_990_000_000}, 'system_cpu_usage': 399_000_000_000},
+            'memory_stats': {'usage': 64 * 1024 * 1024, 'limit': 2 * 1024 * 1024 * 1024},
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeDocker/1.0'
+
+    def log_message(self, *args):
+        pass
+
+    @property
+    def state(self) -> FakeDockerState:
+        return self.server.state
+
+    def _send(self, code: int, body=None, content_type: str = 'application/json', raw: bytes = None):
+        payload = raw if raw is not None else (b'' if body is None else json.dumps(body).encode())
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.send_header('Api-Version', API_VERSION)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _not_found(self, what: str):
+        self._send(404, {'message': f'No such {what}'})
+
+    def _route(self, method: str):
+        self.state.requests += 1
+        self.body = b''
+        if self.headers.get('Content-Length'):
+            self.body = self.rfile.read(int(self.headers['Content-Length']))
+        elif self.headers.get('Transfer-Encoding') == 'chunked':
+            self.body = self._read_chunked()
+        url = urlparse(self.path)
+        path = _VERSION_PREFIX.sub('', url.path)
+        query = parse_qs(url.query)
+        parts = [p for p in path.split('/') if p]
+
+        if path == '/_ping':
+            return self._send(200, raw=b'OK', content_type='text/plain')
+        if path == '/version':
+            return self._send(200, {'ApiVersion': API_VERSION, 'Version': '26.0.0-fake', 'MinAPIVersion': '1.24',
+                                    'Os': 'linux', 'Arch': 'amd64'})
+        if path == '/info':
+            return self._send(200, {'NCPU': self.state.host_cpus, 'MemTotal': self.state.host_memory,
+                                    'Containers': len(self.state.containers), 'ServerVersion': '26.0.0-fake'})
+        if path == '/containers/json':
+            return self._list_containers(query)
+        if path == '/containers/create' and method == 'POST':
+            return self._create_container(query)
+        if path == '/events':
+            return self._events(query)
+        if parts[:1] == ['containers'] and len(parts) >= 2:
+            return self._container(method, parts[1], parts[2] if len(parts) > 2 else None, query)
+        if path == '/build' and method == 'POST':
+            return self._build(query)
+        if path == '/images/json':
+            labels = json.loads(query.get('filters', ['{}'])[0] or '{}').get('label', [])
+
+            def matches(image_labels):
+                return all(image_labels.get(lf.split('=', 1)[0]) == lf.split('=', 1)[1] if '=' in lf
+                           else lf in image_labels for lf in labels)
+            return self._send(200, [{'Id': i['Id'], 'RepoTags': i['RepoTags'], 'Created': 0, 'Size': i['Size'],
+                                     'Labels': (i.get('Config') or {}).get('Labels') or {}}
+                                    for i in self.state.images.values()
+                                    if matches((i.get('Config') or {}).get('Labels') or {})])
+        if path == '/images/create' and method == 'POST':
+            repo, tag = query.get('fromImage', [''])[0], query.get('tag', ['latest'])[0] or 'latest'
+            image = self.state.pull_image(repo, tag)
+            if image is None:
+                return self._send(404, {'message': f'pull access denied for {repo}, repository does not exist'})
+            # Как у Docker: прогресс — поток JSON-строк в chunked-ответе
+            lines = [{'status': f'Pulling from {repo}', 'id': tag}, {'status': f'Digest: {image["Id"]}'},
+                     {'status': f'Status: Downloaded newer image for {repo}:{tag}'}]
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.send_header('Api-Version', API_VERSION)
+            self.end_headers()
+            for line in lines:
+                data = json.dumps(line).encode() + b'\r\n'
+                self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+            self.wfile.write(b'0\r\n\r\n')
+            return
+        if parts[:1] == ['images'] and len(parts) >= 2 and method == 'DELETE':
+            image = self.state.find_image('/'.join(parts[1:]))
+            if image is None:
+                return self._not_found('image')
+            return self._send(200, self.state.untag_image(image, '/'.join(parts[1:])))
+        if parts[:1] == ['images'] and len(parts) >= 3 and parts[-1] in ('json', 'tag'):
+            image = self.state.find_image('/'.join(parts[1:-1]))
+            if image is None:
+                return self._not_found('image')
+            if parts[-1] == 'tag':
+                self.state.tag_image(image, query['repo'][0], query.get('tag', ['latest'])[0])
+                return self._send(201)
+            return self._send(200, image)
+        if parts[:1] == ['exec'] and len(parts) == 3:
+            return self._exec(method, parts[1], parts[2])
+        if parts[:1] == ['networks']:
+            return self._network(method, parts[1] if len(parts) > 1 else None, query)
+        return self._not_found(f'endpoint {method} {path}')
+
+    def _read_chunked(self) -> bytes:
+        body = b''
+        while True:
+            size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+            if not size:
+                self.rfile.readline()
+                return body
+            body += self.rfile.read(size)
+            self.rfile.readline()
+
+    def _build(self, query):
+        """docker build: из контекста читается только Dockerfile, образ появляется с тегом t"""
+        dockerfile = None
+        try:
+            with tarfile.open(fileobj=BytesIO(self.body)) as tar:
+                member = tar.extractfile(query.get('dockerfile', ['Dockerfile'])[0])
+                dockerfile = member.read().decode() if member else None
+        except (tarfile.TarError, KeyError):
+            pass
+        labels = json.loads(query.get('labels', ['{}'])[0] or '{}')
+        with self.state.lock:
+            self.state.builds.append({'tag': query.get('t', [None])[0], 'labels': labels,
+                                      'dockerfile': dockerfile})
+        if self.state.build_latency:
+            time.sleep(self.state.build_latency)
+        error = self.state.build_handler(dockerfile) if self.state.build_handler else None
+        if error:
+            lines = [{'stream': 'Step 1/1 : RUN ...\n'}, {'errorDetail': {'message': error}, 'error': error}]
+            return self._send(200, raw=b''.join(json.dumps(line).encode() + b'\r\n' for line in lines))
+        image_id = 'sha256:' + _sha(f'build-{time.time()}')
+        with self.state.lock:
+            self.state.images[image_id] = {'Id': image_id, 'RepoTags': [], 'Created': _iso(time.time()),
+                                           'Size': 160_000_000, 'Config': {'Labels': labels}}
+        if query.get('t'):
+            repo, _, tag = query['t'][0].partition(':')
+            self.state.tag_image(self.state.images[image_id], repo, tag or 'latest')
+        lines = [{'stream': 'Step 1/1 : FROM python:3.11-slim\n'}, {'aux': {'ID': image_id}},
+                 {'stream': f'Successfully built {image_id[7:19]}\n'}]
+        return self._send(200, raw=b''.join(json.dumps(line).encode() + b'\r\n' for line in lines))
+
+    def _network(self, method, ref, query):
+        if method == 'POST' and ref == 'create':
+            spec = json.loads(self.body or b'{}')
+            network = {'Id': _sha('net-' + spec.get('Name', '')), 'Name': spec.get('Name'),
+                       'Driver': spec.get('Driver') or 'bridge', 'Containers': {}}
+            with self.state.lock:
+                self.state.networks[network['Id']] = network
+            return self._send(201, {'Id': network['Id'], 'Warning': ''})
+        if ref is None:
+            names = set(json.loads(query.get('filters', ['{}'])[0]).get('name', []))
+            return self._send(200, [n for n in self.state.networks.values() if not names or n['Name'] in names])
+        for network in self.state.networks.values():
+            if ref in (network['Id'], network['Name']):
+                return self._send(200, network)
+        return self._not_found(f'network {ref}')
+
+    def _create_container(self, query):
+        spec = json.loads(self.body or b'{}')
+        name = query.get('name', [''])[0] or _sha(str(time.time()))[:12]
+        if self.state.find(name) is not None:
+            return self._send(409, {'message': f'Conflict. The container name "/{name}" is already in use'})
+        image = self.state.find_image(spec.get('Image') or '')
+        if image is None:
+            return self._not_found(f"image: {spec.get('Image')}")
+        image_id = image['Id']
+        with self.state.lock:
+            c = self.state.add_container(name, image_id, spec.get('Labels') or {}, running=False, created=time.time())
+            host_config = spec.get('HostConfig') or {}
+            c['Resources'] = {key: host_config[key] for key in
+                              ('Memory', 'NanoCpus', 'CpusetCpus', 'PidsLimit', 'BlkioWeight') if key in host_config}
+            c['Mounts'] = [{'Type': 'bind', 'Source': bind.split(':')[0], 'Destination': bind.split(':')[1],
+                            'RW': not bind.endswith(':ro')} for bind in host_config.get('Binds') or []]
+        self.state.publish(c, 'create')
+        return self._send(201, {'Id': c['Id'], 'Warnings': []})
+
+    def _list_containers(self, query):
+        include_all = query.get('all', ['0'])[0] in ('1', 'true', 'True')
+        filters = json.loads(query.get('filters', ['{}'])[0] or '{}')
+        label_filters = filters.get('label', [])
+        name_filters = filters.get('name', [])
+        with self.state.lock:
+            items = list(self.state.containers.values())
+        result = []
+        for c in items:
+            if not include_all and not c['Running']:
+                continue
+            if any('=' in lf and c['Labels'].get(lf.split('=', 1)[0]) != lf.split('=', 1)[1]
+                   or '=' not in lf and lf not in c['Labels'] for lf in label_filters):
+                continue
+            if name_filters and not any(re.search(nf, c['Name']) for nf in name_filters):
+                continue
+            result.append(self.state.summary(c))
+        self._send(200, result)
+
+    def _events(self, query):
+        """Поток событий (chunked JSON), как у docker events; since — unix-время"""
+        filters = json.loads(query.get('filters', ['{}'])[0] or '{}')
+        since = float(query.get('since', ['0'])[0] or 0)
+        until = float(query.get('until', ['0'])[0] or 0)
+        labels = filters.get('label', [])
+
+        def matches(event):
+            attrs = event['Actor']['Attributes']
+            if filters.get('type') and event['Type'] not in filters['type']:
+                return False
+            return all(attrs.get(lf.split('=', 1)[0]) == lf.split('=', 1)[1] if '=' in lf else lf in attrs
+                       for lf in labels)
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Api-Version', API_VERSION)
+        self.end_headers()
+        position = 0
+        if not since:
+            with self.state.events_cond:
+                position = len(self.state.events)
+        try:
+            while True:
+                with self.state.events_cond:
+                    while position >= len(self.state.events):
+                        if until and time.time() >= until:
+                            break
+                        self.state.events_cond.wait(1.0)
+                    batch = self.state.events[position:]
+                    position = len(self.state.events)
+                if not batch and until and time.time() >= until:
+                    break
+                for event in batch:
+                    if event['time'] < since or not matches(event):
+                        continue
+                    data = json.dumps(event).encode() + b'\n'
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b'0\r\n\r\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _exec(self, method, exec_id, action):
+        if method == 'GET' and action == 'json':
+            record = self.state.execs.get(exec_id)
+            return self._send(200, record) if record else self._not_found(f'exec: {exec_id}')
+        if method == 'POST' and action == 'start':
+            result = self.state.run_exec(exec_id)
+            if result is None:
+                return self._not_found(f'exec: {exec_id}')
+            # Поток вывода как у присоединённого exec: кадры stdout, затем закрытие соединения
+            data = result['Output'].encode()
+            frame = struct.pack('>BxxxL', 1, len(data)) + data if data else b''
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+            self.send_header('Api-Version', API_VERSION)
+            self.end_headers()
+            self.wfile.write(frame)
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        return self._not_found(f'exec action {action}')
+
+    def _logs(self, c, query):
+        """Логи кадрами stdout; с follow=1 соединение держится и досылает новые строки, пока контейнер запущен"""
+        tail = query.get('tail', ['all'])[0]
+        timestamps = query.get('timestamps', ['0'])[0] in ('1', 'true', 'True')
+        follow = query.get('follow', ['0'])[0] in ('1', 'true', 'True')
+
+        def frames(lines):
+            out = b''
+            for line in lines:
+                data = ((line if timestamps else line.split(' ', 1)[1]) + '\n').encode()
+                out += struct.pack('>BxxxL', 1, len(data)) + data
+            return out
+
+        lines = c['Logs'] if tail == 'all' else c['Logs'][-int(tail):] if int(tail) > 0 else []
+        if not follow:
+            return self._send(200, raw=frames(lines), content_type='application/vnd.docker.raw-stream')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/vnd.docker.raw-stream')
+        self.send_header('Api-Version', API_VERSION)
+        self.end_headers()
+        position = len(c['Logs'])
+        try:
+            self.wfile.write(frames(lines))
+            self.wfile.flush()
+            while c['Running']:
+                time.sleep(0.02)
+                fresh = c['Logs'][position:]
+                position += len(fresh)
+                if fresh:
+                    self.wfile.write(frames(fresh))
+                    self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        self.close_connection = True
+
+    def _container(self, method, ref, action, query):
+        c = self.state.find(ref)
+        if c is None:
+            return self._not_found(f'container: {ref}')
+        if method == 'GET' and action == 'json':
+            return self._send(200, self.state.inspect(c))
+        if method == 'GET' and action == 'stats':
+            if self.state.stats_latency:
+                time.sleep(self.state.stats_latency)
+            return self._send(200, self.state.stats())
+        if method == 'GET' and action == 'logs':
+            return self._logs(c, query)
+        if method == 'POST' and action in ('pause', 'unpause'):
+            self.state.set_paused(ref, action == 'pause')
+            return self._send(204)
+        if method == 'POST' and action in ('start', 'stop', 'restart', 'kill'):
+            self.state.set_running(ref, action in ('start', 'restart'))
+            return self._send(204)
+        if method == 'POST' and action == 'exec':
+            if not c['Running'] or c.get('Paused'):
+                return self._send(409, {'message': f"Container {c['Id']} is not running"})
+            exec_id = _sha(f"exec-{c['Id']}-{len(self.state.execs)}-{time.time()}")
+            with self.state.lock:
+                self.state.execs[exec_id] = {'ID': exec_id, 'ContainerID': c['Id'], 'Running': False,
+                                             'ExitCode': None, 'Cmd': json.loads(self.body or b'{}').get('Cmd')}
+            return self._send(201, {'Id': exec_id})
+        if method == 'POST' and action == 'rename':
+            if not self.state.rename(c, query['name'][0]):
+                return self._send(409, {'message': f"Conflict. The name \"/{query['name'][0]}\" is already in use"})
+            return self._send(204)
+        if method == 'POST' and action == 'update':
+            with self.state.lock:
+                c.setdefault('Resources', {}).update(json.loads(self.body or b'{}'))
+            self.state.publish(c, 'update')
+            return self._send(200, {'Warnings': []})
+        if method == 'DELETE' and action is None:
+            self.state.remove(ref)
+            return self._send(204)
+        return self._not_found(f'container action {action}')
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+    def do_DELETE(self):
+        self._route('DELETE')
+
+    def do_HEAD(self):
+        self._route('HEAD')
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler ожидает адрес клиента в виде (host, port)
+        return request, ('fake-docker', 0)
+
+
+class FakeDockerDaemon:
+    """Запуск поддельного демона в фоновом потоке текущего процесса"""
+
+    def __init__(self, socket_path: str, state: FakeDockerState):
+        self.socket_path = socket_path
+        self.state = state
+        self._server: Optional[_UnixHTTPServer] = None
+
+    @property
+    def docker_host(self) -> str:
+        return f'unix://{self.socket_path}'
+
+    def start(self) -> 'FakeDockerDaemon':
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self._server = _UnixHTTPServer(self.socket_path, _Handler)
+        self._server.state = self.state
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='fake-docker').start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class FakeExecBackend:
+    """
+    Exec backend поверх FakeDockerState: понимает команды docker CLI,
+    которые формирует менеджер, и имитирует задержку ``latency`` на команду.
+    ``hosts`` (DOCKER_HOST -> состояние) — для команд с префиксом
+    ``export DOCKER_HOST=...;``, которым менеджер направляет CLI на другой узел.
+    """
+
+    def __init__(self, state: FakeDockerState, latency: float = 0.0,
+                 hosts: Optional[Dict[str, FakeDockerState]] = None):
+        self.state = state
+        self.latency = latency
+        self.hosts = hosts or {}
+        self.calls = 0
+
+    def run(self, command: str, timeout: int = 30) -> Tuple[str, str, int]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        match = _DOCKER_HOST_PREFIX.match(command)
+        if match:
+            host = shlex.split(match.group(1))[0]
+            if host not in self.hosts:
+                return '', f'Cannot connect to the Docker daemon at {host}\n', 1
+            return self._run(self.hosts[host], command[match.end():])
+        return self._run(self.state, command)
+
+    def _run(self, state: FakeDockerState, command: str) -> Tuple[str, str, int]:
+        try:
+            args = shlex.split(command)
+        except ValueError as e:
+            return '', f'parse error: {e}\n', 2
+        if not args or args[0] != 'docker':
+            return f'{command}\n', '', 0
+        sub, rest = (args[1], args[2:]) if len(args) > 1 else ('', [])
+
+        if sub == 'ps':
+            include_all = '-a' in rest
+            name = None
+            if '--filter' in rest:
+                flt = rest[rest.index('--filter') + 1]
+                if flt.startswith('name='):
+                    name = flt[5:].strip('^$')
+            out = []
+            for c in list(state.containers.values()):
+                if name and c['Name'] != name:
+                    continue
+                if include_all or c['Running']:
+                    out.append(state.status_text(c))
+            return ''.join(line + '\n' for line in out), '', 0
+        if sub in ('start', 'stop', 'restart'):
+            ref = rest[-1]
+            if not state.set_running(ref, sub != 'stop'):
+                return '', f'Error response from daemon: No such container: {ref}\n', 1
+            return ref + '\n', '', 0
+        if sub == 'rm':
+            ref = rest[-1]
+            if not state.remove(ref):
+                return '', f'Error: No such container: {ref}\n', 1
+            return ref + '\n', '', 0
+        if sub == 'logs':
+            c = state.find(rest[-1])
+            if c is None:
+                return '', f'Error: No such container: {rest[-1]}\n', 1
+            tail = int(rest[rest.index('--tail') + 1]) if '--tail' in rest else len(c['Logs'])
+            return ''.join(line + '\n' for line in c['Logs'][-tail:]), '', 0
+        if sub == 'exec':
+            ref = rest[0]
+            c = state.find(ref)
+            if c is None or not c['Running']:
+                return '', f'Error response from daemon: container {ref} is not running\n', 1
+            if c.get('Paused'):
+                return '', f'Error response from daemon: container {ref} is paused, unpause the container before exec\n', 1
+            return f'{rest[-1]}\n', '', 0
+        return '', f'unsupported fake docker command: {sub}\n', 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Поддельный Docker daemon на unix-сокете')
+    parser.add_argument('--socket', default='/tmp/fake-docker.sock')
+    parser.add_argument('--containers', type=int, default=100)
+    parser.add_argument('--stats-latency', type=float, default=0.0, help='задержка ответа stats, секунды')
+    args = parser.parse_args()
+
+    daemon = FakeDockerDaemon(args.socket, FakeDockerState(args.containers, stats_latency=args.stats_latency)).start()
+    print(f'Fake Docker: {daemon.docker_host}, контейнеров: {args.containers}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        daemon.stop()
+
+
+if __name__ == '__main__':
+    main()
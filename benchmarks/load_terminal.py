@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест терминальных и консольных сессий Socket.IO.
+
+Для каждого числа сессий поднимается отдельный процесс менеджера (socketio.run)
+с поддельным Docker и FakeExecBackend из benchmarks/fake_docker.py, затем
+открываются N клиентов python-socketio: доля ``--console-ratio`` работает через
+server_console_start/server_console_input, остальные — через terminal_start/
+terminal_input в запущенных контейнерах. Каждая сессия отправляет команды с
+частотой ``--rate`` в секунду (следующая — не раньше, чем пришёл результат
+предыдущей) в течение ``--duration`` секунд.
+
+Отчёт по каждому шагу:
+  latency   — от emit команды до получения *_command_result на клиенте
+  emit lag  — от finished_at результата на сервере до получения клиентом
+              (очередь emit и доставка; время самой команды сюда не входит)
+  RSS       — память процесса менеджера до подключения, после открытия сессий
+              и пик под нагрузкой; прирост в пересчёте на сессию
+
+    python benchmarks/load_terminal.py --sessions 50,200,500 --rate 1 --duration 20
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[k]
+
+
+def rss_kb(pid: int) -> int:
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def parse_iso(value: str) -> float:
+    return datetime.fromisoformat(value.rstrip('Z')).replace(tzinfo=timezone.utc).timestamp()
+
+
+# --- Сервер -------------------------------------------------------------------
+
+def run_server(args):
+    """Выполняется в дочернем процессе: менеджер на fake Docker и exec-заглушке"""
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, HERE)
+    from fake_docker import FakeDockerDaemon, FakeDockerState, FakeExecBackend
+
+    state = FakeDockerState(args.containers)
+    daemon = FakeDockerDaemon(os.path.join(os.getcwd(), 'docker.sock'), state).start()
+    os.environ['DOCKER_HOST'] = daemon.docker_host
+
+    import app as app_module
+    import exec_backend
+
+    exec_backend._backend_singleton = FakeExecBackend(state, latency=args.exec_latency)
+    app_module.startup_tasks.start()
+    app_module.socketio.run(app_module.app, host='127.0.0.1', port=args.port,
+                            debug=False, log_output=False)
+
+
+class ServerProcess:
+    def __init__(self, args, workdir: str):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        os.makedirs(os.path.join(workdir, 'logs'))
+        env = dict(os.environ)
+        env.update({
+            'DB_PATH': os.path.join(workdir, 'app.db'),
+            'BCRYPT_ROUNDS': '4',
+            'LOG_ARCHIVE_ENABLED': '0',
+            'HEALTH_CHECK_INTERVAL': '3600',
+            'RATELIMIT_STORAGE_URI': 'memory://',
+            'RATELIMIT_DEFAULT': '1000000 per hour',
+        })
+        cmd = [sys.executable, os.path.abspath(__file__), '--serve', '--port', str(self.port),
+               '--containers', str(args.containers), '--exec-latency', str(args.exec_latency)]
+        self.log = open(os.path.join(workdir, 'server.log'), 'w')
+        self.proc = subprocess.Popen(cmd, env=env, cwd=workdir, stdout=self.log, stderr=subprocess.STDOUT)
+
+    def wait_ready(self, timeout: float = 60.0):
+        import requests
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f'сервер завершился с кодом {self.proc.returncode}, см. {self.log.name}')
+            try:
+                if requests.get(f'{self.url}/ready', timeout=1).status_code == 200:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.2)
+        raise TimeoutError('сервер не стал ready')
+
+    def login(self) -> str:
+        import requests
+        http = requests.Session()
+        http.post(f'{self.url}/login', data={'username': 'admin', 'password': 'admin'}, timeout=10)
+        return '; '.join(f'{k}={v}' for k, v in http.cookies.items())
+
+    @property
+    def rss_kb(self) -> int:
+        return rss_kb(self.proc.pid)
+
+    def stop(self):
+        self.proc.terminate()
+        try:
+            self.proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+        self.log.close()
+
+
+# --- Клиенты ------------------------------------------------------------------
+
+class Session:
+    """Один клиент Socket.IO: терминал контейнера или консоль сервера"""
+
+    def __init__(self, url: str, cookie: str, container=None, transports=None):
+        import socketio
+        self.url = url
+        self.cookie = cookie
+        self.container = container
+        self.kind = 'terminal' if container else 'server_console'
+        self.transports = transports
+        self.client = socketio.Client(reconnection=False)
+        self.latencies = []
+        self.emit_lags = []
+        self.exec_ms = []
+        self.timeouts = 0
+        self._sent_at = None
+        self._result = threading.Event()
+        self.client.on(f'{self.kind}_command_result', self._on_result)
+
+    def _on_result(self, data):
+        received = time.time()
+        if self._sent_at is not None:
+            self.latencies.append(received - self._sent_at)
+        if data.get('finished_at'):
+            self.emit_lags.append(max(0.0, received - parse_iso(data['finished_at'])))
+        if data.get('duration_ms') is not None:
+            self.exec_ms.append(data['duration_ms'])
+        self._result.set()
+
+    def open(self):
+        self.client.connect(self.url, headers={'Cookie': self.cookie},
+                            transports=self.transports, wait_timeout=30)
+        if self.container:
+            self.client.emit('terminal_start', {'container': self.container})
+        else:
+            self.client.emit('server_console_start')
+
+    def run(self, rate: float, until: float, timeout: float):
+        interval = 1.0 / rate
+        next_at = time.time()
+        seq = 0
+        while time.time() < until:
+            delay = next_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            seq += 1
+            self._result.clear()
+            self._sent_at = time.time()
+            self.client.emit(f'{self.kind}_input', {'data': f'echo load-{seq}'})
+            if not self._result.wait(timeout):
+                self.timeouts += 1
+            next_at = max(next_at + interval, time.time())
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+
+def run_step(sessions: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        server = ServerProcess(args, tmp)
+        try:
+            server.wait_ready()
+            cookie = server.login()
+            baseline = server.rss_kb
+
+            # websocket-client: без него клиент работает через polling
+            transports = None if importlib.util.find_spec('websocket') else ['polling']
+
+            # Имена запущенных контейнеров совпадают с FakeDockerState: bench-bot-i, i в [20%, 80%)
+            running = [f'bench-bot-{i}' for i in range(int(args.containers * 0.2), int(args.containers * 0.8))]
+            consoles = int(round(sessions * args.console_ratio))
+            clients = [Session(server.url, cookie,
+                               None if i < consoles else running[i % len(running)], transports)
+                       for i in range(sessions)]
+
+            started = time.time()
+            with ThreadPoolExecutor(max_workers=args.connect_concurrency) as pool:
+                list(pool.map(lambda s: s.open(), clients))
+            connect_s = time.time() - started
+            time.sleep(1)
+            connected_rss = server.rss_kb
+
+            peak = [connected_rss]
+            stop_sampling = threading.Event()
+
+            def sample():
+                while not stop_sampling.wait(0.5):
+                    peak[0] = max(peak[0], server.rss_kb)
+
+            sampler = threading.Thread(target=sample, daemon=True)
+            sampler.start()
+
+            until = time.time() + args.duration
+            workers = [threading.Thread(target=s.run, args=(args.rate, until, args.timeout), daemon=True)
+                       for s in clients]
+            load_started = time.time()
+            for w in workers:
+                w.start()
+            for w in workers:
+                w.join()
+            wall = time.time() - load_started
+            stop_sampling.set()
+            sampler.join()
+            end_rss = server.rss_kb
+
+            for s in clients:
+                s.close()
+
+            latencies = [v for s in clients for v in s.latencies]
+            lags = [v for s in clients for v in s.emit_lags]
+            exec_ms = [v for s in clients for v in s.exec_ms]
+            return {
+                'sessions': sessions,
+                'consoles': consoles,
+                'transport': 'polling' if transports else 'websocket',
+                'connect_s': round(connect_s, 2),
+                'commands': len(latencies),
+                'timeouts': sum(s.timeouts for s in clients),
+                'commands_per_sec': round(len(latencies) / wall, 1) if wall else 0.0,
+                'latency_ms': {p: round(percentile(latencies, q) * 1000, 1)
+                               for p, q in (('p50', 50), ('p95', 95), ('p99', 99), ('max', 100))},
+                'emit_lag_ms': {p: round(percentile(lags, q) * 1000, 1)
+                                for p, q in (('p50', 50), ('p99', 99), ('max', 100))},
+                'exec_ms_p50': percentile(exec_ms, 50),
+                'rss_mb': {'baseline': round(baseline / 1024, 1), 'connected': round(connected_rss / 1024, 1),
+                           'peak': round(peak[0] / 1024, 1), 'end': round(end_rss / 1024, 1)},
+                'rss_kb_per_session': round((connected_rss - baseline) / sessions, 1),
+                'rss_kb_per_session_under_load': round((peak[0] - baseline) / sessions, 1),
+            }
+        finally:
+            server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест терминальных и консольных сессий')
+    parser.add_argument('--sessions', default='50,200', help='числа одновременных сессий через запятую')
+    parser.add_argument('--console-ratio', type=float, default=0.2, help='доля сессий консоли сервера')
+    parser.add_argument('--rate', type=float, default=1.0, help='команд в секунду на сессию')
+    parser.add_argument('--duration', type=float, default=15.0, help='длительность нагрузки, секунды')
+    parser.add_argument('--timeout', type=float, default=30.0, help='ожидание результата команды, секунды')
+    parser.add_argument('--exec-latency', type=float, default=0.01, help='время команды в exec-заглушке, секунды')
+    parser.add_argument('--containers', type=int, default=100, help='контейнеров в fake Docker')
+    parser.add_argument('--connect-concurrency', type=int, default=20, help='одновременных подключений при разгоне')
+    parser.add_argument('--json', action='store_true', help='вывести результаты в JSON')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--port', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        run_server(args)
+        return 0
+
+    # Клиент engineio пишет «packet queue is empty» на каждое отключение
+    logging.getLogger('engineio.client').setLevel(logging.CRITICAL)
+    results = []
+    for sessions in [int(s) for s in args.sessions.split(',') if s]:
+        res = run_step(sessions, args)
+        results.append(res)
+        if args.json:
+            continue
+        lat, lag, rss = res['latency_ms'], res['emit_lag_ms'], res['rss_mb']
+        print(f"\n=== {sessions} сессий ({res['consoles']} консолей, {res['transport']}), "
+              f"{args.rate}/с на сессию, {args.duration:.0f} с ===")
+        print(f"подключение: {res['connect_s']} с")
+        print(f"команд: {res['commands']} ({res['commands_per_sec']}/с), таймаутов: {res['timeouts']}")
+        print(f"latency ms:  p50 {lat['p50']}  p95 {lat['p95']}  p99 {lat['p99']}  max {lat['max']}"
+              f"  (exec p50 {res['exec_ms_p50']} ms)")
+        print(f"emit lag ms: p50 {lag['p50']}  p99 {lag['p99']}  max {lag['max']}")
+        print(f"RSS MB: {rss['baseline']} -> {rss['connected']} (сессии) -> пик {rss['peak']}, "
+              f"в конце {rss['end']}; на сессию {res['rss_kb_per_session']} KB, "
+              f"под нагрузкой {res['rss_kb_per_session_under_load']} KB")
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
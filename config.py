@@ -13,9 +13,26 @@ class Config:
     PERMANENT_SESSION_LIFETIME = 60 * 60 * 8  # 8 hours
 
     # Database (sqlite for simplicity)
-    DB_PATH = os.path.join(BASE_DIR, 'app.db')
+    DB_PATH = os.getenv('DB_PATH', os.path.join(BASE_DIR, 'app.db'))
     SQLALCHEMY_DATABASE_URI = f'sqlite:///{DB_PATH}'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL')
+    DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL')
+    DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', '5'))  # секунды ожидания блокировки внутри SQLite
+    DB_BUSY_RETRIES = int(os.getenv('DB_BUSY_RETRIES', '5'))  # повторы после истечения busy_timeout
+    DB_BUSY_BACKOFF = float(os.getenv('DB_BUSY_BACKOFF', '0.05'))
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+
+    # Rate limiting: общие счётчики для всех воркеров (sqlite://, redis://, memory://)
+    RATELIMIT_STORAGE_URI = os.getenv('RATELIMIT_STORAGE_URI', 'sqlite://' + os.path.join(BASE_DIR, 'ratelimit.db'))
+    RATELIMIT_STRATEGY = os.getenv('RATELIMIT_STRATEGY', 'sliding-window-counter')
+    RATELIMIT_DEFAULT = os.getenv('RATELIMIT_DEFAULT', '100 per hour')
+    # Эндпоинты без ограничений: опрос списка ботов и хода редеплоя, health и статика
+    RATELIMIT_EXEMPT_ENDPOINTS = set(filter(None, os.getenv(
+        'RATELIMIT_EXEMPT_ENDPOINTS',
+        'api_bots_list,api_bot_redeploy_status,health,ready,metrics,static,overridden_static').split(',')))
 
     # Docker
     DOCKER_BASE_NETWORK = os.getenv('DOCKER_BASE_NETWORK', 'bots_net')
@@ -26,6 +43,37 @@ class Config:
     UPLOADS_DIR = os.path.join(BASE_DIR, 'uploads')
     LOGS_DIR = os.path.join(BASE_DIR, 'logs')
 
+    # Кэш HTML-фрагментов дашборда (секунды); версия состояния контейнеров
+    # сбрасывает его при действиях менеджера, TTL ловит внешние изменения
+    DASHBOARD_CACHE_TTL = int(os.getenv('DASHBOARD_CACHE_TTL', '15'))
+
+    # Подсчёт размера workspace: сколько секунд результат считается свежим,
+    # как часто перечитывать сводки каталогов целиком и использовать ли inotify
+    DISK_USAGE_MAX_AGE = int(os.getenv('DISK_USAGE_MAX_AGE', '30'))
+    DISK_USAGE_FULL_RESCAN = int(os.getenv('DISK_USAGE_FULL_RESCAN', '600'))
+    DISK_USAGE_INOTIFY = os.getenv('DISK_USAGE_INOTIFY', '1') == '1'
+
+    # Чтение логов контейнеров: максимальный tail и бюджет байт на один ответ
+    LOG_MAX_TAIL = int(os.getenv('LOG_MAX_TAIL', '5000'))
+    LOG_READ_MAX_BYTES = int(os.getenv('LOG_READ_MAX_BYTES', str(1024 * 1024)))
+
+    # Архив логов управляемых контейнеров (сохраняется после удаления контейнера)
+    LOG_ARCHIVE_ENABLED = os.getenv('LOG_ARCHIVE_ENABLED', '1') == '1'
+    LOG_ARCHIVE_DIR = os.path.join(LOGS_DIR, 'archive')
+    LOG_ARCHIVE_COMPRESSION = os.getenv('LOG_ARCHIVE_COMPRESSION', 'gzip')  # 'gzip' или 'zstd'
+    LOG_ARCHIVE_BLOCK_BYTES = int(os.getenv('LOG_ARCHIVE_BLOCK_BYTES', str(64 * 1024)))
+    LOG_ARCHIVE_SEGMENT_BYTES = int(os.getenv('LOG_ARCHIVE_SEGMENT_BYTES', str(8 * 1024 * 1024)))
+    LOG_ARCHIVE_SEGMENT_SECONDS = int(os.getenv('LOG_ARCHIVE_SEGMENT_SECONDS', '86400'))
+    LOG_ARCHIVE_FLUSH_INTERVAL = int(os.getenv('LOG_ARCHIVE_FLUSH_INTERVAL', '5'))
+    LOG_ARCHIVE_SCAN_INTERVAL = int(os.getenv('LOG_ARCHIVE_SCAN_INTERVAL', '10'))
+    LOG_ARCHIVE_RETENTION_DAYS = int(os.getenv('LOG_ARCHIVE_RETENTION_DAYS', '14'))
+    LOG_ARCHIVE_RETENTION_INTERVAL = int(os.getenv('LOG_ARCHIVE_RETENTION_INTERVAL', '3600'))
+
+    # Полнотекстовый поиск по архиву логов (SQLite FTS5)
+    LOG_SEARCH_ENABLED = os.getenv('LOG_SEARCH_ENABLED', '1') == '1'
+    LOG_SEARCH_DB = os.path.join(LOGS_DIR, 'search.db')
+    LOG_SEARCH_MAX_RESULTS = int(os.getenv('LOG_SEARCH_MAX_RESULTS', '500'))
+
     # Git
     GIT_CLONE_DEPTH = int(os.getenv('GIT_CLONE_DEPTH', '1'))
 
@@ -35,11 +83,124 @@ class Config:
     SSH_USER = os.getenv('SSH_USER', 'botops')
     SSH_KEY_PATH = os.getenv('SSH_KEY_PATH', '/home/botops/.ssh/id_rsa')
 
+    # Кэш профилей команд ботов (секунды)
+    COMMANDS_CACHE_TTL = int(os.getenv('COMMANDS_CACHE_TTL', '300'))
+
+    # Фоновая инициализация: повторы шагов, зависящих от Docker
+    STARTUP_AUTORUN = os.getenv('STARTUP_AUTORUN', '1') == '1'
+    STARTUP_RETRIES = int(os.getenv('STARTUP_RETRIES', '0'))  # 0 — без ограничения
+    STARTUP_RETRY_DELAY = float(os.getenv('STARTUP_RETRY_DELAY', '2'))
+    STARTUP_RETRY_MAX_DELAY = float(os.getenv('STARTUP_RETRY_MAX_DELAY', '60'))
+    # Сколько секунд запрос ждёт готовности базы в первые секунды после старта
+    STARTUP_REQUEST_WAIT = float(os.getenv('STARTUP_REQUEST_WAIT', '10'))
+
+    # Поток событий Docker: задержка переподключения после обрыва
+    DOCKER_EVENTS_RETRY_DELAY = float(os.getenv('DOCKER_EVENTS_RETRY_DELAY', '1'))
+    DOCKER_EVENTS_RETRY_MAX_DELAY = float(os.getenv('DOCKER_EVENTS_RETRY_MAX_DELAY', '30'))
+
+    # Супервизор: перезапуск упавших контейнеров по событиям Docker
+    SUPERVISOR_ENABLED = os.getenv('SUPERVISOR_ENABLED', '1') == '1'
+    SUPERVISOR_DEFAULT_POLICY = os.getenv('SUPERVISOR_DEFAULT_POLICY', 'on-failure')  # 'no', 'on-failure', 'always'
+    SUPERVISOR_BACKOFF_INITIAL = float(os.getenv('SUPERVISOR_BACKOFF_INITIAL', '2'))
+    SUPERVISOR_BACKOFF_MAX = int(os.getenv('SUPERVISOR_BACKOFF_MAX', '300'))
+    # Больше перезапусков за окно — crash loop, автоматический перезапуск приостанавливается
+    SUPERVISOR_CRASHLOOP_RESTARTS = int(os.getenv('SUPERVISOR_CRASHLOOP_RESTARTS', '5'))
+    SUPERVISOR_CRASHLOOP_WINDOW = int(os.getenv('SUPERVISOR_CRASHLOOP_WINDOW', '600'))
+    # Проработал дольше — серия падений сбрасывается
+    SUPERVISOR_STABLE_SECONDS = int(os.getenv('SUPERVISOR_STABLE_SECONDS', '60'))
+    SUPERVISOR_RESTART_UNHEALTHY = os.getenv('SUPERVISOR_RESTART_UNHEALTHY', '1') == '1'
+    # Сколько секунд после намеренной остановки ждать события die
+    SUPERVISOR_EXPECT_SECONDS = float(os.getenv('SUPERVISOR_EXPECT_SECONDS', '30'))
+
+    # Несколько Docker-хостов: 'имя=url,...' (url 'env' — DOCKER_HOST процесса, иначе
+    # unix://, tcp://, ssh://). Пусто — один хост из окружения. Первый узел — по умолчанию.
+    # Каталог BOTS_DIR должен быть смонтирован на всех узлах по тому же пути
+    DOCKER_NODES = os.getenv('DOCKER_NODES', '')
+    DOCKER_NODE_TIMEOUT = int(os.getenv('DOCKER_NODE_TIMEOUT', '30'))
+    # Потоки для параллельных запросов ко всем узлам (списки, stats)
+    DOCKER_FANOUT_WORKERS = int(os.getenv('DOCKER_FANOUT_WORKERS', '16'))
+
+    # Ограничения ресурсов по умолчанию (пусто — без ограничения). Профили '@bot' и
+    # '@workspace' в базе и профиль конкретного контейнера переопределяют их по полям
+    BOT_MEM_LIMIT = os.getenv('BOT_MEM_LIMIT', '')  # '512m', '1g'
+    BOT_CPUS = os.getenv('BOT_CPUS', '')  # '0.5', '2'
+    BOT_PIDS_LIMIT = os.getenv('BOT_PIDS_LIMIT', '')  # '512'
+    WORKSPACE_MEM_LIMIT = os.getenv('WORKSPACE_MEM_LIMIT', '')
+    WORKSPACE_CPUS = os.getenv('WORKSPACE_CPUS', '')
+    WORKSPACE_PIDS_LIMIT = os.getenv('WORKSPACE_PIDS_LIMIT', '')  # '1024'
+    RESOURCE_BLKIO_WEIGHT = os.getenv('RESOURCE_BLKIO_WEIGHT', '')  # 10..1000
+    # Кэш ёмкости хоста (docker info) для страницы упаковки, секунды
+    RESOURCE_HOST_INFO_TTL = float(os.getenv('RESOURCE_HOST_INFO_TTL', '300'))
+
+    # Редеплой без простоя: ожидание готовности нового контейнера перед подменой.
+    # С HEALTHCHECK в образе ждём healthy, без него — REDEPLOY_STABLE_SECONDS работы без падений
+    REDEPLOY_HEALTH_TIMEOUT = float(os.getenv('REDEPLOY_HEALTH_TIMEOUT', '120'))
+    REDEPLOY_STABLE_SECONDS = float(os.getenv('REDEPLOY_STABLE_SECONDS', '10'))
+    REDEPLOY_POLL_INTERVAL = float(os.getenv('REDEPLOY_POLL_INTERVAL', '1'))
+    REDEPLOY_STOP_TIMEOUT = int(os.getenv('REDEPLOY_STOP_TIMEOUT', '10'))
+    REDEPLOY_HISTORY = int(os.getenv('REDEPLOY_HISTORY', '10'))  # последних редеплоев на бот в базе
+
+    # Усыпление workspace: без активности терминала и exec дольше HIBERNATE_IDLE_SECONDS контейнер
+    # останавливается ('stop' — освобождает память и процессы) или замораживается ('pause' — быстрее
+    # просыпается, память остаётся занятой). Пробуждение — при открытии терминала или exec; 0 — выключено
+    # (по умолчанию: активностью считаются только терминал и exec, а не dev-сервер или фоновая задача)
+    HIBERNATE_IDLE_SECONDS = float(os.getenv('HIBERNATE_IDLE_SECONDS', '0'))
+    HIBERNATE_MODE = os.getenv('HIBERNATE_MODE', 'stop')
+    HIBERNATE_CHECK_INTERVAL = float(os.getenv('HIBERNATE_CHECK_INTERVAL', '60'))
+    HIBERNATE_STOP_TIMEOUT = int(os.getenv('HIBERNATE_STOP_TIMEOUT', '10'))
+    # Активность пишется в базу не чаще раза в столько секунд на workspace
+    HIBERNATE_TOUCH_PERSIST = float(os.getenv('HIBERNATE_TOUCH_PERSIST', '60'))
+
+    # Каталог образов для формы создания workspace: кэш списков образов узлов, сбрасывается по событиям
+    # образов Docker; без потока событий обновляется не реже чем раз в IMAGE_CATALOG_TTL секунд
+    IMAGE_CATALOG_TTL = float(os.getenv('IMAGE_CATALOG_TTL', '60'))
+    # Фоновая загрузка образов заранее (через запятую, на все узлы; пусто — выключено). '@templates' —
+    # базовые образы шаблонов workspace, '@default' — BOT_DEFAULT_IMAGE
+    IMAGE_PREPULL = [i.strip() for i in os.getenv('IMAGE_PREPULL', '').split(',') if i.strip()]
+    IMAGE_PREPULL_CONCURRENCY = int(os.getenv('IMAGE_PREPULL_CONCURRENCY', '2'))  # одновременных загрузок
+    IMAGE_PREPULL_INTERVAL = float(os.getenv('IMAGE_PREPULL_INTERVAL', '3600'))
+    # 1 — при каждой проверке загружать и уже имеющиеся образы (обновление плавающих тегов вроде :latest)
+    IMAGE_PREPULL_UPDATE = os.getenv('IMAGE_PREPULL_UPDATE', '0') == '1'
+
+    # Образы шаблонов: команды настройки и пакеты шаблона workspace выполняются один раз при сборке
+    # образа TEMPLATE_IMAGE_REPO-<шаблон>:<хеш шаблона>; пересборка — только при изменении шаблона
+    TEMPLATE_IMAGES = os.getenv('TEMPLATE_IMAGES', '1') == '1'
+    TEMPLATE_IMAGE_REPO = os.getenv('TEMPLATE_IMAGE_REPO', 'bot-template')
+    TEMPLATE_IMAGE_PULL = os.getenv('TEMPLATE_IMAGE_PULL', '0') == '1'  # обновлять базовый образ при сборке
+    # После неудачной сборки workspace настраиваются по-старому, новая попытка — не раньше чем через столько секунд
+    TEMPLATE_IMAGE_RETRY = float(os.getenv('TEMPLATE_IMAGE_RETRY', '600'))
+
+    # Тёплый пул workspace: сколько заранее созданных и настроенных контейнеров держать на шаблон
+    # ('python-bot=2,devops=1'; пусто — выключен). Создание workspace из шаблона забирает готовый
+    # контейнер переименованием, пул пополняется в фоне
+    WARM_POOL = os.getenv('WARM_POOL', '')
+    WARM_POOL_INTERVAL = float(os.getenv('WARM_POOL_INTERVAL', '30'))
+    WARM_POOL_PARALLEL = int(os.getenv('WARM_POOL_PARALLEL', '2'))  # одновременно готовящихся контейнеров
+    WARM_POOL_PREPARE_TIMEOUT = float(os.getenv('WARM_POOL_PREPARE_TIMEOUT', '1800'))
+
+    # Проверки готовности (/ready): период фоновых проверок и обязательные компоненты
+    HEALTH_CHECK_INTERVAL = float(os.getenv('HEALTH_CHECK_INTERVAL', '10'))
+    HEALTH_REQUIRED = [c for c in os.getenv('HEALTH_REQUIRED', 'database,docker').split(',') if c]
+
+    # /metrics: без сессии доступен по заголовку Authorization: Bearer <METRICS_TOKEN>
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+    # Профилирование запросов: всегда (PROFILE_ENABLED) или по заголовку для вошедшего пользователя
+    PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', '0') == '1'
+    PROFILE_HEADER = os.getenv('PROFILE_HEADER', 'X-Profile')
+    PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))  # сколько медленных и последних трасс хранить
+    PROFILE_MIN_MS = float(os.getenv('PROFILE_MIN_MS', '0'))
+
     # Security
     BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
+    BCRYPT_EXECUTOR = os.getenv('BCRYPT_EXECUTOR', 'auto')  # 'auto', 'thread', 'process' или 'inline'
+    BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', '4'))
 
 cfg = Config()
 
-os.makedirs(cfg.BOTS_DIR, exist_ok=True)
-os.makedirs(cfg.UPLOADS_DIR, exist_ok=True)
-os.makedirs(cfg.LOGS_DIR, exist_ok=True)
+
+def ensure_dirs():
+    """Создать рабочие каталоги (вызывается приложением, а не при импорте конфигурации)"""
+    os.makedirs(cfg.BOTS_DIR, exist_ok=True)
+    os.makedirs(cfg.UPLOADS_DIR, exist_ok=True)
+    os.makedirs(cfg.LOGS_DIR, exist_ok=True)
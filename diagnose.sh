@@ -191,6 +191,23 @@ except Exception as e:
 else
     echo "✗ Невозможно проверить команды - нет виртуального окружения"
 fi
+echo -e "\n11. Профиль времени импорта (python -X importtime)..."
+if [ -f "$APP_DIR/venv/bin/python" ]; then
+    # STARTUP_AUTORUN=0: замеряем только импорт, без фоновой инициализации
+    IMPORT_LOG=$(mktemp)
+    START_NS=$(date +%s%N)
+    STARTUP_AUTORUN=0 $APP_DIR/venv/bin/python -X importtime -c "import app" 2> "$IMPORT_LOG" >/dev/null
+    END_NS=$(date +%s%N)
+    echo "Импорт app.py: $(( (END_NS - START_NS) / 1000000 )) мс (вместе с запуском интерпретатора)"
+    echo "Самые долгие модули (накопительно, мкс):"
+    grep '^import time:' "$IMPORT_LOG" | grep -v 'self \[us\]' \
+        | awk -F'|' '{gsub(/ /, "", $2); print $2 "\t" $3}' \
+        | sort -n -r | head -15
+    rm -f "$IMPORT_LOG"
+else
+    echo "✗ Невозможно построить профиль импорта - нет виртуального окружения"
+fi
+
 echo ""
 echo "Для исправления SSH ключей выполните:"
 echo "  sudo -u botops ssh-keygen -t rsa -b 2048 -N '' -f /home/botops/.ssh/id_rsa -q"
@@ -0,0 +1,237 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+try:
+    import inotify_simple  # type: ignore
+except ImportError:  # graceful degradation: без inotify работаем по mtime
+    inotify_simple = None
+
+from config import cfg
+
+
+def _iso(ts: float) -> str:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z'
+
+
+class DiskUsageService:
+    """
+    Подсчёт занимаемого места в каталогах workspace.
+
+    Для каждого каталога хранится сводка (размер и число файлов
+    непосредственно в нём + список подкаталогов) с ключом st_mtime_ns.
+    Если mtime каталога не изменился, повторный проход делает один stat
+    вместо scandir и stat каждого файла. Изменение содержимого файла не
+    меняет mtime каталога, поэтому сводки дополнительно перечитываются
+    не реже раза в ``full_rescan`` секунд (или сразу, если доступен inotify).
+    """
+
+    _WATCH_MASK = 0
+
+    def __init__(self, max_age: float = 30, full_rescan: float = 600, use_inotify: bool = True):
+        self.max_age = max_age
+        self.full_rescan = full_rescan
+        self._dirs: Dict[str, dict] = {}
+        self._totals: Dict[str, dict] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._inotify = None
+        self._watches: Dict[int, str] = {}
+        self._watched_paths: Dict[str, int] = {}
+        if use_inotify and inotify_simple:
+            try:
+                self._init_inotify()
+            except OSError as e:
+                print(f"[disk_usage] inotify недоступен: {e}")
+                self._inotify = None
+
+    # --- Сканирование -------------------------------------------------
+
+    def _scan_dir(self, path: str, now: float):
+        """Вернуть (размер, число файлов) поддерева, переиспользуя неизменившиеся сводки"""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self._dirs.pop(path, None)
+            return 0, 0
+
+        summary = self._dirs.get(path)
+        if (summary is None or summary['mtime_ns'] != mtime_ns
+                or now - summary['scanned_at'] > self.full_rescan):
+            files_size = 0
+            files_count = 0
+            subdirs = []
+            try:
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                                continue
+                            if entry.is_symlink() and entry.is_dir():
+                                continue  # как os.walk: ссылки на каталоги не считаем
+                        except OSError:
+                            pass
+                        files_count += 1
+                        try:
+                            files_size += entry.stat().st_size
+                        except OSError:
+                            pass  # битая ссылка или файл удалён во время обхода
+            except OSError:
+                pass
+            if summary is not None:
+                # Удалённые подкаталоги больше не обходятся — забываем их сводки
+                for gone in set(summary['subdirs']) - set(subdirs):
+                    self._forget(gone)
+            summary = {
+                'mtime_ns': mtime_ns,
+                'files_size': files_size,
+                'files_count': files_count,
+                'subdirs': subdirs,
+                'scanned_at': now,
+            }
+            self._dirs[path] = summary
+            self._watch(path)
+
+        total_size = summary['files_size']
+        total_count = summary['files_count']
+        for sub in summary['subdirs']:
+            size, count = self._scan_dir(sub, now)
+            total_size += size
+            total_count += count
+        return total_size, total_count
+
+    def scan(self, root: str) -> dict:
+        """Пересчитать размер каталога и сохранить результат"""
+        root = os.path.abspath(root)
+        started = time.time()
+        size, count = self._scan_dir(root, started)
+        finished = time.time()
+        totals = {
+            'files_count': count,
+            'directory_size': size,
+            'scanned_at': finished,
+            'scan_ms': int((finished - started) * 1000),
+        }
+        with self._lock:
+            self._totals[root] = totals
+            self._refreshing.discard(root)
+        return totals
+
+    def _refresh_async(self, root: str):
+        with self._lock:
+            if root in self._refreshing:
+                return
+            self._refreshing.add(root)
+
+        def run():
+            try:
+                self.scan(root)
+            except Exception as e:
+                print(f"[disk_usage] ошибка пересчёта {root}: {e}")
+                with self._lock:
+                    self._refreshing.discard(root)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def get_usage(self, root: str) -> dict:
+        """
+        Вернуть размер каталога.
+
+        Если есть сохранённый результат, он возвращается сразу; устаревший
+        результат пересчитывается в фоне. Первый вызов считает синхронно.
+        """
+        root = os.path.abspath(root)
+        totals = self._totals.get(root)
+        if totals is None:
+            totals = self.scan(root)
+        age = time.time() - totals['scanned_at']
+        stale = age > self.max_age
+        if stale:
+            self._refresh_async(root)
+        return {
+            'files_count': totals['files_count'],
+            'directory_size': totals['directory_size'],
+            'scanned_at': _iso(totals['scanned_at']),
+            'scan_ms': totals['scan_ms'],
+            'stale': stale,
+        }
+
+    def invalidate(self, root: str):
+        """Забыть все сводки каталога (например, после удаления workspace)"""
+        root = os.path.abspath(root)
+        with self._lock:
+            self._totals.pop(root, None)
+        self._forget(root)
+
+    def _forget(self, root: str):
+        prefix = root + os.sep
+        for path in [p for p in list(self._dirs) if p == root or p.startswith(prefix)]:
+            self._dirs.pop(path, None)
+            self._unwatch(path)
+
+    # --- inotify ------------------------------------------------------
+
+    def _init_inotify(self):
+        flags = inotify_simple.flags
+        self._WATCH_MASK = (flags.CREATE | flags.DELETE | flags.MODIFY | flags.CLOSE_WRITE
+                            | flags.MOVED_FROM | flags.MOVED_TO | flags.DELETE_SELF)
+        self._inotify = inotify_simple.INotify()
+        threading.Thread(target=self._inotify_loop, daemon=True).start()
+
+    def _watch(self, path: str):
+        if not self._inotify or path in self._watched_paths:
+            return
+        try:
+            wd = self._inotify.add_watch(path, self._WATCH_MASK)
+        except OSError:
+            return  # например, исчерпан fs.inotify.max_user_watches
+        self._watches[wd] = path
+        self._watched_paths[path] = wd
+
+    def _unwatch(self, path: str):
+        wd = self._watched_paths.pop(path, None)
+        if wd is None or not self._inotify:
+            return
+        self._watches.pop(wd, None)
+        try:
+            self._inotify.rm_watch(wd)
+        except OSError:
+            pass
+
+    def _inotify_loop(self):
+        while True:
+            try:
+                events = self._inotify.read(timeout=1000, read_delay=200)
+            except Exception as e:
+                print(f"[disk_usage] inotify остановлен: {e}")
+                return
+            changed = set()
+            for event in events:
+                path = self._watches.get(event.wd)
+                if path:
+                    changed.add(path)
+            for path in changed:
+                # Сводка каталога перечитается при следующем проходе
+                summary = self._dirs.get(path)
+                if summary:
+                    summary['mtime_ns'] = None
+                for root in list(self._totals):
+                    if path == root or path.startswith(root + os.sep):
+                        self._refresh_async(root)
+
+
+_service_singleton: Optional[DiskUsageService] = None
+
+
+def get_disk_usage_service() -> DiskUsageService:
+    global _service_singleton
+    if _service_singleton is None:
+        _service_singleton = DiskUsageService(
+            max_age=cfg.DISK_USAGE_MAX_AGE,
+            full_rescan=cfg.DISK_USAGE_FULL_RESCAN,
+            use_inotify=cfg.DISK_USAGE_INOTIFY,
+        )
+    return _service_singleton
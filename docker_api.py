@@ -2,15 +2,22 @@ import os
 import shutil
 import tempfile
 import subprocess
+import threading
+import time
 from datetime import datetime
 from typing import List, Dict, Optional
 
-import docker
 from git import Repo
 
 from config import cfg
+from disk_usage import get_disk_usage_service
+from nodes import get_node_registry
+from resources import run_kwargs as resource_run_kwargs
+from warm_pool import is_pool_member
 
-_client = None
+# Версия состояния контейнеров: увеличивается при каждом действии жизненного цикла
+_state_version = 0
+_state_lock = threading.Lock()
 
 
 def normalize_docker_name(name: str) -> str:
@@ -33,29 +40,63 @@ def normalize_docker_name(name: str) -> str:
     return normalized
 
 
-def get_client():
-    global _client
-    if _client is None:
-        try:
-            _client = docker.from_env()
-        except Exception as e:
-            raise RuntimeError(f"Не удалось инициализировать Docker клиент: {e}")
-    return _client
+def get_client(node: Optional[str] = None):
+    """Клиент Docker узла ``node`` (по умолчанию — основного)"""
+    return get_node_registry().get(node).client
+
+
+def client_for(name: str):
+    """Клиент Docker узла, на котором находится контейнер"""
+    return get_node_registry().locate(name).client
+
+
+def _backend_for(name: str):
+    """Exec backend, в котором docker CLI работает с узлом контейнера"""
+    return get_node_registry().locate(name).exec_backend()
+
+
+def _image_name(c) -> str:
+    return c.image.tags[0] if c.image.tags else c.image.short_id
+
+
+def get_state_version() -> int:
+    """Текущая версия состояния контейнеров (ключ для кэшей рендеринга)"""
+    return _state_version
+
+
+def bump_state_version():
+    """Отметить изменение состояния контейнеров"""
+    global _state_version
+    with _state_lock:
+        _state_version += 1
+
+
+def _expect_stop(name: str):
+    """Предупредить супервизор: остановка намеренная, перезапускать контейнер не нужно"""
+    from supervisor import get_supervisor
+    get_supervisor().expect_stop(name)
+
+
+def _error_rows(errors: Dict[str, str]) -> List[Dict]:
+    multi = get_node_registry().multi
+    return [{'id': '-', 'name': f'ERROR ({node})' if multi else 'ERROR', 'status': f'docker err: {error}',
+             'image': '-', 'created': '-', 'node': node} for node, error in errors.items()]
 
 
 def list_bots() -> List[Dict]:
-    try:
-        containers = get_client().containers.list(all=True)
-    except Exception as e:
-        return [{'id': '-', 'name': 'ERROR', 'status': f'docker err: {e}', 'image': '-', 'created': '-'}]
-    data = []
-    for c in containers:
+    """Контейнеры всех узлов (запросы к узлам идут параллельно)"""
+    containers, errors = get_node_registry().list_containers(all=True)
+    data = _error_rows(errors)
+    for node, c in containers:
+        if is_pool_member(c.name):
+            continue  # Заготовки тёплого пула — не бот и не workspace пользователя
         data.append({
             'id': c.id[:12],
             'name': c.name,
             'status': c.status,
-            'image': c.image.tags[0] if c.image.tags else c.image.short_id,
-            'created': c.attrs.get('Created')
+            'image': _image_name(c),
+            'created': c.attrs.get('Created'),
+            'node': node.name,
         })
     return data
 
@@ -63,8 +104,7 @@ def list_bots() -> List[Dict]:
 def start_bot(name: str):
     """Запустить бот с использованием кастомной команды, если она задана"""
     try:
-        from exec_backend import get_backend
-        backend = get_backend()
+        backend = _backend_for(name)
         
         # Сначала проверяем статус контейнера
         stdout, stderr, exit_code = backend.run(f"docker ps -a --filter name=^{name}$ --format '{{{{.Status}}}}'")
@@ -136,13 +176,14 @@ def start_bot(name: str):
             return launch_result
     except Exception as e:
         raise RuntimeError(f"Ошибка запуска: {str(e)}")
+    finally:
+        bump_state_version()
 
 
 def stop_bot(name: str):
     """Остановить бот с использованием кастомной команды, если она задана"""
     try:
-        from exec_backend import get_backend
-        backend = get_backend()
+        backend = _backend_for(name)
         
         # Проверяем статус контейнера
         stdout, stderr, exit_code = backend.run(f"docker ps --filter name=^{name}$ --format '{{{{.Status}}}}'")
@@ -150,6 +191,8 @@ def stop_bot(name: str):
             raise RuntimeError(f"Не удалось проверить статус контейнера: {stderr}")
         
         is_running = "Up" in stdout.strip()
+        if is_running:
+            _expect_stop(name)
         
         # Проверяем кастомные команды
         try:
@@ -181,13 +224,15 @@ def stop_bot(name: str):
                 return "Контейнер уже остановлен"
     except Exception as e:
         raise RuntimeError(f"Ошибка остановки: {str(e)}")
+    finally:
+        bump_state_version()
 
 
 def restart_bot(name: str):
     """Перезапустить бот с использованием кастомной команды, если она задана"""
     try:
-        from exec_backend import get_backend
-        backend = get_backend()
+        backend = _backend_for(name)
+        _expect_stop(name)
         
         # Проверяем кастомные команды
         try:
@@ -213,14 +258,24 @@ def restart_bot(name: str):
             return "Контейнер перезапущен стандартным способом"
     except Exception as e:
         raise RuntimeError(f"Ошибка перезапуска: {str(e)}")
+    finally:
+        bump_state_version()
 
 
 def remove_bot(name: str, force: bool = False):
-    from exec_backend import get_backend
-    backend = get_backend()
+    backend = _backend_for(name)
+    
+    # Сохраняем логи до удаления контейнера
+    from log_archive import archive_before_remove
+    archive_before_remove(name)
+    _expect_stop(name)
     
     force_flag = "--force" if force else ""
-    stdout, stderr, exit_code = backend.run(f"docker rm {force_flag} {name}")
+    try:
+        stdout, stderr, exit_code = backend.run(f"docker rm {force_flag} {name}")
+    finally:
+        get_node_registry().forget(name)
+        bump_state_version()
     if exit_code != 0:
         raise RuntimeError(f"Не удалось удалить контейнер: {stderr}")
     return True
@@ -234,27 +289,40 @@ def remove_workspace(name: str, delete_files: bool = False):
         name: имя workspace (оригинальное или docker-нормализованное)
         delete_files: удалить ли файлы workspace с диска
     """
-    from exec_backend import get_backend
-    backend = get_backend()
-    
     # Получаем нормализованное имя для Docker
     docker_name = normalize_docker_name(name)
+    backend = _backend_for(docker_name)
     
-    # Останавливаем и удаляем контейнер
+    # Сохраняем логи и останавливаем и удаляем контейнер
+    from log_archive import archive_before_remove
+    archive_before_remove(docker_name)
+    _expect_stop(docker_name)
     try:
         backend.run(f"docker stop {docker_name}")
     except:
         pass  # Контейнер может быть уже остановлен
     
-    stdout, stderr, exit_code = backend.run(f"docker rm --force {docker_name}")
+    try:
+        stdout, stderr, exit_code = backend.run(f"docker rm --force {docker_name}")
+    finally:
+        get_node_registry().forget(docker_name)
+        bump_state_version()
     if exit_code != 0:
         raise RuntimeError(f"Не удалось удалить контейнер: {stderr}")
     
     # Удаляем файлы если запрошено
     if delete_files:
         workspace_dir = os.path.join(cfg.BOTS_DIR, name)
+        if os.path.islink(workspace_dir):
+            # Workspace из тёплого пула: ссылка на каталог заготовки в bots/.pool
+            target = os.path.realpath(workspace_dir)
+            os.unlink(workspace_dir)
+            shutil.rmtree(target, ignore_errors=True)
+            get_disk_usage_service().invalidate(workspace_dir)
+            return f'Workspace "{name}" и все файлы удалены'
         if os.path.exists(workspace_dir):
             shutil.rmtree(workspace_dir)
+            get_disk_usage_service().invalidate(workspace_dir)
             return f'Workspace "{name}" и все файлы удалены'
     
     return f'Workspace контейнер "{name}" удален (файлы сохранены)'
@@ -273,11 +341,13 @@ def get_workspace_info(name: str):
         'container_exists': False,
         'container_status': None,
         'files_count': 0,
-        'directory_size': 0
+        'directory_size': 0,
+        'size_scanned_at': None,
+        'size_stale': False
     }
     
     # Проверяем контейнер
-    cli = get_client()
+    cli = client_for(docker_name)
     try:
         container = cli.containers.get(docker_name)
         info['container_exists'] = True
@@ -290,22 +360,22 @@ def get_workspace_info(name: str):
         except:
             pass
     
-    # Считаем файлы и размер
+    # Считаем файлы и размер (результат кэшируется, устаревший пересчитывается в фоне)
     if info['exists_on_disk']:
         try:
-            for root, dirs, files in os.walk(workspace_dir):
-                info['files_count'] += len(files)
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if os.path.exists(file_path):
-                        info['directory_size'] += os.path.getsize(file_path)
+            usage = get_disk_usage_service().get_usage(workspace_dir)
+            info['files_count'] = usage['files_count']
+            info['directory_size'] = usage['directory_size']
+            info['size_scanned_at'] = usage['scanned_at']
+            info['size_stale'] = usage['stale']
         except:
             pass
     
     return info
 
 
-def create_bot_from_repo(git_url: str, bot_name: Optional[str] = None, branch: Optional[str] = None):
+def create_bot_from_repo(git_url: str, bot_name: Optional[str] = None, branch: Optional[str] = None,
+                         node: Optional[str] = None):
     # Получаем исходное имя бота
     if not bot_name:
         bot_name = os.path.splitext(os.path.basename(git_url.rstrip('/')))[0]
@@ -326,48 +396,135 @@ def create_bot_from_repo(git_url: str, bot_name: Optional[str] = None, branch: O
     finally:
         shutil.rmtree(tmp_dir, ignore_errors=True)
 
-    dockerfile_path = os.path.join(bot_dir, 'Dockerfile')
-    cli = get_client()
-    
-    if os.path.exists(dockerfile_path):
-        cli.images.build(path=bot_dir, tag=docker_image_tag)
+    limits = resource_run_kwargs(docker_bot_name, 'bot')
+    target = _place(node, limits)
+    cli = target.client
+
+    build_bot_image(cli, bot_dir, bot_name, docker_image_tag)
+    container = run_bot_container(cli, docker_image_tag, docker_bot_name, bot_dir, limits)
+    get_node_registry().remember(docker_bot_name, target)
+    bump_state_version()
+    return container.id[:12]
+
+
+def build_bot_image(cli, bot_dir: str, bot_name: str, tag: str):
+    """Собрать образ бота: по его Dockerfile, а без него — по общему Dockerfile.bot"""
+    if os.path.exists(os.path.join(bot_dir, 'Dockerfile')):
+        image, _ = cli.images.build(path=bot_dir, tag=tag)
     else:
         base_bot_dockerfile = os.path.join(os.path.dirname(__file__), 'Dockerfile.bot')
-        cli.images.build(path=os.path.dirname(base_bot_dockerfile), dockerfile=base_bot_dockerfile, 
-                        tag=docker_image_tag, buildargs={'BOT_NAME': bot_name})
+        image, _ = cli.images.build(path=os.path.dirname(base_bot_dockerfile), dockerfile=base_bot_dockerfile,
+                                    tag=tag, buildargs={'BOT_NAME': bot_name})
+    return image
+
 
-    container = cli.containers.run(
-        docker_image_tag,
-        name=docker_bot_name,
+def run_bot_container(cli, image: str, name: str, bot_dir: str, limits: Dict):
+    """Запустить контейнер бота (каталог бота монтируется в /app)"""
+    return cli.containers.run(
+        image,
+        name=name,
         labels={'bot-manager': '1'},
         detach=True,
         network=cfg.DOCKER_BASE_NETWORK,
         volumes={bot_dir: {'bind': '/app', 'mode': 'rw'}},
         tty=True,
         stdin_open=True,
+        **limits,
     )
-    return container.id[:12]
 
 
-def ensure_network():
-    try:
-        cli = get_client()
+def _place(node: Optional[str], limits: Dict):
+    """Узел для нового контейнера: указанный явно или с наибольшим запасом ресурсов"""
+    registry = get_node_registry()
+    return registry.get(node) if node else registry.place(limits)
+
+
+def ensure_network(strict: bool = False):
+    """Создать сеть ботов на всех узлах; со strict=True ошибка Docker пробрасывается (для повторов при старте)"""
+    def ensure(node):
+        cli = node.client
         networks = cli.networks.list(names=[cfg.DOCKER_BASE_NETWORK])
         if not networks:
             cli.networks.create(cfg.DOCKER_BASE_NETWORK, driver='bridge')
-    except Exception:
-        # Не валим старт приложения если docker недоступен
-        pass
+
+    registry = get_node_registry()
+    errors = [(node, error) for node, _, error in registry.fan_out(ensure) if error is not None]
+    if errors and strict:
+        if not registry.multi:
+            raise errors[0][1]
+        raise RuntimeError('; '.join(f'{node.name}: {error}' for node, error in errors))
+    # Не валим старт приложения если docker недоступен
 
 
-def create_workspace(workspace_name: str, base_image: str = None, port_mappings: Dict[str, int] = None):
+def write_workspace_files(workspace_dir: str, workspace_name: Optional[str] = None):
+    """Базовые файлы workspace (существующие не перезаписываются; README — только при известном имени)"""
+    files = {
+        'requirements.txt': '# Добавьте зависимости здесь\n',
+        'main.py': '# Основной файл бота\nprint("Hello from bot workspace!")\n',
+    }
+    if workspace_name:
+        files['README.md'] = f'# {workspace_name}\n\nОписание бота...\n'
+    for filename, content in files.items():
+        path = os.path.join(workspace_dir, filename)
+        if not os.path.exists(path):
+            with open(path, 'w') as f:
+                f.write(content)
+
+
+def run_workspace_container(cli, image_name: str, name: str, workspace_dir: str, limits: Dict,
+                            port_mappings: Dict[str, int] = None, labels: Dict[str, str] = None):
+    """Запустить контейнер workspace с каталогом workspace_dir в /workspace"""
+    ports = {}
+    if port_mappings:
+        for internal_port, external_port in port_mappings.items():
+            ports[f'{internal_port}/tcp'] = external_port
+    
+    return cli.containers.run(
+        image_name,
+        name=name,
+        labels={'bot-manager': '1', 'workspace': '1', **(labels or {})},
+        detach=True,
+        network=cfg.DOCKER_BASE_NETWORK,
+        volumes={workspace_dir: {'bind': '/workspace', 'mode': 'rw'}},
+        ports=ports,
+        tty=True,
+        stdin_open=True,
+        working_dir='/workspace',
+        command='sleep infinity',  # Держим контейнер живым
+        **limits,
+    )
+
+
+def provision_workspace(container, template: Dict) -> List[str]:
+    """
+    Выполнить команды настройки и установки пакетов шаблона в контейнере.
+    Команды идут через sh -c (в шаблонах есть '&&' и '>'); это dash или
+    busybox ash без подстановки '{a,b}', поэтому такие команды пишутся без
+    неё. Ошибки не прерывают настройку и возвращаются списком.
+    """
+    failed = []
+    for cmd in template['setup_commands'] + template['packages']:
+        try:
+            result = container.exec_run(['sh', '-c', cmd], workdir='/workspace')
+            output = result.output.decode('utf-8', errors='replace') if result.output else ''
+            if result.exit_code:
+                failed.append(f'{cmd}: код {result.exit_code}')
+                print(f"[workspace] {container.name}: команда завершилась с кодом {result.exit_code}: {cmd}\n{output[-2000:]}")
+        except Exception as e:
+            failed.append(f'{cmd}: {e}')
+            print(f"[workspace] {container.name}: ошибка команды {cmd}: {e}")
+    return failed
+
+
+def create_workspace(workspace_name: str, base_image: str = None, port_mappings: Dict[str, int] = None,
+                     node: Optional[str] = None):
     """Создать workspace для бота с базовым образом"""
     if not workspace_name:
         raise ValueError('Имя workspace обязательно')
     
     # Создаем директорию с исходным именем (для файловой системы)
     workspace_dir = os.path.join(cfg.BOTS_DIR, workspace_name)
-    if os.path.exists(workspace_dir):
+    if os.path.lexists(workspace_dir):
         raise ValueError('Каталог workspace уже существует')
     
     # Но для Docker используем нормализованное имя
@@ -376,127 +533,54 @@ def create_workspace(workspace_name: str, base_image: str = None, port_mappings:
     os.makedirs(workspace_dir)
     
     # Создаём базовые файлы
-    with open(os.path.join(workspace_dir, 'requirements.txt'), 'w') as f:
-        f.write('# Добавьте зависимости здесь\n')
-    
-    with open(os.path.join(workspace_dir, 'main.py'), 'w') as f:
-        f.write('# Основной файл бота\nprint("Hello from bot workspace!")\n')
-    
-    with open(os.path.join(workspace_dir, 'README.md'), 'w') as f:
-        f.write(f'# {workspace_name}\n\nОписание бота...\n')
+    write_workspace_files(workspace_dir, workspace_name)
     
     # Создаём контейнер
-    cli = get_client()
-    image_name = base_image or cfg.BOT_DEFAULT_IMAGE
-    
-    ports = {}
-    if port_mappings:
-        for internal_port, external_port in port_mappings.items():
-            ports[f'{internal_port}/tcp'] = external_port
-    
-    container = cli.containers.run(
-        image_name,
-        name=docker_workspace_name,
-        labels={'bot-manager': '1', 'workspace': '1'},
-        detach=True,
-        network=cfg.DOCKER_BASE_NETWORK,
-        volumes={workspace_dir: {'bind': '/workspace', 'mode': 'rw'}},
-        ports=ports,
-        tty=True,
-        stdin_open=True,
-        working_dir='/workspace',
-        command='sleep infinity'  # Держим контейнер живым
-    )
+    limits = resource_run_kwargs(docker_workspace_name, 'workspace')
+    target = _place(node, limits)
+    container = run_workspace_container(target.client, base_image or cfg.BOT_DEFAULT_IMAGE,
+                                        docker_workspace_name, workspace_dir, limits, port_mappings)
+    get_node_registry().remember(docker_workspace_name, target)
+    bump_state_version()
     
     return container.id[:12]
 
 
 def list_workspaces() -> List[Dict]:
     """Получить список workspace'ов"""
+    containers, errors = get_node_registry().list_containers(all=True)
+    containers = [(node, c) for node, c in containers if not is_pool_member(c.name)]
+    data = _error_rows(errors)
     try:
-        containers = get_client().containers.list(all=True)
-    except Exception as e:
-        return [{'id': '-', 'name': 'ERROR', 'status': f'docker err: {e}', 'image': '-', 'created': '-'}]
-    
-    data = []
-    for c in containers:
+        from hibernation import hibernated_names
+        hibernated = hibernated_names([c.name for _, c in containers])
+    except Exception:
+        hibernated = set()
+    for node, c in containers:
         workspace_dir = os.path.join(cfg.BOTS_DIR, c.name)
         has_files = os.path.exists(workspace_dir)
         data.append({
             'id': c.id[:12],
             'name': c.name,
             'status': c.status,
-            'image': c.image.tags[0] if c.image.tags else c.image.short_id,
+            'image': _image_name(c),
             'created': c.attrs.get('Created'),
             'has_workspace': has_files,
-            'workspace_path': workspace_dir if has_files else None
+            'workspace_path': workspace_dir if has_files else None,
+            'node': node.name,
+            'hibernated': c.name in hibernated,
         })
     return data
 
 
 def get_available_images() -> List[str]:
-    """Получить список доступных Docker образов"""
+    """
+    Образы для формы создания workspace: загруженные на узлах (из кэша
+    каталога, обновляемого по событиям образов) и популярные
+    """
     try:
-        cli = get_client()
-        images = cli.images.list()
-        image_names = []
-        for img in images:
-            if img.tags:
-                image_names.extend(img.tags)
-            else:
-                image_names.append(img.short_id)
-        
-        # Добавляем популярные образы
-        popular_images = [
-            # Python окружения
-            'python:3.11-slim',
-            'python:3.12-slim', 
-            'python:3.13-slim',
-            'python:3.11-alpine',
-            'jupyter/base-notebook',
-            'jupyter/scipy-notebook',
-            
-            # Node.js окружения
-            'node:18-alpine',
-            'node:20-alpine',
-            'node:22-alpine',
-            'node:18-slim',
-            
-            # Веб-разработка
-            'nginx:alpine',
-            'nginx:latest',
-            'httpd:alpine',
-            'php:8.2-apache',
-            'php:8.3-fpm-alpine',
-            
-            # Базовые системы
-            'ubuntu:22.04',
-            'ubuntu:24.04', 
-            'debian:bookworm-slim',
-            'alpine:latest',
-            'centos:stream9',
-            
-            # Базы данных
-            'postgres:15-alpine',
-            'postgres:16-alpine',
-            'mysql:8.0',
-            'redis:alpine',
-            'mongodb:latest',
-            
-            # DevOps и инструменты
-            'golang:1.21-alpine',
-            'golang:1.22-alpine',
-            'rust:alpine',
-            'openjdk:17-alpine',
-            'openjdk:21-alpine',
-            
-            # Data Science
-            'tensorflow/tensorflow:latest',
-            'pytorch/pytorch:latest',
-            'continuumio/miniconda3'
-        ]
-        
-        return list(set(image_names + popular_images))
+        from image_catalog import get_image_catalog
+        return get_image_catalog().available()
     except Exception:
         return ['python:3.11-slim', 'ubuntu:22.04', 'alpine:latest']
 
@@ -522,7 +606,7 @@ def get_workspace_templates():
             'packages': ['npm install -g express react vue @angular/cli'],
             'setup_commands': [
                 'apk add --no-cache python3 py3-pip git curl nano',
-                'mkdir -p /workspace/{frontend,backend,database}',
+                'mkdir -p /workspace/frontend /workspace/backend /workspace/database',
                 'npm init -y'
             ]
         },
@@ -532,7 +616,7 @@ def get_workspace_templates():
             'description': 'Jupyter + pandas + sklearn + tensorflow',
             'packages': ['pip install pandas numpy matplotlib seaborn scikit-learn tensorflow'],
             'setup_commands': [
-                'mkdir -p /workspace/{data,notebooks,models,scripts}',
+                'mkdir -p /workspace/data /workspace/notebooks /workspace/models /workspace/scripts',
                 'jupyter notebook --generate-config'
             ]
         },
@@ -543,81 +627,96 @@ def get_workspace_templates():
             'packages': [],
             'setup_commands': [
                 'apk add --no-cache git curl wget bash vim nano docker-cli',
-                'mkdir -p /workspace/{scripts,configs,deployments}',
+                'mkdir -p /workspace/scripts /workspace/configs /workspace/deployments',
                 'echo "DevOps Workspace ready" > /workspace/status.txt'
             ]
         }
     }
 
 
-def create_workspace_from_template(template_key: str, workspace_name: str, port_mappings=None):
-    """Создать workspace из шаблона с предустановками"""
+def create_workspace_from_template(template_key: str, workspace_name: str, port_mappings=None, node=None):
+    """
+    Создать workspace из шаблона с предустановками. Если для шаблона есть
+    готовый контейнер в тёплом пуле (WARM_POOL), он выдаётся за секунды;
+    иначе контейнер создаётся и настраивается с нуля.
+    """
+    from template_images import get_template_images
+    from warm_pool import get_warm_pool
     templates = get_workspace_templates()
     if template_key not in templates:
         raise ValueError(f"Неизвестный шаблон: {template_key}")
     
     template = templates[template_key]
+    pool = get_warm_pool()
+    
+    # Проброс портов задаётся при создании контейнера — такие workspace только с нуля
+    if not port_mappings:
+        container_id = pool.claim(template_key, workspace_name, node)
+        if container_id:
+            return container_id
+    
+    if os.path.lexists(os.path.join(cfg.BOTS_DIR, workspace_name or '')):
+        raise ValueError('Каталог workspace уже существует')
+    
+    started = time.perf_counter()
+    # Узел выбираем заранее: на нём нужен образ шаблона с выполненной настройкой
+    target = _place(node, resource_run_kwargs(normalize_docker_name(workspace_name), 'workspace'))
+    images = get_template_images()
+    tag = images.ensure(target, template_key, template)
     
     # Создаем базовый workspace
     container_id = create_workspace(
         workspace_name=workspace_name,
-        base_image=template['image'],
-        port_mappings=port_mappings
+        base_image=tag or template['image'],
+        port_mappings=port_mappings,
+        node=target.name,
     )
     
     try:
-        cli = get_client()
-        container = cli.containers.get(container_id)
-        
-        # Выполняем команды настройки
-        for cmd in template['setup_commands']:
-            try:
-                result = container.exec_run(cmd, workdir='/workspace')
-                print(f"Setup command result: {result.output.decode()}")
-            except Exception as e:
-                print(f"Setup command failed: {e}")
-        
-        # Устанавливаем пакеты
-        for package_cmd in template['packages']:
-            try:
-                result = container.exec_run(package_cmd, workdir='/workspace')
-                print(f"Package install result: {result.output.decode()}")
-            except Exception as e:
-                print(f"Package install failed: {e}")
-                
-        return container_id
-        
+        images.provision(target.client.containers.get(container_id), template_key, template, tag)
     except Exception as e:
         print(f"Template setup failed: {e}")
-        return container_id  # Возвращаем базовый workspace
+    pool.record_cold(template_key, time.perf_counter() - started)
+    return container_id  # При ошибке настройки — базовый workspace
 
 
 def exec_command(container_name: str, cmd: str):
-    container = get_client().containers.get(container_name)
-    exec_id = get_client().api.exec_create(container.id, cmd, tty=True, stdin=True)
+    cli = client_for(container_name)
+    container = cli.containers.get(container_name)
+    exec_id = cli.api.exec_create(container.id, cmd, tty=True, stdin=True)
     return exec_id['Id']
 
 
 def get_bot_logs(name: str, tail: int = 100) -> str:
     """Получить логи контейнера"""
-    from exec_backend import get_backend
-    backend = get_backend()
+    backend = _backend_for(name)
     
+    tail = max(1, min(int(tail), cfg.LOG_MAX_TAIL))
     stdout, stderr, exit_code = backend.run(f"docker logs --tail {tail} --timestamps {name}")
     if exit_code != 0:
         return f"Ошибка получения логов: {stderr}"
     return stdout
 
 
+def _supervisor_info(name: str) -> Optional[Dict]:
+    try:
+        from supervisor import get_supervisor
+        return get_supervisor().describe(name)
+    except Exception:
+        return None
+
+
 def get_bot_info(name: str) -> Dict:
     """Получить детальную информацию о контейнере"""
     try:
-        container = get_client().containers.get(name)
+        node = get_node_registry().locate(name)
+        container = node.client.containers.get(name)
         attrs = container.attrs
         
         info = {
             'id': container.id,
             'name': container.name,
+            'node': node.name,
             'status': container.status,
             'image': container.image.tags[0] if container.image.tags else container.image.short_id,
             'created': attrs.get('Created'),
@@ -628,7 +727,15 @@ def get_bot_info(name: str) -> Dict:
             'working_dir': attrs.get('Config', {}).get('WorkingDir'),
             'env_vars': len(attrs.get('Config', {}).get('Env', [])),
             'restart_policy': attrs.get('HostConfig', {}).get('RestartPolicy', {}).get('Name'),
+            'supervisor': _supervisor_info(container.name),
             'network_mode': attrs.get('HostConfig', {}).get('NetworkMode'),
+            'resources': {
+                'mem_limit': attrs.get('HostConfig', {}).get('Memory') or None,
+                'nano_cpus': attrs.get('HostConfig', {}).get('NanoCpus') or None,
+                'cpuset_cpus': attrs.get('HostConfig', {}).get('CpusetCpus') or None,
+                'pids_limit': attrs.get('HostConfig', {}).get('PidsLimit') or None,
+                'blkio_weight': attrs.get('HostConfig', {}).get('BlkioWeight') or None,
+            },
         }
         
         # Добавляем статистику использования ресурсов
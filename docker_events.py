@@ -0,0 +1,180 @@
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import cfg
+import metrics
+
+# Действия, после которых меняется то, что показывают дашборд и список ботов
+_LIFECYCLE_ACTIONS = {'create', 'start', 'restart', 'die', 'stop', 'destroy', 'pause', 'unpause',
+                      'rename', 'update', 'oom'}
+
+DOCKER_EVENTS = metrics.Counter('bot_manager_docker_events_total',
+                                'События Docker по управляемым контейнерам', ('action',))
+
+
+def event_action(event: Dict) -> str:
+    """'health_status: unhealthy' -> 'health_status'"""
+    return (event.get('Action') or event.get('status') or '').split(':', 1)[0]
+
+
+def event_attributes(event: Dict) -> Dict[str, str]:
+    return (event.get('Actor') or {}).get('Attributes') or {}
+
+
+def event_container(event: Dict) -> Optional[str]:
+    return event_attributes(event).get('name')
+
+
+class DockerEventDispatcher:
+    """
+    По потоку на Docker-узел читает ``docker events`` по управляемым
+    контейнерам (label bot-manager=1) и раздаёт события подписчикам — вместо
+    опроса каждого контейнера. После обрыва соединения поток переподключается
+    с задержкой и запрашивает события с момента последнего полученного на этом
+    узле (``since``), так что за время разрыва ничего не теряется; повторы
+    отбрасываются. Узел события — в ключе ``'node'``.
+
+    Подписчики вызываются в потоке чтения и должны возвращаться быстро.
+    Второй экземпляр с ``filters={'type': 'image'}`` читает события образов
+    (pull, tag, untag, delete) — для кэша каталога образов.
+    """
+
+    def __init__(self, filters: Optional[Dict] = None, kind: str = 'container'):
+        self.filters = filters or {'type': 'container', 'label': 'bot-manager=1'}
+        self.kind = kind
+        self._subscribers: List[Tuple[Callable[[Dict], None], Optional[frozenset]]] = []
+        self._threads: Dict[str, threading.Thread] = {}
+        self._last_nano: Dict[str, int] = {}
+        self._recent = deque(maxlen=256)
+        self._connected: Dict[str, bool] = {}
+        self._errors: Dict[str, Optional[str]] = {}
+        self._dispatch_lock = threading.Lock()
+        self.events = 0
+        self.last_event_at: Optional[float] = None
+
+    def subscribe(self, callback: Callable[[Dict], None], actions: Optional[Iterable[str]] = None):
+        """Подписаться на события (``actions`` — без суффикса, например 'health_status')"""
+        self._subscribers.append((callback, frozenset(actions) if actions else None))
+
+    @property
+    def connected(self) -> bool:
+        return bool(self._connected) and all(self._connected.values())
+
+    @property
+    def last_error(self) -> Optional[str]:
+        errors = [f'{node}: {error}' if len(self._errors) > 1 else error
+                  for node, error in self._errors.items() if error]
+        return '; '.join(errors) or None
+
+    def start(self):
+        from nodes import get_node_registry
+        for node in get_node_registry().nodes():
+            if node.name not in self._threads:
+                prefix = 'docker-events' if self.kind == 'container' else f'docker-{self.kind}-events'
+                thread = threading.Thread(target=self._loop, args=(node,), daemon=True,
+                                          name=f'{prefix}-{node.name}')
+                self._threads[node.name] = thread
+                self._connected[node.name] = False
+                thread.start()
+
+    def _loop(self, node):
+        delay = cfg.DOCKER_EVENTS_RETRY_DELAY
+        while True:
+            try:
+                kwargs = {'decode': True, 'filters': self.filters}
+                if self._last_nano.get(node.name):
+                    kwargs['since'] = self._last_nano[node.name] // 1_000_000_000
+                stream = node.client.events(**kwargs)
+                self._connected[node.name] = True
+                self._errors[node.name] = None
+                delay = cfg.DOCKER_EVENTS_RETRY_DELAY
+                try:
+                    for event in stream:
+                        event['node'] = node.name
+                        self._dispatch(event)
+                finally:
+                    stream.close()
+            except Exception as e:
+                if str(e) != self._errors.get(node.name):
+                    print(f"[docker_events] поток событий {self.kind} {node.name} прерван: {e}")
+                self._errors[node.name] = str(e)
+            self._connected[node.name] = False
+            time.sleep(delay)
+            delay = min(delay * 2, cfg.DOCKER_EVENTS_RETRY_MAX_DELAY)
+
+    def _dispatch(self, event: Dict):
+        nano = event.get('timeNano') or int(event.get('time', 0) * 1_000_000_000)
+        node = event.get('node', '')
+        key = (nano, event.get('id'), event.get('Action'))
+        with self._dispatch_lock:
+            # since округляется до секунды: события этой секунды приходят повторно
+            if nano < self._last_nano.get(node, 0) or key in self._recent:
+                return
+            self._recent.append(key)
+            self._last_nano[node] = nano
+            self.events += 1
+            self.last_event_at = time.time()
+
+        action = event_action(event)
+        if self.kind == 'container':
+            self._track_container(event, node, action)
+        for callback, actions in list(self._subscribers):
+            if actions is not None and action not in actions:
+                continue
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"[docker_events] ошибка обработчика {getattr(callback, '__qualname__', callback)}: {e}")
+
+    def _track_container(self, event: Dict, node: str, action: str):
+        """Карта расположения контейнеров по узлам и версия состояния для дашборда"""
+        DOCKER_EVENTS.inc((action,))
+        if node and action in ('create', 'start', 'destroy', 'rename'):
+            from nodes import get_node_registry
+            registry = get_node_registry()
+            if action == 'destroy':
+                registry.forget(event_container(event))
+            elif action == 'rename':
+                registry.forget(event_attributes(event).get('oldName', '').lstrip('/'))
+            if action != 'destroy' and registry.multi:
+                registry.remember(event_container(event), registry.get(node))
+        if action in _LIFECYCLE_ACTIONS:
+            from docker_api import bump_state_version
+            bump_state_version()
+
+    def status(self) -> Dict:
+        status = {
+            'connected': self.connected,
+            'events': self.events,
+            'last_event_at': datetime.utcfromtimestamp(self.last_event_at).isoformat() + 'Z'
+            if self.last_event_at else None,
+            'error': self.last_error,
+        }
+        if len(self._connected) > 1:
+            status['nodes'] = {name: {'connected': connected, 'error': self._errors.get(name)}
+                               for name, connected in self._connected.items()}
+        return status
+
+
+_dispatcher_singleton: Optional[DockerEventDispatcher] = None
+
+
+def get_event_dispatcher() -> DockerEventDispatcher:
+    global _dispatcher_singleton
+    if _dispatcher_singleton is None:
+        _dispatcher_singleton = DockerEventDispatcher()
+    return _dispatcher_singleton
+
+
+_image_dispatcher_singleton: Optional[DockerEventDispatcher] = None
+
+
+def get_image_event_dispatcher() -> DockerEventDispatcher:
+    """События образов всех узлов (pull, tag, untag, delete)"""
+    global _image_dispatcher_singleton
+    if _image_dispatcher_singleton is None:
+        _image_dispatcher_singleton = DockerEventDispatcher({'type': 'image'}, kind='image')
+    return _image_dispatcher_singleton
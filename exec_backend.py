@@ -1,4 +1,5 @@
 import os
+import shlex
 import subprocess
 import threading
 from dataclasses import dataclass
@@ -10,6 +11,8 @@ except ImportError:  # graceful degradation
     paramiko = None
 
 from config import cfg
+from metrics import timed_exec
+from profiler import profiled
 
 
 class ExecError(Exception):
@@ -25,6 +28,8 @@ class IExecBackend(Protocol):
 class LocalBackend:
     shell: str = '/bin/bash'
 
+    @timed_exec('local')
+    @profiled('exec', 'LocalBackend.run')
     def run(self, command: str, timeout: int = 30) -> Tuple[str, str, int]:
         try:
             result = subprocess.run(
@@ -77,6 +82,8 @@ class SSHBackend:
         except Exception as e:
             raise ExecError(f'SSH key error: {e}')
 
+    @timed_exec('ssh')
+    @profiled('exec', 'SSHBackend.run')
     def run(self, command: str, timeout: int = 30) -> Tuple[str, str, int]:
         client = None
         try:
@@ -114,6 +121,16 @@ class SSHBackend:
                 client.close()
 
 
+@dataclass
+class DockerHostBackend:
+    """Команды через base, но docker CLI в них обращается к другому Docker-узлу"""
+    base: IExecBackend
+    docker_host: str
+
+    def run(self, command: str, timeout: int = 30) -> Tuple[str, str, int]:
+        return self.base.run(f'export DOCKER_HOST={shlex.quote(self.docker_host)}; {command}', timeout=timeout)
+
+
 _backend_singleton: Optional[IExecBackend] = None
 
 
@@ -0,0 +1,122 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from config import cfg
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z' if ts else None
+
+
+def check_database():
+    from sqlalchemy import text
+    from auth import engine
+    with engine.connect() as conn:
+        conn.execute(text('SELECT 1'))
+
+
+def check_docker():
+    from docker_api import get_client
+    get_client().ping()
+
+
+def check_docker_nodes():
+    """Все узлы DOCKER_NODES отвечают (по умолчанию не входит в HEALTH_REQUIRED)"""
+    from nodes import get_node_registry
+    errors = [f'{node.name}: {error}' for node, _, error in
+              get_node_registry().fan_out(lambda node: node.client.ping()) if error is not None]
+    if errors:
+        raise RuntimeError('; '.join(errors))
+
+
+class HealthChecker:
+    """
+    Фоновая проверка зависимостей для /ready.
+
+    Каждые ``interval`` секунд выполняет лёгкие проверки (ping Docker,
+    SELECT 1 в базе) и сохраняет результат с задержкой. Эндпоинт отдаёт
+    сохранённое состояние, поэтому частые опросы балансировщика не
+    создают нагрузку на Docker и базу. Если результаты старше трёх
+    интервалов (поток проверок завис), сервис считается неготовым.
+    """
+
+    def __init__(self, checks: Dict[str, Callable[[], object]], interval: float,
+                 required: Optional[List[str]] = None):
+        self.checks = checks
+        self.interval = interval
+        required = [name.strip() for name in required] if required is not None else list(checks)
+        unknown = [name for name in required if name not in checks]
+        if unknown:
+            # Опечатка или проверка, не включённая в этой конфигурации (docker_nodes без DOCKER_NODES)
+            print(f"[health] HEALTH_REQUIRED: неизвестные проверки {', '.join(unknown)} пропущены; "
+                  f"доступны: {', '.join(checks)}")
+        self.required = [name for name in required if name in checks]
+        self._results: Dict[str, dict] = {
+            name: {'status': 'unknown', 'latency_ms': None, 'error': None, 'checked_at': None}
+            for name in checks
+        }
+        self._last_run: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, daemon=True, name='health-checker')
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            self.run_once()
+            time.sleep(self.interval)
+
+    def run_once(self):
+        for name, check in self.checks.items():
+            started = time.perf_counter()
+            try:
+                check()
+                status, error = 'ok', None
+            except Exception as e:
+                status, error = 'error', str(e)
+            self._results[name] = {
+                'status': status,
+                'latency_ms': round((time.perf_counter() - started) * 1000, 2),
+                'error': error,
+                'checked_at': time.time(),
+            }
+        self._last_run = time.time()
+
+    def snapshot(self) -> Dict:
+        now = time.time()
+        stale = self._last_run is None or now - self._last_run > self.interval * 3
+        components = {
+            name: dict(result, checked_at=_iso(result['checked_at']))
+            for name, result in self._results.items()
+        }
+        ready = not stale and all(self._results.get(name, {}).get('status') == 'ok'
+                                    for name in self.required)
+        return {
+            'ready': ready,
+            'stale': stale,
+            'checked_at': _iso(self._last_run),
+            'interval': self.interval,
+            'components': components,
+        }
+
+
+_checker_singleton: Optional[HealthChecker] = None
+
+
+def get_health_checker() -> HealthChecker:
+    global _checker_singleton
+    if _checker_singleton is None:
+        from nodes import get_node_registry
+        checks = {'database': check_database, 'docker': check_docker}
+        if get_node_registry().multi:
+            checks['docker_nodes'] = check_docker_nodes
+        _checker_singleton = HealthChecker(
+            checks,
+            interval=cfg.HEALTH_CHECK_INTERVAL,
+            required=cfg.HEALTH_REQUIRED,
+        )
+    return _checker_singleton
@@ -0,0 +1,297 @@
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from config import cfg
+import metrics
+from docker_events import event_container, get_event_dispatcher
+from warm_pool import is_pool_member
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+MODES = ('stop', 'pause')
+_FRACTION = re.compile(r'(\.\d{6})\d*')
+
+HIBERNATIONS = metrics.Counter('bot_manager_workspace_hibernations_total',
+                               'Workspace, усыплённые по простою', ('mode',))
+RESUME_SECONDS = metrics.Histogram('bot_manager_workspace_resume_seconds',
+                                   'Время пробуждения усыплённого workspace', ('mode',),
+                                   buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+
+def _docker_time(value: Optional[str]) -> float:
+    """'2026-10-19T11:47:23.526012345Z' -> unix-время (0 — не запускался)"""
+    if not value or value.startswith('0001-'):
+        return 0.0
+    try:
+        return datetime.fromisoformat(_FRACTION.sub(r'\1', value.replace('Z', '+00:00'))) \
+            .astimezone(timezone.utc).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z' if ts else None
+
+
+class Hibernator:
+    """
+    Усыпление простаивающих workspace и прозрачное пробуждение.
+
+    Активность (ввод в терминале, exec через API) отмечается в памяти и не
+    чаще HIBERNATE_TOUCH_PERSIST секунд — в базе, поэтому её видят все
+    воркеры. Раз в HIBERNATE_CHECK_INTERVAL один процесс (блокировка файла
+    в каталоге логов) проверяет запущенные workspace: без активности дольше
+    HIBERNATE_IDLE_SECONDS контейнер останавливается или замораживается и
+    помечается усыплённым. Открытие терминала или exec будит его и сообщает,
+    сколько заняло пробуждение. Ручной запуск снимает отметку.
+
+    Когда усыпление выключено, новых усыплённых не появляется: wake сверяется
+    с загруженным один раз набором усыплённых имён и не обращается к базе.
+    """
+
+    def __init__(self):
+        self._activity: Dict[str, float] = {}
+        self._persisted: Dict[str, float] = {}
+        self._wake_locks: Dict[str, threading.Lock] = {}
+        self._hibernated: Optional[Set[str]] = None  # усыплённые, по данным этого процесса
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._subscribed = False
+        self.started_at = time.time()
+        self.leader = False
+        self.started = False
+        self.last_sweep_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def mode(self) -> str:
+        return cfg.HIBERNATE_MODE if cfg.HIBERNATE_MODE in MODES else 'stop'
+
+    # --- Активность и пробуждение ----------------------------------------------
+
+    def touch(self, name: str):
+        """Отметить активность в workspace (терминал, exec)"""
+        now = time.time()
+        self._activity[name] = now
+        if now - self._persisted.get(name, 0) < cfg.HIBERNATE_TOUCH_PERSIST:
+            return
+        self._persisted[name] = now
+        try:
+            from auth import touch_workspace_activity
+            touch_workspace_activity(name, now)
+        except Exception as e:
+            print(f"[hibernation] {name}: активность не записана: {e}")
+
+    def _known_hibernated(self) -> Set[str]:
+        """Усыплённые workspace: из базы при первом обращении, дальше — по своим изменениям"""
+        if self._hibernated is None:
+            from auth import load_workspace_activity
+            names = {name for name, row in load_workspace_activity().items() if row.hibernated_at is not None}
+            with self._lock:
+                if self._hibernated is None:
+                    self._hibernated = names
+        return self._hibernated
+
+    def _forget(self, name: str):
+        with self._lock:
+            if self._hibernated is not None:
+                self._hibernated.discard(name)
+
+    def wake(self, name: str) -> Optional[Dict]:
+        """
+        Отметить активность и разбудить workspace, если он усыплён менеджером.
+        Возвращает {'mode', 'resume_ms'} после пробуждения, иначе None.
+        """
+        if cfg.HIBERNATE_IDLE_SECONDS <= 0 and name not in self._known_hibernated():
+            return None
+        from auth import load_workspace_activity, mark_workspace_awake
+        self.touch(name)
+        state = load_workspace_activity([name]).get(name)
+        if state is None or state.hibernated_at is None:
+            self._forget(name)
+            return None
+        with self._lock:
+            lock = self._wake_locks.setdefault(name, threading.Lock())
+        with lock:
+            # Пока ждали блокировку, его мог разбудить соседний запрос
+            state = load_workspace_activity([name]).get(name)
+            if state is None or state.hibernated_at is None:
+                self._forget(name)
+                return None
+            from docker_api import bump_state_version, client_for
+            started = time.perf_counter()
+            container = client_for(name).containers.get(name)
+            if container.status == 'paused':
+                container.unpause()
+            elif container.status != 'running':
+                container.start()
+            elapsed = time.perf_counter() - started
+            resume_ms = round(elapsed * 1000)
+            mark_workspace_awake(name, resume_ms)
+            self._forget(name)
+            mode = state.mode or 'stop'
+            RESUME_SECONDS.observe((mode,), elapsed)
+            bump_state_version()
+        print(f"[hibernation] {name}: разбужен за {resume_ms} мс ({mode})")
+        return {'mode': mode, 'resume_ms': resume_ms}
+
+    # --- Усыпление --------------------------------------------------------------
+
+    def sweep(self) -> List[str]:
+        """Усыпить запущенные workspace без активности дольше HIBERNATE_IDLE_SECONDS"""
+        from auth import load_workspace_activity
+        from nodes import get_node_registry
+        if cfg.HIBERNATE_IDLE_SECONDS <= 0:
+            return []
+        containers, errors = get_node_registry().list_containers(
+            filters={'label': ['bot-manager=1', 'workspace=1']})
+        for node, error in errors.items():
+            print(f"[hibernation] узел {node} пропущен: {error}")
+        stored = load_workspace_activity([c.name for _, c in containers])
+        now = time.time()
+        hibernated = []
+        for _, container in containers:
+            if container.status != 'running' or is_pool_member(container.name):
+                continue
+            state = stored.get(container.name)
+            # После старта менеджера (или контейнера) отсчёт простоя начинается заново
+            last = max(self.started_at, self._activity.get(container.name, 0),
+                       (state.last_activity_at or 0) if state else 0,
+                       _docker_time((container.attrs.get('State') or {}).get('StartedAt')))
+            if now - last < cfg.HIBERNATE_IDLE_SECONDS:
+                continue
+            try:
+                self.hibernate(container, idle=now - last)
+                hibernated.append(container.name)
+            except Exception as e:
+                print(f"[hibernation] {container.name}: не удалось усыпить: {e}")
+        self.last_sweep_at = now
+        return hibernated
+
+    def hibernate(self, container, idle: Optional[float] = None):
+        from auth import mark_workspace_hibernated
+        from docker_api import _expect_stop, bump_state_version
+        mode = self.mode
+        if mode == 'pause':
+            container.pause()
+        else:
+            _expect_stop(container.name)
+            container.stop(timeout=cfg.HIBERNATE_STOP_TIMEOUT)
+        mark_workspace_hibernated(container.name, mode, time.time())
+        with self._lock:
+            if self._hibernated is not None:
+                self._hibernated.add(container.name)
+        HIBERNATIONS.inc((mode,))
+        bump_state_version()
+        idle_text = f' после {int(idle // 60)} мин простоя' if idle is not None else ''
+        print(f"[hibernation] {container.name}: усыплён ({mode}){idle_text}")
+
+    # --- Запуск -----------------------------------------------------------------
+
+    def _acquire_process_lock(self) -> bool:
+        if not fcntl:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(cfg.LOGS_DIR, 'hibernation.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """Шаг инициализации: подписка на события и фоновая проверка простоя (в одном процессе)"""
+        if self.started:
+            return
+        if cfg.HIBERNATE_MODE not in MODES:
+            print(f"[hibernation] неизвестный HIBERNATE_MODE={cfg.HIBERNATE_MODE!r}, используется 'stop'")
+        self.leader = self._acquire_process_lock()
+        if self.leader and not self._subscribed:
+            get_event_dispatcher().subscribe(self._on_event, ('start', 'unpause', 'destroy'))
+            get_event_dispatcher().start()
+            self._subscribed = True
+            threading.Thread(target=self._loop, daemon=True, name='hibernation').start()
+        self.started = True
+        print(f"[hibernation] запущен ({'усыпляет' if self.leader else 'только будит'} workspace, "
+              f"простой {cfg.HIBERNATE_IDLE_SECONDS:g} с, режим {self.mode})")
+
+    def _on_event(self, event: Dict):
+        """Запуск не через пробуждение (кнопка Start, docker start) снимает отметку усыпления"""
+        name = event_container(event)
+        if not name or (event.get('Actor') or {}).get('Attributes', {}).get('workspace') != '1':
+            return
+        self._forget(name)
+        try:
+            from auth import delete_workspace_activity, mark_workspace_awake
+            if (event.get('Action') or event.get('status')) == 'destroy':
+                self._activity.pop(name, None)
+                self._persisted.pop(name, None)
+                delete_workspace_activity(name)
+            else:
+                mark_workspace_awake(name)
+        except Exception as e:
+            print(f"[hibernation] {name}: ошибка обработки события: {e}")
+
+    def _loop(self):
+        while True:
+            time.sleep(cfg.HIBERNATE_CHECK_INTERVAL)
+            try:
+                self.sweep()
+                self.last_error = None
+            except Exception as e:
+                if str(e) != self.last_error:
+                    print(f"[hibernation] ошибка проверки простоя: {e}")
+                self.last_error = str(e)
+
+    def status(self) -> Dict:
+        from auth import load_workspace_activity
+        now = time.time()
+        workspaces = []
+        for name, row in sorted(load_workspace_activity().items()):
+            last = max(row.last_activity_at or 0, self._activity.get(name, 0)) or None
+            workspaces.append({
+                'name': name,
+                'last_activity_at': _iso(last),
+                'idle_seconds': round(now - last) if last else None,
+                'hibernated': row.hibernated_at is not None,
+                'hibernated_at': _iso(row.hibernated_at),
+                'mode': row.mode,
+                'hibernate_count': row.hibernate_count,
+                'resume_count': row.resume_count,
+                'last_resume_ms': row.last_resume_ms,
+            })
+        return {
+            'enabled': cfg.HIBERNATE_IDLE_SECONDS > 0,
+            'idle_seconds': cfg.HIBERNATE_IDLE_SECONDS,
+            'mode': self.mode,
+            'leader': self.leader,
+            'last_sweep_at': _iso(self.last_sweep_at),
+            'error': self.last_error,
+            'workspaces': workspaces,
+        }
+
+
+_hibernator_singleton: Optional[Hibernator] = None
+
+
+def get_hibernator() -> Hibernator:
+    global _hibernator_singleton
+    if _hibernator_singleton is None:
+        _hibernator_singleton = Hibernator()
+    return _hibernator_singleton
+
+
+def hibernated_names(names) -> set:
+    """Имена из names, усыплённые менеджером (для списков контейнеров)"""
+    from auth import load_workspace_activity
+    return {name for name, row in load_workspace_activity(names).items() if row.hibernated_at is not None}
@@ -0,0 +1,356 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from config import cfg
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+# Предлагаются в форме создания workspace, даже если ещё не загружены
+POPULAR_IMAGES = [
+    # Python окружения
+    'python:3.11-slim',
+    'python:3.12-slim',
+    'python:3.13-slim',
+    'python:3.11-alpine',
+    'jupyter/base-notebook',
+    'jupyter/scipy-notebook',
+
+    # Node.js окружения
+    'node:18-alpine',
+    'node:20-alpine',
+    'node:22-alpine',
+    'node:18-slim',
+
+    # Веб-разработка
+    'nginx:alpine',
+    'nginx:latest',
+    'httpd:alpine',
+    'php:8.2-apache',
+    'php:8.3-fpm-alpine',
+
+    # Базовые системы
+    'ubuntu:22.04',
+    'ubuntu:24.04',
+    'debian:bookworm-slim',
+    'alpine:latest',
+    'centos:stream9',
+
+    # Базы данных
+    'postgres:15-alpine',
+    'postgres:16-alpine',
+    'mysql:8.0',
+    'redis:alpine',
+    'mongodb:latest',
+
+    # DevOps и инструменты
+    'golang:1.21-alpine',
+    'golang:1.22-alpine',
+    'rust:alpine',
+    'openjdk:17-alpine',
+    'openjdk:21-alpine',
+
+    # Data Science
+    'tensorflow/tensorflow:latest',
+    'pytorch/pytorch:latest',
+    'continuumio/miniconda3',
+]
+
+PULL_SECONDS = metrics.Histogram('bot_manager_image_pull_seconds', 'Фоновая загрузка образов заранее', ('result',),
+                                 buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+
+def normalize_ref(ref: str) -> str:
+    """'alpine' -> 'alpine:latest' (так образ называется в списке тегов Docker)"""
+    if '@' in ref or ':' in ref.rsplit('/', 1)[-1]:
+        return ref
+    return ref + ':latest'
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z' if ts else None
+
+
+class ImageCatalog:
+    """
+    Кэш списков образов узлов. Сбрасывается по событиям образов Docker
+    (pull, tag, untag, delete, load) и перечитывается при следующем обращении
+    одним запросом списка на узел, без inspect каждого образа. Пока поток
+    событий не подключён, кэш живёт не дольше IMAGE_CATALOG_TTL секунд.
+    """
+
+    def __init__(self):
+        self._tags: Dict[str, Set[str]] = {}  # узел -> теги образов
+        self._untagged: Dict[str, List[str]] = {}
+        self._dirty = True
+        self._loaded_at = 0.0
+        self._refresh_lock = threading.Lock()
+        self.started = False
+        self.refreshes = 0
+        self.last_error: Optional[str] = None
+
+    def start(self):
+        """Шаг инициализации: подписка на события образов всех узлов"""
+        from docker_events import get_image_event_dispatcher
+        if self.started:
+            return
+        dispatcher = get_image_event_dispatcher()
+        dispatcher.subscribe(self.invalidate)
+        dispatcher.start()
+        self.started = True
+
+    def invalidate(self, event: Optional[Dict] = None):
+        self._dirty = True
+
+    def _fresh(self) -> bool:
+        from docker_events import get_image_event_dispatcher
+        if self._dirty:
+            return False
+        if self.started and get_image_event_dispatcher().connected:
+            return True
+        return time.time() - self._loaded_at < cfg.IMAGE_CATALOG_TTL
+
+    def snapshot(self) -> Dict[str, Set[str]]:
+        """Теги образов по узлам (из кэша или свежие)"""
+        from nodes import get_node_registry
+        if self._fresh():
+            return self._tags
+        with self._refresh_lock:
+            if self._fresh():
+                return self._tags
+            # Событие во время чтения списков снова пометит кэш устаревшим
+            self._dirty = False
+            results = get_node_registry().fan_out(lambda node: node.client.api.images())
+            if all(error is not None for _, _, error in results):
+                self._dirty = True
+                self.last_error = str(results[0][2])
+                raise results[0][2]
+            tags, untagged = {}, {}
+            for node, summaries, error in results:
+                if error is not None:
+                    continue
+                tags[node.name] = {tag for s in summaries for tag in (s.get('RepoTags') or [])
+                                   if tag != '<none>:<none>'}
+                untagged[node.name] = [s['Id'].split(':', 1)[-1][:12] for s in summaries
+                                       if not [t for t in (s.get('RepoTags') or []) if t != '<none>:<none>']]
+            self._tags, self._untagged = tags, untagged
+            self._loaded_at = time.time()
+            self.refreshes += 1
+            self.last_error = None
+        return self._tags
+
+    def has(self, node_name: str, ref: str) -> bool:
+        return normalize_ref(ref) in self.snapshot().get(node_name, ())
+
+    def local_names(self) -> Set[str]:
+        """Образы, загруженные хотя бы на одном узле"""
+        return set().union(*self.snapshot().values())
+
+    def not_pulled(self) -> List[str]:
+        """Популярные образы, которых нет ни на одном узле (создание с ними начнётся с загрузки)"""
+        local = self.local_names()
+        return [ref for ref in POPULAR_IMAGES if normalize_ref(ref) not in local]
+
+    def available(self) -> List[str]:
+        """Для формы: загруженные образы по алфавиту, затем популярные, которых ещё нет, затем без тегов"""
+        names = sorted(self.local_names()) + self.not_pulled()
+        for ids in self._untagged.values():
+            names += ids
+        return list(dict.fromkeys(names))
+
+    def status(self) -> Dict:
+        from docker_events import get_image_event_dispatcher
+        tags = self.snapshot()
+        return {
+            'events': get_image_event_dispatcher().status() if self.started else None,
+            'loaded_at': _iso(self._loaded_at),
+            'refreshes': self.refreshes,
+            'error': self.last_error,
+            'nodes': {node: sorted(names) for node, names in tags.items()},
+        }
+
+
+class ImagePrepuller:
+    """
+    Фоновая загрузка образов из IMAGE_PREPULL на все узлы, чтобы первое
+    создание контейнера не ждало скачивания из реестра. Не больше
+    IMAGE_PREPULL_CONCURRENCY загрузок одновременно; проверка — при запуске,
+    раз в IMAGE_PREPULL_INTERVAL и после удаления образа. Загружает один
+    процесс (блокировка файла в каталоге логов).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._lock_file = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Set[tuple] = set()
+        self._state: Dict[tuple, Dict] = {}  # (узел, образ) -> состояние
+        self._removed: Set[str] = set()  # узлы, где удалён образ: проверить список заново
+        self.leader = False
+        self.started = False
+        self.last_check_at: Optional[float] = None
+
+    def images(self) -> List[str]:
+        """Образы из IMAGE_PREPULL с раскрытыми '@templates' и '@default'"""
+        refs = []
+        for item in cfg.IMAGE_PREPULL:
+            if item == '@templates':
+                from docker_api import get_workspace_templates
+                refs += [template['image'] for template in get_workspace_templates().values()]
+            elif item == '@default':
+                refs.append(cfg.BOT_DEFAULT_IMAGE)
+            else:
+                refs.append(item)
+        return list(dict.fromkeys(normalize_ref(ref) for ref in refs))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, cfg.IMAGE_PREPULL_CONCURRENCY),
+                                                thread_name_prefix='image-prepull')
+        return self._executor
+
+    def schedule(self, nodes: Optional[Set[str]] = None) -> int:
+        """
+        Поставить в очередь недостающие образы на всех узлах или только на nodes;
+        в последнем случае (после удаления образа) неудачные загрузки не
+        повторяются — до очередной проверки по интервалу. Возвращает число новых загрузок.
+        """
+        from nodes import get_node_registry
+        tags = get_image_catalog().snapshot()
+        refs = self.images()
+        queued = 0
+        for node in get_node_registry().nodes():
+            if node.name not in tags or nodes is not None and node.name not in nodes:
+                continue  # узел недоступен — до следующей проверки
+            for ref in refs:
+                key = (node.name, ref)
+                with self._lock:
+                    if key in self._inflight:
+                        continue
+                    if nodes is not None and self._state.get(key, {}).get('state') == 'error':
+                        continue
+                    if ref in tags[node.name] and not cfg.IMAGE_PREPULL_UPDATE:
+                        if self._state.get(key, {}).get('state') != 'ready':
+                            self._state[key] = {'state': 'present'}
+                        continue
+                    self._inflight.add(key)
+                    self._state[key] = {**self._state.get(key, {}), 'state': 'queued', 'queued_at': time.time()}
+                self._pool().submit(self._pull, node, ref)
+                queued += 1
+        self.last_check_at = time.time()
+        return queued
+
+    def _pull(self, node, ref: str):
+        from docker.utils import parse_repository_tag
+        key = (node.name, ref)
+        started = time.perf_counter()
+        with self._lock:
+            self._state[key].update(state='pulling', started_at=time.time())
+        try:
+            repository, tag = parse_repository_tag(ref)
+            for line in node.client.api.pull(repository, tag=tag or 'latest', stream=True, decode=True):
+                if line.get('error'):
+                    raise RuntimeError(line['error'])
+            elapsed = time.perf_counter() - started
+            PULL_SECONDS.observe(('ok',), elapsed)
+            with self._lock:
+                self._state[key].update(state='ready', seconds=round(elapsed, 1), error=None,
+                                        pulled_at=time.time())
+            print(f"[image_prepull] {ref}: загружен на узел {node.name} за {elapsed:.1f} с")
+        except Exception as e:
+            PULL_SECONDS.observe(('error',), time.perf_counter() - started)
+            with self._lock:
+                self._state[key].update(state='error', error=str(e))
+            print(f"[image_prepull] {ref}: загрузка на узел {node.name} не удалась: {e}")
+        finally:
+            with self._lock:
+                self._inflight.discard(key)
+            get_image_catalog().invalidate()
+
+    def _acquire_process_lock(self) -> bool:
+        if not fcntl:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(cfg.LOGS_DIR, 'image_prepull.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """Шаг инициализации: фоновая загрузка образов (в одном процессе)"""
+        from docker_events import get_image_event_dispatcher
+        if self.started:
+            return
+        self.leader = self._acquire_process_lock()
+        if self.leader:
+            # Удалённый вручную образ из списка загружается снова, не дожидаясь интервала
+            get_image_event_dispatcher().subscribe(self._on_removed, ('untag', 'delete'))
+            threading.Thread(target=self._loop, daemon=True, name='image-prepull').start()
+        self.started = True
+        print(f"[image_prepull] запущен ({'загружает' if self.leader else 'только статус'}: "
+              f"{', '.join(self.images())}; одновременно {cfg.IMAGE_PREPULL_CONCURRENCY})")
+
+    def _on_removed(self, event: Dict):
+        # dockerd передаёт в untag/delete id образа, а не снятый тег, поэтому
+        # список образов узла перечитывается и проверяется весь IMAGE_PREPULL
+        get_image_catalog().invalidate()
+        with self._lock:
+            self._removed.add(event.get('node', ''))
+        self._wake.set()
+
+    def _loop(self):
+        nodes = None
+        while True:
+            try:
+                self.schedule(nodes)
+            except Exception as e:
+                print(f"[image_prepull] ошибка проверки образов: {e}")
+            woken = self._wake.wait(cfg.IMAGE_PREPULL_INTERVAL)
+            self._wake.clear()
+            # По событию — узлы, где удалён образ, по интервалу — все (и повтор неудачных)
+            with self._lock:
+                nodes, self._removed = (self._removed if woken else None), set()
+
+    def status(self) -> Dict:
+        with self._lock:
+            images = [{'node': node, 'image': ref, **{k: _iso(v) if k.endswith('_at') else v
+                                                      for k, v in state.items()}}
+                      for (node, ref), state in sorted(self._state.items())]
+        return {
+            'enabled': bool(cfg.IMAGE_PREPULL),
+            'leader': self.leader,
+            'concurrency': cfg.IMAGE_PREPULL_CONCURRENCY,
+            'last_check_at': _iso(self.last_check_at),
+            'images': images,
+        }
+
+
+_catalog_singleton: Optional[ImageCatalog] = None
+_prepuller_singleton: Optional[ImagePrepuller] = None
+
+
+def get_image_catalog() -> ImageCatalog:
+    global _catalog_singleton
+    if _catalog_singleton is None:
+        _catalog_singleton = ImageCatalog()
+    return _catalog_singleton
+
+
+def get_image_prepuller() -> ImagePrepuller:
+    global _prepuller_singleton
+    if _prepuller_singleton is None:
+        _prepuller_singleton = ImagePrepuller()
+    return _prepuller_singleton
@@ -0,0 +1,511 @@
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # graceful degradation: без zstandard пишем gzip
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # не Linux: блокировка между процессами недоступна
+    fcntl = None
+
+from config import cfg
+from docker_api import client_for
+from nodes import get_node_registry
+from log_stream import parse_docker_ts, iter_line_batches
+
+_SAFE_NAME = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*$')
+_NS = 1_000_000_000
+
+
+class _GzipCodec:
+    ext = '.log.gz'
+
+    def compress(self, data: bytes) -> bytes:
+        # Каждый блок — самостоятельный gzip member: сегмент целиком читается zcat,
+        # а отдельный блок распаковывается без чтения предыдущих
+        co = zlib.compressobj(6, zlib.DEFLATED, 31)
+        return co.compress(data) + co.flush()
+
+    def decompress(self, data: bytes) -> bytes:
+        return zlib.decompress(data, 31)
+
+
+class _ZstdCodec:
+    ext = '.log.zst'
+
+    def compress(self, data: bytes) -> bytes:
+        return zstandard.ZstdCompressor(level=3).compress(data)
+
+    def decompress(self, data: bytes) -> bytes:
+        return zstandard.ZstdDecompressor().decompress(data)
+
+
+_CODECS = {'.log.gz': _GzipCodec()}
+if zstandard:
+    _CODECS['.log.zst'] = _ZstdCodec()
+
+
+def _codec_for_config():
+    if cfg.LOG_ARCHIVE_COMPRESSION == 'zstd' and zstandard:
+        return _CODECS['.log.zst']
+    return _CODECS['.log.gz']
+
+
+def _check_name(name: str) -> str:
+    if not _SAFE_NAME.match(name or ''):
+        raise ValueError(f'Некорректное имя контейнера: {name}')
+    return name
+
+
+class _ContainerWriter:
+    """Буферизованная запись логов одного контейнера в сжатые сегменты"""
+
+    def __init__(self, archive: 'LogArchive', name: str):
+        self.archive = archive
+        self.name = name
+        self.dir = os.path.join(archive.root, name)
+        self.lock = threading.Lock()
+        self.buffer: List[Tuple[int, str]] = []
+        self.buffer_bytes = 0
+        self.buffer_since: Optional[float] = None
+        self.segment: Optional[dict] = None
+        self.last_ns = archive.last_archived_ns(name) or 0
+
+    def append(self, entries: List[Tuple[int, str]]):
+        """Добавить строки (наносекунды, строка); уже архивированные отбрасываются"""
+        with self.lock:
+            for ts_ns, line in entries:
+                if ts_ns <= self.last_ns:
+                    continue
+                self.last_ns = ts_ns
+                self.buffer.append((ts_ns, line))
+                self.buffer_bytes += len(line) + 1
+                if self.buffer_since is None:
+                    self.buffer_since = time.monotonic()
+            if self.buffer_bytes >= cfg.LOG_ARCHIVE_BLOCK_BYTES:
+                self._flush_locked()
+
+    def flush(self, max_age: float = 0):
+        with self.lock:
+            if self.buffer and (max_age <= 0 or time.monotonic() - self.buffer_since >= max_age):
+                self._flush_locked()
+
+    def pending(self) -> List[Tuple[int, str]]:
+        with self.lock:
+            return self.buffer[:]
+
+    def _open_segment(self, first_ns: int):
+        os.makedirs(self.dir, exist_ok=True)
+        codec = _codec_for_config()
+        self.segment = {
+            'first': first_ns,
+            'data': os.path.join(self.dir, f'{first_ns}{codec.ext}'),
+            'index': os.path.join(self.dir, f'{first_ns}.idx'),
+            'codec': codec,
+            'size': 0,
+            'opened': time.time(),
+        }
+
+    def _flush_locked(self):
+        entries, self.buffer = self.buffer, []
+        self.buffer_bytes = 0
+        self.buffer_since = None
+        if not entries:
+            return
+
+        seg = self.segment
+        if (seg is None or seg['size'] >= cfg.LOG_ARCHIVE_SEGMENT_BYTES
+                or time.time() - seg['opened'] >= cfg.LOG_ARCHIVE_SEGMENT_SECONDS):
+            self._open_segment(entries[0][0])
+            self.archive.apply_retention(self.name)
+            seg = self.segment
+
+        payload = ''.join(line + '\n' for _, line in entries).encode('utf-8')
+        block = seg['codec'].compress(payload)
+        with open(seg['data'], 'ab') as f:
+            offset = f.tell()
+            f.write(block)
+        entry = {
+            'first': entries[0][0],
+            'last': entries[-1][0],
+            'offset': offset,
+            'length': len(block),
+            'lines': len(entries),
+        }
+        with open(seg['index'], 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+        seg['size'] = offset + len(block)
+
+        for listener in self.archive.listeners:
+            try:
+                listener(self.name, entries)
+            except Exception as e:
+                print(f"[log_archive] listener error: {e}")
+
+
+class LogArchive:
+    """
+    Архив логов контейнеров в каталоге ``cfg.LOG_ARCHIVE_DIR/<container>/``.
+
+    Сегмент ``<first_ns>.log.gz`` (или ``.log.zst``) состоит из независимо
+    сжатых блоков; ``<first_ns>.idx`` — разреженный индекс по блокам
+    (JSON lines: first/last метки времени, смещение и длина блока).
+    Чтение диапазона выбирает сегменты по имени файла, а внутри сегмента
+    распаковывает только блоки, пересекающиеся с диапазоном.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self.writers: Dict[str, _ContainerWriter] = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def writer(self, name: str) -> _ContainerWriter:
+        with self._lock:
+            w = self.writers.get(name)
+            if w is None:
+                w = self.writers[name] = _ContainerWriter(self, _check_name(name))
+            return w
+
+    def add_listener(self, callback) -> Dict[str, int]:
+        """
+        Подписаться на записанные блоки: callback(container, [(ns, line), ...]).
+
+        Возвращает метку последней строки на диске для каждого контейнера в момент
+        подписки: всё, что новее, получит callback. На время подписки берутся
+        блокировки архива и всех сборщиков, чтобы ни один блок не записался между
+        снимком и подпиской.
+        """
+        with self._lock:
+            writers = list(self.writers.values())
+            for w in writers:
+                w.lock.acquire()
+            try:
+                self.listeners.append(callback)
+                return {name: self.last_archived_ns(name) or 0 for name in self.list_containers()}
+            finally:
+                for w in writers:
+                    w.lock.release()
+
+    def flush_all(self, max_age: float = 0):
+        for w in list(self.writers.values()):
+            try:
+                w.flush(max_age)
+            except OSError as e:
+                print(f"[log_archive] flush error for {w.name}: {e}")
+
+    def list_containers(self) -> List[str]:
+        try:
+            return sorted(d for d in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, d)))
+        except OSError:
+            return []
+
+    def _segments(self, name: str) -> List[dict]:
+        """Сегменты контейнера, отсортированные по времени первой строки"""
+        directory = os.path.join(self.root, name)
+        try:
+            files = os.listdir(directory)
+        except OSError:
+            return []
+        segments = []
+        for fname in files:
+            if not fname.endswith('.idx'):
+                continue
+            try:
+                first = int(fname[:-4])
+            except ValueError:
+                continue
+            for ext in _CODECS:
+                data = os.path.join(directory, f'{first}{ext}')
+                if os.path.exists(data):
+                    segments.append({'first': first, 'data': data, 'ext': ext,
+                                     'index': os.path.join(directory, fname)})
+                    break
+        segments.sort(key=lambda s: s['first'])
+        return segments
+
+    @staticmethod
+    def _read_index(path: str) -> List[dict]:
+        blocks = []
+        try:
+            with open(path) as f:
+                for raw in f:
+                    try:
+                        blocks.append(json.loads(raw))
+                    except ValueError:
+                        break  # недописанная строка после сбоя
+        except OSError:
+            pass
+        return blocks
+
+    def last_archived_ns(self, name: str) -> Optional[int]:
+        segments = self._segments(name)
+        if not segments:
+            return None
+        blocks = self._read_index(segments[-1]['index'])
+        return blocks[-1]['last'] if blocks else None
+
+    def apply_retention(self, name: str):
+        """
+        Удалить сегменты, целиком старше LOG_ARCHIVE_RETENTION_DAYS. Последний
+        сегмент заканчивается последней строкой в его индексе; если после этого
+        у контейнера без сборщика не осталось сегментов, удаляется и его каталог.
+        """
+        if cfg.LOG_ARCHIVE_RETENTION_DAYS <= 0:
+            return
+        cutoff = int((time.time() - cfg.LOG_ARCHIVE_RETENTION_DAYS * 86400) * _NS)
+        segments = self._segments(name)
+        expired = []
+        # Сегмент заканчивается там, где начинается следующий
+        for seg, nxt in zip(segments, segments[1:]):
+            if nxt['first'] < cutoff:
+                expired.append(seg)
+        if segments:
+            blocks = self._read_index(segments[-1]['index'])
+            if blocks and blocks[-1]['last'] < cutoff:
+                expired.append(segments[-1])
+        w = self.writers.get(name)
+        for seg in expired:
+            if w is not None and w.segment is not None and w.segment['index'] == seg['index']:
+                w.segment = None  # следующий блок откроет новый сегмент
+            for path in (seg['data'], seg['index']):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        if expired and len(expired) == len(segments) and w is None:
+            try:
+                os.rmdir(os.path.join(self.root, name))
+            except OSError:
+                pass  # в каталоге остались посторонние файлы
+
+    def apply_retention_all(self):
+        """Применить срок хранения ко всем контейнерам архива, включая удалённые и молчащие"""
+        for name in self.list_containers():
+            w = self.writers.get(name)
+            try:
+                if w is None:
+                    self.apply_retention(name)
+                else:
+                    with w.lock:  # не удалить сегмент, в который сейчас пишется блок
+                        self.apply_retention(name)
+            except OSError as e:
+                print(f"[log_archive] retention error for {name}: {e}")
+
+    def _decode_block(self, f, codec, block: dict) -> List[Tuple[int, str]]:
+        f.seek(block['offset'])
+        payload = codec.decompress(f.read(block['length'])).decode('utf-8', errors='replace')
+        entries = []
+        for line in payload.splitlines():
+            entries.append((parse_docker_ts(line.partition(' ')[0]) or block['first'], line))
+        return entries
+
+    def iter_blocks(self, name: str, after_ns: int = 0):
+        """Последовательно выдать блоки архива (списки (ns, строка)), содержащие строки новее after_ns"""
+        for seg in self._segments(name):
+            blocks = [b for b in self._read_index(seg['index']) if b['last'] > after_ns]
+            if not blocks:
+                continue
+            codec = _CODECS[seg['ext']]
+            with open(seg['data'], 'rb') as f:
+                for block in blocks:
+                    yield self._decode_block(f, codec, block)
+
+    def read(self, name: str, from_ns: Optional[int] = None, to_ns: Optional[int] = None,
+             limit: Optional[int] = None, max_bytes: Optional[int] = None) -> Dict:
+        """Прочитать строки архива в диапазоне [from_ns, to_ns]"""
+        _check_name(name)
+        lo = from_ns if from_ns is not None else 0
+        hi = to_ns if to_ns is not None else float('inf')
+        budget = min(max_bytes or cfg.LOG_READ_MAX_BYTES, cfg.LOG_READ_MAX_BYTES)
+        limit = limit or cfg.LOG_MAX_TAIL
+
+        lines: List[str] = []
+        used = 0
+        truncated = False
+        segments = self._segments(name)
+        blocks_read = 0
+
+        def take(ts_ns, line) -> bool:
+            nonlocal used, truncated
+            if ts_ns < lo or ts_ns > hi:
+                return True
+            size = len(line.encode('utf-8')) + 1
+            if len(lines) >= limit or used + size > budget:
+                truncated = True
+                return False
+            used += size
+            lines.append(line)
+            return True
+
+        for i, seg in enumerate(segments):
+            seg_end = segments[i + 1]['first'] if i + 1 < len(segments) else float('inf')
+            if seg['first'] > hi or seg_end < lo:
+                continue
+            codec = _CODECS[seg['ext']]
+            with open(seg['data'], 'rb') as f:
+                for block in self._read_index(seg['index']):
+                    if block['last'] < lo or block['first'] > hi:
+                        continue
+                    blocks_read += 1
+                    for ts_ns, line in self._decode_block(f, codec, block):
+                        if not take(ts_ns, line):
+                            break
+                    if truncated:
+                        break
+            if truncated:
+                break
+
+        # Строки, ещё не сброшенные на диск
+        w = self.writers.get(name)
+        if w and not truncated:
+            for ts_ns, line in w.pending():
+                if not take(ts_ns, line):
+                    break
+
+        return {'lines': lines, 'truncated': truncated, 'bytes': used, 'blocks_read': blocks_read}
+
+
+class LogCollector:
+    """
+    Фоновый сборщик: следит за логами управляемых контейнеров (label bot-manager=1)
+    и пишет их в архив. Работает в одном процессе — остальные воркеры видят
+    блокировку на каталоге архива и сбор не запускают.
+    """
+
+    def __init__(self, archive: LogArchive):
+        self.archive = archive
+        self.tails: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._last_error = None
+        self._retention_at = 0.0
+
+    def _acquire_process_lock(self) -> bool:
+        if not fcntl:
+            return True
+        self._lock_file = open(os.path.join(self.archive.root, '.collector.lock'), 'w')
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def start(self, prepare=None):
+        """Запустить сбор; ``prepare`` выполняется в фоне до первого прохода"""
+        if not self._acquire_process_lock():
+            print("[log_archive] сборщик уже запущен другим процессом")
+            return False
+        threading.Thread(target=self._loop, args=(prepare,), daemon=True).start()
+        return True
+
+    def _loop(self, prepare=None):
+        if prepare:
+            try:
+                prepare()
+            except Exception as e:
+                print(f"[log_archive] ошибка подготовки сборщика: {e}")
+        while True:
+            try:
+                containers, errors = get_node_registry().list_containers(filters={'label': 'bot-manager=1'})
+                for _, c in containers:
+                    self._ensure_tail(c.name)
+                if errors:
+                    raise RuntimeError('; '.join(f'{node}: {error}' for node, error in errors.items()))
+                self._last_error = None
+            except Exception as e:
+                if str(e) != self._last_error:
+                    print(f"[log_archive] не удалось получить список контейнеров: {e}")
+                    self._last_error = str(e)
+            self.archive.flush_all(max_age=cfg.LOG_ARCHIVE_FLUSH_INTERVAL)
+            if time.monotonic() - self._retention_at >= cfg.LOG_ARCHIVE_RETENTION_INTERVAL:
+                self._retention_at = time.monotonic()
+                self.archive.apply_retention_all()
+            time.sleep(cfg.LOG_ARCHIVE_SCAN_INTERVAL)
+
+    def _ensure_tail(self, name: str):
+        with self._lock:
+            t = self.tails.get(name)
+            if t and t.is_alive():
+                return
+            t = threading.Thread(target=self._tail, args=(name,), daemon=True)
+            self.tails[name] = t
+            t.start()
+
+    def _stream_into(self, name: str, follow: bool):
+        writer = self.archive.writer(name)
+        kwargs = {'stream': True, 'timestamps': True, 'follow': follow}
+        if writer.last_ns:
+            kwargs['since'] = max(writer.last_ns // _NS, 1)
+        stream = client_for(name).containers.get(name).logs(**kwargs)
+        try:
+            for batch in iter_line_batches(stream):
+                entries = []
+                for line in batch:
+                    ts_ns = parse_docker_ts(line.partition(' ')[0])
+                    if ts_ns is not None:
+                        entries.append((ts_ns, line))
+                if entries:
+                    writer.append(entries)
+        finally:
+            stream.close()
+            writer.flush()
+
+    def _tail(self, name: str):
+        try:
+            self._stream_into(name, follow=True)
+        except Exception as e:
+            print(f"[log_archive] сбор логов {name} прерван: {e}")
+
+    def capture(self, name: str):
+        """Синхронно дописать в архив всё, что ещё не собрано (перед удалением контейнера)"""
+        try:
+            self._stream_into(name, follow=False)
+        except Exception as e:
+            print(f"[log_archive] не удалось сохранить логи {name}: {e}")
+
+
+_archive_singleton: Optional[LogArchive] = None
+_collector_singleton: Optional[LogCollector] = None
+
+
+def get_log_archive() -> LogArchive:
+    global _archive_singleton
+    if _archive_singleton is None:
+        _archive_singleton = LogArchive(cfg.LOG_ARCHIVE_DIR)
+    return _archive_singleton
+
+
+def start_log_collector() -> Optional[LogCollector]:
+    """Запустить сборщик логов (один раз на процесс)"""
+    global _collector_singleton
+    if _collector_singleton is None and cfg.LOG_ARCHIVE_ENABLED:
+        archive = get_log_archive()
+        collector = LogCollector(archive)
+        prepare = (lambda: _attach_search_index(archive)) if cfg.LOG_SEARCH_ENABLED else None
+        if collector.start(prepare):
+            _collector_singleton = collector
+    return _collector_singleton
+
+
+def _attach_search_index(archive: LogArchive):
+    """Догнать индекс поиска по архиву и подписать его на новые блоки"""
+    from log_search import get_log_search_index
+    get_log_search_index().backfill(archive)
+
+
+def archive_before_remove(name: str):
+    """Сохранить хвост логов контейнера, который сейчас будет удалён"""
+    if _collector_singleton is not None:
+        _collector_singleton.capture(name)
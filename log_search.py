@@ -0,0 +1,175 @@
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from config import cfg
+
+_NS = 1_000_000_000
+_QUERY_TOKEN = re.compile(r'"([^"]*)"|(\S+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_lines (
+    id INTEGER PRIMARY KEY,
+    container TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    line TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS log_lines_ts ON log_lines(ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS log_lines_fts USING fts5(
+    line, content='log_lines', content_rowid='id', tokenize='unicode61'
+);
+CREATE TRIGGER IF NOT EXISTS log_lines_ai AFTER INSERT ON log_lines BEGIN
+    INSERT INTO log_lines_fts(rowid, line) VALUES (new.id, new.line);
+END;
+CREATE TRIGGER IF NOT EXISTS log_lines_ad AFTER DELETE ON log_lines BEGIN
+    INSERT INTO log_lines_fts(log_lines_fts, rowid, line) VALUES ('delete', old.id, old.line);
+END;
+CREATE TABLE IF NOT EXISTS indexed_upto (
+    container TEXT PRIMARY KEY,
+    last_ns INTEGER NOT NULL
+);
+"""
+
+
+def to_fts_query(query: str) -> str:
+    """
+    Перевести пользовательский запрос в синтаксис FTS5.
+
+    Слова ищутся все вместе (AND), "фраза в кавычках" — как фраза,
+    ``слово*`` — по префиксу. Остальные символы экранируются, поэтому
+    операторы FTS5 из ввода пользователя не интерпретируются.
+    """
+    parts = []
+    for phrase, term in _QUERY_TOKEN.findall(query or ''):
+        if phrase:
+            parts.append('"' + phrase.replace('"', '""') + '"')
+        elif term:
+            prefix = term.endswith('*') and len(term) > 1
+            term = term.rstrip('*') if prefix else term
+            parts.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(parts)
+
+
+class LogSearchIndex:
+    """
+    Полнотекстовый индекс логов всех контейнеров (SQLite FTS5).
+
+    Отдельная база ``cfg.LOG_SEARCH_DB`` пополняется блоками, которые
+    записывает архив логов, поэтому поиск не трогает Docker и не
+    распаковывает сегменты. В ``indexed_upto`` хранится последняя
+    проиндексированная метка времени по каждому контейнеру — по ней
+    индекс догоняет архив после перезапуска.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._last_prune = 0.0
+        with self._write_lock:
+            self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def add_lines(self, container: str, entries: Sequence[Tuple[int, str]]):
+        """Проиндексировать строки (наносекунды, строка Docker с меткой времени)"""
+        if not entries:
+            return
+        rows = [(container, ts_ns, line.partition(' ')[2] or line) for ts_ns, line in entries]
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.executemany('INSERT INTO log_lines(container, ts, line) VALUES (?, ?, ?)', rows)
+                conn.execute(
+                    'INSERT INTO indexed_upto(container, last_ns) VALUES (?, ?) '
+                    'ON CONFLICT(container) DO UPDATE SET last_ns = max(last_ns, excluded.last_ns)',
+                    (container, entries[-1][0]),
+                )
+        if time.time() - self._last_prune > 3600:
+            self.prune()
+
+    def prune(self):
+        """Удалить строки старше срока хранения архива"""
+        self._last_prune = time.time()
+        if cfg.LOG_ARCHIVE_RETENTION_DAYS <= 0:
+            return
+        cutoff = int((time.time() - cfg.LOG_ARCHIVE_RETENTION_DAYS * 86400) * _NS)
+        with self._write_lock:
+            conn = self._conn()
+            with conn:
+                conn.execute('DELETE FROM log_lines WHERE ts < ?', (cutoff,))
+
+    def indexed_upto(self) -> Dict[str, int]:
+        return dict(self._conn().execute('SELECT container, last_ns FROM indexed_upto').fetchall())
+
+    def backfill(self, archive):
+        """
+        Подписаться на новые блоки архива и доиндексировать записанные, пока
+        индекс не работал. capture() может писать во время догонки, поэтому
+        подписка идёт первой: строки новее снимка из add_listener индексирует
+        подписчик, а backfill — только строки до него.
+        """
+        done = self.indexed_upto()
+        until = archive.add_listener(self.add_lines)
+        for name, last in until.items():
+            upto = done.get(name, 0)
+            if last <= upto:
+                continue
+            for entries in archive.iter_blocks(name, after_ns=upto):
+                lines = [(ts, line) for ts, line in entries if upto < ts <= last]
+                if lines:
+                    self.add_lines(name, lines)
+                if entries and entries[-1][0] >= last:
+                    break
+
+    def search(self, query: str, from_ns: Optional[int] = None, to_ns: Optional[int] = None,
+               containers: Optional[List[str]] = None, limit: int = 100) -> List[Dict]:
+        """Найти строки по запросу; свежие совпадения первыми"""
+        fts_query = to_fts_query(query)
+        if not fts_query:
+            return []
+        sql = ('SELECT l.container, l.ts, l.line FROM log_lines_fts f '
+               'JOIN log_lines l ON l.id = f.rowid WHERE log_lines_fts MATCH ?')
+        params: list = [fts_query]
+        if from_ns is not None:
+            sql += ' AND l.ts >= ?'
+            params.append(from_ns)
+        if to_ns is not None:
+            sql += ' AND l.ts <= ?'
+            params.append(to_ns)
+        if containers:
+            sql += ' AND l.container IN ({})'.format(','.join('?' * len(containers)))
+            params.extend(containers)
+        # rowid растёт вместе со временем записи — сортировка по нему не требует сортировки совпадений
+        sql += ' ORDER BY f.rowid DESC LIMIT ?'
+        params.append(max(1, min(int(limit), cfg.LOG_SEARCH_MAX_RESULTS)))
+
+        matches = []
+        for container, ts_ns, line in self._conn().execute(sql, params):
+            matches.append({
+                'container': container,
+                'timestamp': datetime.utcfromtimestamp(ts_ns / _NS).isoformat() + 'Z',
+                'ts': ts_ns,
+                'line': line,
+            })
+        return matches
+
+
+_index_singleton: Optional[LogSearchIndex] = None
+
+
+def get_log_search_index() -> LogSearchIndex:
+    global _index_singleton
+    if _index_singleton is None:
+        _index_singleton = LogSearchIndex(cfg.LOG_SEARCH_DB)
+    return _index_singleton
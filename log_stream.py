@@ -0,0 +1,227 @@
+import calendar
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+from flask import current_app
+
+from config import cfg
+from docker_api import client_for
+
+try:
+    import greenlet  # type: ignore
+    from eventlet import tpool  # type: ignore
+except ImportError:  # pragma: no cover - без eventlet всё выполняется в потоках
+    tpool = None
+
+# Активные подписки на live-логи: sid -> {'container', 'stream', 'stop'}
+FOLLOW_SESSIONS: Dict[str, dict] = {}
+_follow_lock = threading.Lock()
+
+
+def parse_docker_ts(ts: str) -> Optional[int]:
+    """Перевести RFC3339Nano-метку Docker ('2024-05-01T10:00:00.123456789Z') в наносекунды эпохи"""
+    try:
+        base = calendar.timegm(time.strptime(ts[:19], '%Y-%m-%dT%H:%M:%S'))
+    except (ValueError, TypeError):
+        return None
+    frac = ts[19:].rstrip('Z')
+    nanos = 0
+    if frac.startswith('.'):
+        digits = frac[1:10]
+        if not digits.isdigit():
+            return None
+        nanos = int(digits.ljust(9, '0'))
+    return base * 1_000_000_000 + nanos
+
+
+def parse_time_param(value) -> Optional[float]:
+    """
+    Разобрать параметр времени из запроса: секунды эпохи ('1714557600.5')
+    или ISO 8601 ('2024-05-01T10:00:00Z'). Наивное время считается UTC.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        dt = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f'Некорректное время: {value}')
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def _parse_cursor(after) -> Optional[int]:
+    if after is None or after == '':
+        return None
+    try:
+        return int(after)
+    except (TypeError, ValueError):
+        raise ValueError(f'Некорректный курсор: {after}')
+
+
+def _decode(raw: bytes) -> str:
+    return raw.rstrip(b'\r').decode('utf-8', errors='replace')
+
+
+def iter_line_batches(stream):
+    """Разбить поток байтовых чанков Docker на пачки целых строк (по одной на чанк)"""
+    buf = b''
+    for chunk in stream:
+        buf += chunk
+        *complete, buf = buf.split(b'\n')
+        if complete:
+            yield [_decode(raw) for raw in complete]
+    if buf:
+        yield [_decode(buf)]
+
+
+def _iter_lines(stream):
+    for batch in iter_line_batches(stream):
+        yield from batch
+
+
+def _blocking(func, *args, **kwargs):
+    """Блокирующий вызов Docker без остановки хаба: в greenthread'е — через tpool eventlet"""
+    if tpool is not None and greenlet.getcurrent().parent is not None:
+        return tpool.execute(func, *args, **kwargs)
+    return func(*args, **kwargs)
+
+
+def _split_line(line: str):
+    """Вернуть (наносекунды, строка) для строки вида '<timestamp> <текст>'"""
+    ts, _, _ = line.partition(' ')
+    return parse_docker_ts(ts), line
+
+
+def read_logs(name: str, tail: Optional[int] = None, since: Optional[float] = None,
+              until: Optional[float] = None, after: Optional[str] = None,
+              max_bytes: Optional[int] = None) -> Dict:
+    """
+    Прочитать логи контейнера потоково с ограничением по объёму.
+
+    ``after`` — курсор из предыдущего ответа: возвращаются только строки новее него.
+    Курсор — метка времени последней строки в наносекундах эпохи.
+    Если бюджет ``max_bytes`` исчерпан, ``truncated`` = True, а курсор указывает
+    на последнюю отданную строку, чтобы клиент мог дочитать продолжение.
+    """
+    budget = min(max_bytes or cfg.LOG_READ_MAX_BYTES, cfg.LOG_READ_MAX_BYTES)
+    cursor_ns = _parse_cursor(after)
+
+    kwargs = {'stream': True, 'timestamps': True, 'follow': False}
+    if cursor_ns is not None:
+        # Docker фильтрует по since с точностью до секунды — дочитываем секунду курсора и отбрасываем виденное
+        kwargs['since'] = max(cursor_ns // 1_000_000_000, 1)
+    elif since:
+        kwargs['since'] = since
+    if until:
+        kwargs['until'] = until
+    if cursor_ns is None:
+        kwargs['tail'] = max(1, min(int(tail or 100), cfg.LOG_MAX_TAIL))
+
+    container = client_for(name).containers.get(name)
+    stream = container.logs(**kwargs)
+
+    lines: List[str] = []
+    used = 0
+    truncated = False
+    last_ns = cursor_ns
+    try:
+        for line in _iter_lines(stream):
+            ts_ns, text = _split_line(line)
+            if cursor_ns is not None and ts_ns is not None and ts_ns <= cursor_ns:
+                continue
+            size = len(text.encode('utf-8')) + 1
+            if used + size > budget:
+                truncated = True
+                break
+            used += size
+            lines.append(text)
+            if ts_ns is not None:
+                last_ns = ts_ns
+    finally:
+        stream.close()
+
+    return {
+        'lines': lines,
+        'cursor': str(last_ns) if last_ns is not None else None,
+        'truncated': truncated,
+        'bytes': used,
+    }
+
+
+def start_follow(sid: str, name: str, after: Optional[str], emit_fn: Callable[[str, dict], None]):
+    """
+    Начать трансляцию новых строк лога контейнера в сокет ``sid``. Трансляция
+    идёт в фоновой задаче SocketIO (под eventlet — greenthread, emit из него
+    сразу будит хаб), а ожидание новых строк Docker — в tpool.
+    """
+    stop_follow(sid)
+    cursor_ns = _parse_cursor(after)
+    stop = threading.Event()
+    sess = {'container': name, 'stream': None, 'stop': stop}
+    with _follow_lock:
+        FOLLOW_SESSIONS[sid] = sess
+
+    def run():
+        last_ns = cursor_ns
+        try:
+            container = _blocking(client_for(name).containers.get, name)
+            kwargs = {'stream': True, 'follow': True, 'timestamps': True}
+            if cursor_ns is not None:
+                kwargs['since'] = max(cursor_ns // 1_000_000_000, 1)
+            else:
+                kwargs['tail'] = 0
+            stream = _blocking(container.logs, **kwargs)
+            sess['stream'] = stream
+            if stop.is_set():
+                stream.close()
+                return
+            batches = iter_line_batches(stream)
+            while not stop.is_set():
+                batch = _blocking(next, batches, None)
+                if batch is None or stop.is_set():
+                    break
+                fresh = []
+                for line in batch:
+                    ts_ns, text = _split_line(line)
+                    if last_ns is not None and ts_ns is not None and ts_ns <= last_ns:
+                        continue
+                    if ts_ns is not None:
+                        last_ns = ts_ns
+                    fresh.append(text)
+                if fresh:
+                    emit_fn('logs_lines', {
+                        'container': name,
+                        'lines': fresh,
+                        'cursor': str(last_ns) if last_ns is not None else None,
+                    })
+        except Exception as e:
+            if not stop.is_set():
+                emit_fn('logs_error', {'container': name, 'error': str(e)})
+        finally:
+            with _follow_lock:
+                if FOLLOW_SESSIONS.get(sid) is sess:
+                    FOLLOW_SESSIONS.pop(sid, None)
+
+    current_app.extensions['socketio'].start_background_task(run)
+
+
+def stop_follow(sid: str):
+    """Остановить трансляцию логов для сокета"""
+    with _follow_lock:
+        sess = FOLLOW_SESSIONS.pop(sid, None)
+    if not sess:
+        return
+    sess['stop'].set()
+    stream = sess.get('stream')
+    if stream is not None:
+        try:
+            stream.close()  # прерывает ожидание новых строк
+        except Exception:
+            pass
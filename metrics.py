@@ -0,0 +1,306 @@
+import re
+import threading
+import time
+from bisect import bisect_left
+from functools import wraps
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Шарды значений по потокам ОС: native id -> {(метрика, метки): значение}.
+# В свой шард пишет только его поток, поэтому инкремент не берёт блокировок;
+# greenthread'ы eventlet одного потока переключаются только на I/O и тоже
+# не пересекаются внутри ``+=``. Блокировка нужна лишь при создании шарда.
+_shards: Dict[int, dict] = {}
+_shards_lock = threading.Lock()
+_get_thread_id = threading.get_native_id
+
+
+def _shard() -> dict:
+    tid = _get_thread_id()
+    shard = _shards.get(tid)
+    if shard is None:
+        with _shards_lock:
+            shard = _shards.setdefault(tid, {})
+    return shard
+
+
+def _snapshot() -> List[dict]:
+    # dict(...) копирует словарь целиком под GIL — без «changed size during iteration»
+    return [dict(shard) for shard in list(_shards.values())]
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонный счётчик (или gauge со значением inc/dec, если ``kind='gauge'``)"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), kind: str = 'counter'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.kind = kind
+        REGISTRY.append(self)
+
+    def inc(self, labels: Tuple = (), amount: float = 1):
+        shard = _shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def dec(self, labels: Tuple = (), amount: float = 1):
+        self.inc(labels, -amount)
+
+    def collect(self, shards: List[dict]) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for shard in shards:
+            for (name, labels), value in shard.items():
+                if name == self.name:
+                    totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self, shards: List[dict]) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self.collect(shards).items()):
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами; в шарде — [счётчики корзин..., сумма]"""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        REGISTRY.append(self)
+
+    def observe(self, labels: Tuple, value: float):
+        shard = _shard()
+        key = (self.name, labels)
+        cells = shard.get(key)
+        if cells is None:
+            cells = shard[key] = [0] * (len(self.buckets) + 2)
+        # Последняя корзина перед суммой — +Inf
+        cells[bisect_left(self.buckets, value)] += 1
+        cells[-1] += value
+
+    def time(self, labels: Tuple = ()):
+        return _Timer(self, labels)
+
+    def render(self, shards: List[dict]) -> List[str]:
+        size = len(self.buckets) + 2
+        totals: Dict[Tuple, list] = {}
+        for shard in shards:
+            for (name, labels), cells in shard.items():
+                if name != self.name:
+                    continue
+                acc = totals.setdefault(labels, [0] * size)
+                for i, v in enumerate(list(cells)):
+                    acc[i] += v
+
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        bounds = self.buckets + (float('inf'),)
+        for labels, cells in sorted(totals.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, cells):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, labels, le)} {cumulative}')
+            label_str = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_str} {_format_value(float(cells[-1]))}')
+            lines.append(f'{self.name}_count{label_str} {cumulative}')
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Tuple):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(self.labels, time.perf_counter() - self.started)
+        return False
+
+
+class GaugeFunc:
+    """Gauge, значение которого вычисляется при сборе (например, число сессий)"""
+
+    def __init__(self, name: str, help: str, func: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.func = func
+        REGISTRY.append(self)
+
+    def render(self, shards: List[dict]) -> List[str]:
+        try:
+            value = self.func()
+        except Exception:
+            return []
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} gauge',
+                f'{self.name} {_format_value(value)}']
+
+
+REGISTRY: List = []
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    shards = _snapshot()
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(shards))
+    return '\n'.join(lines) + '\n'
+
+
+def gauge_func(name: str, help: str, func: Callable[[], float]) -> Optional[GaugeFunc]:
+    """Зарегистрировать вычисляемый gauge (повторная регистрация имени игнорируется)"""
+    if any(m.name == name for m in REGISTRY):
+        return None
+    return GaugeFunc(name, help, func)
+
+
+# --- HTTP -------------------------------------------------------------------
+
+HTTP_DURATION = Histogram('bot_manager_http_request_duration_seconds',
+                          'Время обработки HTTP-запроса', ('endpoint', 'method'))
+HTTP_REQUESTS = Counter('bot_manager_http_requests_total',
+                        'HTTP-запросы по эндпоинту и коду ответа', ('endpoint', 'method', 'status'))
+
+
+def init_app(app):
+    """Замерять каждый запрос Flask (регистрировать до остальных before_request)"""
+    from flask import g, request
+
+    @app.before_request
+    def _metrics_start():
+        g._metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _metrics_finish(response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'none'
+            HTTP_DURATION.observe((endpoint, request.method), time.perf_counter() - started)
+            HTTP_REQUESTS.inc((endpoint, request.method, str(response.status_code)))
+        return response
+
+
+# --- Docker API -------------------------------------------------------------
+
+DOCKER_DURATION = Histogram('bot_manager_docker_api_duration_seconds',
+                            'Время запроса к Docker API', ('method', 'path'))
+DOCKER_ERRORS = Counter('bot_manager_docker_api_errors_total',
+                        'Ошибки соединения с Docker API', ('method', 'path'))
+
+_API_VERSION = re.compile(r'^/v[0-9.]+')
+_OBJECT_ID = re.compile(r'^/(containers|images|networks|volumes|exec|plugins|services|tasks|nodes)/[^/]+')
+
+
+def docker_path_template(url: str) -> str:
+    """'/v1.45/containers/abc123/json?all=1' -> '/containers/{id}/json'"""
+    path = url.split('://', 1)[-1]
+    path = path[path.find('/'):] if '/' in path else '/'
+    path = _API_VERSION.sub('', path.split('?', 1)[0])
+    return _OBJECT_ID.sub(lambda m: f'/{m.group(1)}/{{id}}', path) or '/'
+
+
+def instrument_docker_client(client):
+    """Обернуть APIClient.send клиента docker, чтобы замерять каждый HTTP-запрос к демону"""
+    api = client.api
+    if getattr(api, '_metrics_instrumented', False):
+        return client
+    original_send = api.send
+
+    def send(request, **kwargs):
+        labels = (request.method, docker_path_template(request.url))
+        started = time.perf_counter()
+        try:
+            return original_send(request, **kwargs)
+        except Exception:
+            DOCKER_ERRORS.inc(labels)
+            raise
+        finally:
+            DOCKER_DURATION.observe(labels, time.perf_counter() - started)
+
+    api.send = send
+    api._metrics_instrumented = True
+    return client
+
+
+# --- Exec backend -----------------------------------------------------------
+
+EXEC_DURATION = Histogram('bot_manager_exec_duration_seconds',
+                          'Время выполнения команды через exec backend', ('backend',))
+EXEC_COMMANDS = Counter('bot_manager_exec_commands_total',
+                        'Выполненные команды по коду выхода', ('backend', 'exit_code'))
+EXEC_IN_FLIGHT = Counter('bot_manager_exec_in_flight',
+                         'Команды, выполняющиеся сейчас', ('backend',), kind='gauge')
+
+_KNOWN_EXIT_CODES = {0, 1, 2, 124, 125, 126, 127, 130, 137, 143}
+
+
+def timed_exec(backend: str):
+    """Декоратор run() бэкенда: латентность, коды выхода и число команд в работе"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            labels = (backend,)
+            EXEC_IN_FLIGHT.inc(labels)
+            started = time.perf_counter()
+            exit_code = None
+            try:
+                result = func(*args, **kwargs)
+                exit_code = result[2]
+                return result
+            finally:
+                EXEC_IN_FLIGHT.dec(labels)
+                EXEC_DURATION.observe(labels, time.perf_counter() - started)
+                code = 'error' if exit_code is None else (
+                    str(exit_code) if exit_code in _KNOWN_EXIT_CODES else 'other')
+                EXEC_COMMANDS.inc((backend, code))
+        return wrapper
+    return decorator
+
+
+# --- Socket.IO --------------------------------------------------------------
+
+SOCKET_CONNECTIONS = Counter('bot_manager_socketio_connections',
+                             'Открытые Socket.IO-соединения', kind='gauge')
+EMIT_MESSAGES = Counter('bot_manager_socketio_emit_total',
+                        'Отправленные Socket.IO-события', ('event',))
+EMIT_BYTES = Counter('bot_manager_socketio_emit_bytes_total',
+                     'Байты строковых полей отправленных Socket.IO-событий', ('event',))
+
+
+def record_emit(event: str, data):
+    size = 0
+    if isinstance(data, dict):
+        for value in data.values():
+            if isinstance(value, str):
+                size += len(value.encode('utf-8', errors='replace'))
+    elif isinstance(data, str):
+        size = len(data.encode('utf-8', errors='replace'))
+    labels = (event,)
+    EMIT_MESSAGES.inc(labels)
+    EMIT_BYTES.inc(labels, size)
@@ -0,0 +1,257 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import docker
+
+from config import cfg
+import metrics
+
+
+class Node:
+    """Docker-хост менеджера. url 'env' — клиент из окружения процесса (docker.from_env)"""
+
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = url
+        self._client = None
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+        self.last_ok_at: Optional[float] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import profiler
+                    try:
+                        if self.url == 'env':
+                            raw = docker.from_env()
+                        else:
+                            raw = docker.DockerClient(base_url=self.url, timeout=cfg.DOCKER_NODE_TIMEOUT,
+                                                      max_pool_size=cfg.DOCKER_FANOUT_WORKERS)
+                    except Exception as e:
+                        raise RuntimeError(f"Не удалось инициализировать Docker клиент ({self.name}): {e}")
+                    self._client = profiler.instrument_docker_client(metrics.instrument_docker_client(raw))
+        return self._client
+
+    def exec_backend(self):
+        """Exec backend, в командах которого docker CLI работает с этим узлом"""
+        from exec_backend import DockerHostBackend, get_backend
+        backend = get_backend()
+        return backend if self.url == 'env' else DockerHostBackend(backend, self.url)
+
+    def mark(self, error: Optional[Exception] = None):
+        if error is None:
+            self.last_error = None
+            self.last_ok_at = time.time()
+        else:
+            self.last_error = str(error)
+
+
+def parse_nodes(spec: str) -> List[Node]:
+    """'a=tcp://10.0.0.2:2375,b=ssh://root@b' -> [Node, ...]; пусто — один узел 'local' из окружения"""
+    nodes, seen = [], set()
+    for item in (part.strip() for part in (spec or '').split(',')):
+        if not item:
+            continue
+        name, sep, url = item.partition('=')
+        name, url = name.strip(), url.strip()
+        if not sep or not name or not url:
+            raise ValueError(f'DOCKER_NODES: ожидается имя=url, получено {item!r}')
+        if name in seen:
+            raise ValueError(f'DOCKER_NODES: узел {name} указан дважды')
+        seen.add(name)
+        nodes.append(Node(name, url))
+    return nodes or [Node('local', 'env')]
+
+
+class NodeRegistry:
+    """
+    Реестр Docker-узлов. Помнит, на каком узле какой контейнер (по спискам и
+    созданию), раздаёт запросы всем узлам параллельно и выбирает узел для
+    нового контейнера по свободным памяти и CPU.
+    """
+
+    def __init__(self, nodes: List[Node]):
+        self._nodes = {node.name: node for node in nodes}
+        self.default = nodes[0]
+        self._locations: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ThreadPoolExecutor] = None
+
+    @property
+    def multi(self) -> bool:
+        return len(self._nodes) > 1
+
+    def nodes(self) -> List[Node]:
+        return list(self._nodes.values())
+
+    def get(self, name: Optional[str]) -> Node:
+        if not name:
+            return self.default
+        try:
+            return self._nodes[name]
+        except KeyError:
+            raise ValueError(f'Неизвестный узел: {name} (доступны: {", ".join(self._nodes)})')
+
+    def _executor(self) -> ThreadPoolExecutor:
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=cfg.DOCKER_FANOUT_WORKERS,
+                                                    thread_name_prefix='docker-fanout')
+        return self._pool
+
+    def map(self, func: Callable[[Any], Any], items: Iterable) -> List:
+        """Параллельно выполнить func для каждого элемента (исключения возвращаются как результат)"""
+        def call(item):
+            try:
+                return func(item)
+            except Exception as e:
+                return e
+        items = list(items)
+        if len(items) <= 1:
+            return [call(item) for item in items]
+        return list(self._executor().map(call, items))
+
+    def fan_out(self, func: Callable[[Node], Any], nodes: Optional[Iterable[Node]] = None) \
+            -> List[Tuple[Node, Any, Optional[Exception]]]:
+        """func(node) на всех узлах параллельно: [(узел, результат, ошибка)]"""
+        nodes = list(nodes) if nodes is not None else self.nodes()
+        results = []
+        for node, result in zip(nodes, self.map(func, nodes)):
+            error = result if isinstance(result, Exception) else None
+            if self.multi:
+                node.mark(error)
+            results.append((node, None if error else result, error))
+        return results
+
+    def remember(self, container: str, node: Node):
+        with self._lock:
+            self._locations[container] = node.name
+
+    def forget(self, container: str):
+        with self._lock:
+            self._locations.pop(container, None)
+
+    def node_of(self, container: str) -> Optional[str]:
+        """Узел контейнера из последних списков (без запросов к Docker)"""
+        if not self.multi:
+            return self.default.name
+        return self._locations.get(container)
+
+    def locate(self, container: str) -> Node:
+        """Узел, на котором находится контейнер; не найден нигде — узел по умолчанию"""
+        if not self.multi:
+            return self.default
+        cached = self._locations.get(container)
+        if cached:
+            return self._nodes[cached]
+        found = [node for node, result, error in
+                 self.fan_out(lambda node: node.client.api.inspect_container(container)) if error is None]
+        if not found:
+            return self.default
+        self.remember(container, found[0])
+        return found[0]
+
+    def list_containers(self, **kwargs) -> Tuple[List[Tuple[Node, Any]], Dict[str, str]]:
+        """
+        containers.list(**kwargs) на всех узлах параллельно:
+        ([(узел, контейнер)], {узел: ошибка}). Обновляет карту расположения.
+        """
+        pairs, errors = [], {}
+        for node, containers, error in self.fan_out(lambda node: node.client.containers.list(**kwargs)):
+            if error is not None:
+                errors[node.name] = str(error)
+                continue
+            for container in containers:
+                pairs.append((node, container))
+        if self.multi:
+            with self._lock:
+                for node, container in pairs:
+                    self._locations[container.name] = node.name
+        return pairs, errors
+
+    # --- Размещение -----------------------------------------------------------
+
+    def capacity(self, node: Node) -> Dict:
+        """
+        Ёмкость узла и выделенное запущенным контейнерам по их профилям ресурсов
+        (один запрос списка без inspect и один запрос к базе)
+        """
+        import resources
+        host = resources.host_capacity(node)
+        summaries = node.client.api.containers(filters={'label': 'bot-manager=1'})
+        kinds = {(s.get('Names') or ['/'])[0].lstrip('/'): resources.container_kind(s.get('Labels'))
+                 for s in summaries}
+        memory = cpus = 0.0
+        for profile in resources.effective_profiles(kinds).values():
+            values = profile['values']
+            memory += values['mem_limit'] or 0
+            cpus += (values['nano_cpus'] or 0) / 1_000_000_000 or len(resources.cpuset_cores(values['cpuset_cpus']))
+        return {
+            'node': node.name,
+            'cpus': host['cpus'],
+            'memory': host['memory'],
+            'running': len(summaries),
+            'committed_memory': int(memory),
+            'committed_cpus': round(cpus, 2),
+            'free_memory': max(0, host['memory'] - int(memory)),
+            'free_cpus': round(max(0.0, host['cpus'] - cpus), 2),
+        }
+
+    def place(self, requested: Optional[Dict] = None) -> Node:
+        """
+        Узел для нового контейнера: из подходящих по запрошенным mem_limit/nano_cpus —
+        с наибольшей свободной долей памяти и CPU (при равенстве — меньше контейнеров)
+        """
+        if not self.multi:
+            return self.default
+        requested = requested or {}
+        need_memory = requested.get('mem_limit') or 0
+        need_cpus = (requested.get('nano_cpus') or 0) / 1_000_000_000
+        candidates = []
+        for node, cap, error in self.fan_out(self.capacity):
+            if error is not None:
+                print(f"[nodes] узел {node.name} пропущен при размещении: {error}")
+                continue
+            if cap['free_memory'] < need_memory or cap['free_cpus'] < need_cpus:
+                continue
+            score = (cap['free_memory'] / cap['memory'] if cap['memory'] else 0) + \
+                    (cap['free_cpus'] / cap['cpus'] if cap['cpus'] else 0)
+            candidates.append((-score, cap['running'], node.name, node))
+        if not candidates:
+            raise RuntimeError('Нет доступного узла с достаточными свободными ресурсами')
+        return min(candidates)[3]
+
+    def status(self) -> List[Dict]:
+        result = []
+        for node, cap, error in self.fan_out(self.capacity):
+            result.append({
+                'name': node.name,
+                'url': node.url,
+                'default': node is self.default,
+                'up': error is None,
+                'error': str(error) if error is not None else None,
+                'capacity': cap,
+                'containers': sum(1 for n in self._locations.values() if n == node.name)
+                if self.multi else None,
+            })
+        return result
+
+
+_registry_singleton: Optional[NodeRegistry] = None
+
+
+def get_node_registry() -> NodeRegistry:
+    global _registry_singleton
+    if _registry_singleton is None:
+        _registry_singleton = NodeRegistry(parse_nodes(cfg.DOCKER_NODES))
+    return _registry_singleton
+
+
+metrics.gauge_func('bot_manager_docker_nodes_down', 'Docker-узлы, не ответившие на последний запрос',
+                   lambda: sum(1 for node in get_node_registry().nodes() if node.last_error))
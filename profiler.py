@@ -0,0 +1,344 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Dict, List, Optional
+
+from flask import Blueprint, abort, g, jsonify, render_template, request, session
+
+from config import cfg
+
+# Текущий (самый вложенный) span запроса; у greenlet'ов и потоков свой контекст
+_current: ContextVar[Optional['Span']] = ContextVar('profiler_span', default=None)
+_SQL_PREVIEW = 200
+
+
+class Span:
+    __slots__ = ('name', 'category', 'start', 'end', 'args', 'children', 'parent')
+
+    def __init__(self, name: str, category: str, parent: Optional['Span'] = None, args: Optional[dict] = None):
+        self.name = name
+        self.category = category
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.args = args or {}
+        self.children: List['Span'] = []
+        self.parent = parent
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000
+
+    def as_dict(self, origin: float) -> Dict:
+        return {
+            'name': self.name,
+            'category': self.category,
+            'offset_ms': round((self.start - origin) * 1000, 3),
+            'duration_ms': round(self.duration_ms, 3),
+            'args': self.args,
+            'children': [c.as_dict(origin) for c in self.children],
+        }
+
+
+class _SpanContext:
+    """with span(...): открыть дочерний span, если запрос профилируется; иначе ничего не делать"""
+    __slots__ = ('name', 'category', 'args', 'span', 'token')
+
+    def __init__(self, name: str, category: str, args: Optional[dict]):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.span = None
+
+    def __enter__(self):
+        parent = _current.get()
+        if parent is not None:
+            self.span = Span(self.name, self.category, parent, self.args)
+            parent.children.append(self.span)
+            self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, *exc):
+        if self.span is not None:
+            self.span.end = time.perf_counter()
+            _current.reset(self.token)
+        return False
+
+
+def span(name: str, category: str = 'app', **args) -> _SpanContext:
+    return _SpanContext(name, category, args or None)
+
+
+def active() -> bool:
+    return _current.get() is not None
+
+
+def profiled(category: str, name: Optional[str] = None):
+    """Декоратор: вызов функции — отдельный span (например, backend.run)"""
+    def decorator(func):
+        label = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(label, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TraceStore:
+    """Последние и самые медленные трассы (кольцевой буфер + куча на ``keep`` записей)"""
+
+    def __init__(self, keep: int):
+        self.keep = keep
+        self._recent = deque(maxlen=keep)
+        self._slowest: List = []
+        self._by_id: Dict[int, dict] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add(self, trace: dict):
+        with self._lock:
+            trace['id'] = next(self._ids)
+            if len(self._recent) == self._recent.maxlen:
+                evicted = self._recent.popleft()
+                if not any(e[2] is evicted for e in self._slowest):
+                    self._by_id.pop(evicted['id'], None)
+            self._recent.append(trace)
+            entry = (trace['duration_ms'], trace['id'], trace)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif entry[0] > self._slowest[0][0]:
+                _, _, evicted = heapq.heapreplace(self._slowest, entry)
+                # Трасса доступна по id, пока она есть хотя бы в одном из списков
+                if not any(t is evicted for t in self._recent):
+                    self._by_id.pop(evicted['id'], None)
+            self._by_id[trace['id']] = trace
+
+    def get(self, trace_id: int) -> Optional[dict]:
+        return self._by_id.get(trace_id)
+
+    def slowest(self) -> List[dict]:
+        with self._lock:
+            return [e[2] for e in sorted(self._slowest, key=lambda e: -e[0])]
+
+    def recent(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self._recent))
+
+    def clear(self):
+        with self._lock:
+            self._recent.clear()
+            self._slowest.clear()
+            self._by_id.clear()
+
+
+_store: Optional[TraceStore] = None
+
+
+def get_trace_store() -> TraceStore:
+    global _store
+    if _store is None:
+        _store = TraceStore(cfg.PROFILE_KEEP)
+    return _store
+
+
+def _summary(root: Span) -> Dict[str, dict]:
+    """Суммарное время и число span'ов по категориям"""
+    totals: Dict[str, dict] = {}
+    stack = list(root.children)
+    while stack:
+        node = stack.pop()
+        item = totals.setdefault(node.category, {'count': 0, 'total_ms': 0.0})
+        item['count'] += 1
+        item['total_ms'] = round(item['total_ms'] + node.duration_ms, 3)
+        stack.extend(node.children)
+    return totals
+
+
+def to_chrome_trace(trace: dict) -> Dict:
+    """Трасса в формате Chrome trace events (chrome://tracing, Perfetto)"""
+    events = []
+
+    def walk(node: dict, base_us: float):
+        events.append({
+            'name': node['name'],
+            'cat': node['category'],
+            'ph': 'X',
+            'ts': round(base_us + node['offset_ms'] * 1000, 3),
+            'dur': round(node['duration_ms'] * 1000, 3),
+            'pid': 1,
+            'tid': 1,
+            'args': node['args'],
+        })
+        for child in node['children']:
+            walk(child, base_us)
+
+    walk(trace['root'], trace['started_at_us'])
+    return {'traceEvents': events, 'displayTimeUnit': 'ms',
+            'otherData': {'method': trace['method'], 'path': trace['path']}}
+
+
+# --- Подключение к Flask, SQLAlchemy и Docker ---------------------------------
+
+def _should_profile() -> bool:
+    if cfg.PROFILE_ENABLED:
+        return True
+    # Все пользователи менеджера — администраторы; заголовок учитывается только с сессией
+    return bool(request.headers.get(cfg.PROFILE_HEADER)) and bool(session.get('user_id'))
+
+
+def init_app(app):
+    """Включить профилирование запросов (регистрировать до остальных before_request)"""
+    from flask import before_render_template, template_rendered
+
+    @app.before_request
+    def _profile_start():
+        if not _should_profile():
+            return
+        root = Span(f'{request.method} {request.path}', 'request')
+        g._profile_root = root
+        g._profile_wall = time.time()
+        g._profile_token = _current.set(root)
+
+    @app.after_request
+    def _profile_finish(response):
+        root = g.pop('_profile_root', None)
+        if root is None:
+            return response
+        root.end = time.perf_counter()
+        _current.reset(g.pop('_profile_token'))
+        if root.duration_ms >= cfg.PROFILE_MIN_MS:
+            started_at = g.pop('_profile_wall')
+            get_trace_store().add({
+                'method': request.method,
+                'path': request.full_path.rstrip('?'),
+                'endpoint': request.endpoint,
+                'status': response.status_code,
+                'started_at': datetime.utcfromtimestamp(started_at).isoformat() + 'Z',
+                'started_at_us': started_at * 1_000_000,
+                'duration_ms': round(root.duration_ms, 3),
+                'summary': _summary(root),
+                'root': root.as_dict(root.start),
+            })
+        response.headers['X-Profile-Duration-Ms'] = f'{root.duration_ms:.1f}'
+        return response
+
+    @app.teardown_request
+    def _profile_cleanup(exc):
+        # Запрос завершился исключением до after_request — не оставляем span в контексте
+        token = g.pop('_profile_token', None)
+        if token is not None:
+            _current.reset(token)
+
+    def _template_start(sender, template, context, **extra):
+        parent = _current.get()
+        if parent is not None:
+            child = Span(template.name or 'template', 'template', parent)
+            parent.children.append(child)
+            _current.set(child)
+
+    def _template_done(sender, template, context, **extra):
+        node = _current.get()
+        if node is not None and node.category == 'template':
+            node.end = time.perf_counter()
+            _current.set(node.parent)
+
+    before_render_template.connect(_template_start, app, weak=False)
+    template_rendered.connect(_template_done, app, weak=False)
+
+
+def instrument_engine(engine):
+    """Span на каждый SQL-запрос движка SQLAlchemy"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        parent = _current.get()
+        if parent is None:
+            return
+        child = Span(statement.split(None, 1)[0].upper() if statement else 'SQL', 'sql', parent,
+                     {'statement': statement[:_SQL_PREVIEW]})
+        parent.children.append(child)
+        context._profile_span = child
+        context._profile_token = _current.set(child)
+
+    def _finish(context):
+        child = getattr(context, '_profile_span', None)
+        if child is not None:
+            child.end = time.perf_counter()
+            _current.reset(context._profile_token)
+            context._profile_span = None
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        _finish(context)
+
+    @event.listens_for(engine, 'handle_error')
+    def _error(exception_context):
+        if exception_context.execution_context is not None:
+            _finish(exception_context.execution_context)
+
+
+def instrument_docker_client(client):
+    """Span на каждый HTTP-запрос клиента docker к демону"""
+    from metrics import docker_path_template
+    api = client.api
+    if getattr(api, '_profile_instrumented', False):
+        return client
+    original_send = api.send
+
+    def send(req, **kwargs):
+        if _current.get() is None:
+            return original_send(req, **kwargs)
+        with span(f'{req.method} {docker_path_template(req.url)}', 'docker'):
+            return original_send(req, **kwargs)
+
+    api.send = send
+    api._profile_instrumented = True
+    return client
+
+
+# --- Страница и API -----------------------------------------------------------
+
+bp_profiler = Blueprint('profiler', __name__)
+
+
+@bp_profiler.route('/admin/profiler')
+def profiler_page():
+    store = get_trace_store()
+    return render_template('profiler.html', slowest=store.slowest(), recent=store.recent(),
+                           enabled=cfg.PROFILE_ENABLED, header=cfg.PROFILE_HEADER)
+
+
+@bp_profiler.route('/api/profiler/traces')
+def list_traces():
+    store = get_trace_store()
+    brief = lambda t: {k: v for k, v in t.items() if k != 'root'}
+    return jsonify({'status': 'ok', 'slowest': [brief(t) for t in store.slowest()],
+                    'recent': [brief(t) for t in store.recent()]})
+
+
+@bp_profiler.route('/api/profiler/traces/<int:trace_id>')
+def get_trace(trace_id: int):
+    trace = get_trace_store().get(trace_id)
+    if trace is None:
+        abort(404)
+    if request.args.get('format') == 'chrome':
+        response = jsonify(to_chrome_trace(trace))
+        response.headers['Content-Disposition'] = f'attachment; filename=trace-{trace_id}.json'
+        return response
+    return jsonify({'status': 'ok', 'trace': trace})
+
+
+@bp_profiler.route('/api/profiler/traces', methods=['DELETE'])
+def clear_traces():
+    get_trace_store().clear()
+    return jsonify({'status': 'ok'})
@@ -0,0 +1,155 @@
+import sqlite3
+import threading
+import time
+from math import floor
+from typing import Tuple
+
+from limits.storage import Storage, SlidingWindowCounterSupport
+from limits.storage.base import TimestampedSlidingWindow
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    expires REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+_INCR = """
+INSERT INTO counters(key, value, expires) VALUES (:key, :amount, :expires)
+ON CONFLICT(key) DO UPDATE SET
+    value = CASE WHEN expires <= :now THEN excluded.value ELSE value + excluded.value END,
+    expires = CASE WHEN expires <= :now THEN excluded.expires ELSE expires END
+RETURNING value
+"""
+
+
+class SQLiteStorage(Storage, SlidingWindowCounterSupport, TimestampedSlidingWindow):
+    """
+    Хранилище счётчиков Flask-Limiter в общей базе SQLite.
+
+    Все воркеры gunicorn на одной машине видят одни и те же счётчики —
+    локальная замена Redis, когда его нет. Регистрируется в ``limits``
+    под схемой ``sqlite://<путь к файлу>``, например
+    ``sqlite:///var/lib/bot-manager/ratelimit.db``.
+
+    Проверка скользящего окна (sliding-window-counter) выполняется одной
+    транзакцией ``BEGIN IMMEDIATE``: чтение двух счётчиков и инкремент
+    не пересекаются с другими процессами, откат при гонке не нужен.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+    CLEANUP_INTERVAL = 60
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        self.path = uri[len('sqlite://'):]
+        if not self.path:
+            raise ValueError('Не указан путь к базе ограничений: sqlite://<путь>')
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self._conn().executescript(_SCHEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: транзакции открываются явно
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            # Счётчики не критичны к потере при сбое питания
+            conn.execute('PRAGMA synchronous=OFF')
+            self._local.conn = conn
+        return conn
+
+    def _incr(self, conn: sqlite3.Connection, key: str, expiry: float, amount: int, now: float) -> int:
+        row = conn.execute(_INCR, {'key': key, 'amount': amount, 'expires': now + expiry, 'now': now}).fetchone()
+        return row[0]
+
+    def _cleanup(self, conn: sqlite3.Connection, now: float):
+        if now - self._last_cleanup < self.CLEANUP_INTERVAL:
+            return
+        self._last_cleanup = now
+        conn.execute('DELETE FROM counters WHERE expires <= ?', (now,))
+
+    # --- Storage --------------------------------------------------------
+
+    def incr(self, key: str, expiry: int, amount: int = 1) -> int:
+        now = time.time()
+        conn = self._conn()
+        self._cleanup(conn, now)
+        return self._incr(conn, key, expiry, amount, now)
+
+    def get(self, key: str) -> int:
+        row = self._conn().execute(
+            'SELECT value FROM counters WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._conn().execute(
+            'SELECT expires FROM counters WHERE key = ? AND expires > ?', (key, now)).fetchone()
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        try:
+            self._conn().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> int:
+        conn = self._conn()
+        count = conn.execute('SELECT count(*) FROM counters').fetchone()[0]
+        conn.execute('DELETE FROM counters')
+        return count
+
+    def clear(self, key: str) -> None:
+        self._conn().execute('DELETE FROM counters WHERE key = ?', (key,))
+
+    # --- Скользящее окно ------------------------------------------------
+
+    def _window_info(self, conn: sqlite3.Connection, key: str, expiry: int,
+                     now: float) -> Tuple[int, float, int, float]:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, now)
+        counts = dict(conn.execute(
+            'SELECT key, value FROM counters WHERE key IN (?, ?) AND expires > ?',
+            (previous_key, current_key, now)).fetchall())
+        previous_count = counts.get(previous_key, 0)
+        current_count = counts.get(current_key, 0)
+        previous_ttl = 0.0 if previous_count == 0 else (1 - (((now - expiry) / expiry) % 1)) * expiry
+        current_ttl = (1 - ((now / expiry) % 1)) * expiry + expiry
+        return previous_count, previous_ttl, current_count, current_ttl
+
+    def acquire_sliding_window_entry(self, key: str, limit: int, expiry: int, amount: int = 1) -> bool:
+        if amount > limit:
+            return False
+        now = time.time()
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            previous_count, previous_ttl, current_count, _ = self._window_info(conn, key, expiry, now)
+            weighted = previous_count * previous_ttl / expiry + current_count
+            if floor(weighted) + amount > limit:
+                conn.execute('ROLLBACK')
+                return False
+            _, current_key = self.sliding_window_keys(key, expiry, now)
+            # Счётчик окна живёт два периода: он ещё нужен как «предыдущий»
+            self._incr(conn, current_key, 2 * expiry, amount, now)
+            conn.execute('COMMIT')
+            return True
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+
+    def get_sliding_window(self, key: str, expiry: int) -> Tuple[int, float, int, float]:
+        return self._window_info(self._conn(), key, expiry, time.time())
+
+    def clear_sliding_window(self, key: str, expiry: int) -> None:
+        previous_key, current_key = self.sliding_window_keys(key, expiry, time.time())
+        self._conn().execute('DELETE FROM counters WHERE key IN (?, ?)', (previous_key, current_key))
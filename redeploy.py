@@ -0,0 +1,422 @@
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from docker.errors import NotFound
+from flask import current_app
+from git import Repo
+
+from config import cfg
+import metrics
+import profiler
+
+try:
+    import greenlet  # type: ignore
+    from eventlet import tpool  # type: ignore
+except ImportError:  # pragma: no cover - без eventlet всё выполняется в потоках
+    tpool = None
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+PHASES = ('fetch', 'build', 'start', 'health', 'swap', 'rollback')
+
+REDEPLOY_PHASE_SECONDS = metrics.Histogram('bot_manager_redeploy_phase_seconds', 'Длительность фаз редеплоя бота',
+                                           ('phase',),
+                                           buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+REDEPLOYS = metrics.Counter('bot_manager_redeploys_total', 'Редеплои ботов по результату', ('result',))
+
+# Редеплои, которые выполняет этот процесс: имя -> файл блокировки в каталоге логов.
+# Блокировка файла не даёт начать второй редеплой бота в другом воркере,
+# а ход и итоги редеплоев хранятся в базе (таблица redeploys) и видны всем воркерам.
+_active: Dict[str, object] = {}
+_active_lock = threading.Lock()
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z' if ts else None
+
+
+def _blocking(func, *args):
+    """Блокирующий вызов без остановки хаба: в greenthread'е — через tpool eventlet"""
+    if tpool is not None and greenlet.getcurrent().parent is not None:
+        return tpool.execute(func, *args)
+    return func(*args)
+
+
+def _source_dir(container, name: str) -> str:
+    """Каталог исходников бота: источник bind-монтирования /app, иначе bots/<имя>"""
+    for mount in container.attrs.get('Mounts') or []:
+        if mount.get('Destination') == '/app' and mount.get('Type', 'bind') == 'bind':
+            return mount['Source']
+    return os.path.join(cfg.BOTS_DIR, name)
+
+
+def _fetch_sources(path: str, branch: Optional[str]) -> Optional[Dict]:
+    """
+    git fetch ветки в репозитории бота; рабочий каталог не меняется. Возвращает
+    ревизию для сборки и текущее состояние (для отката), None — каталог без
+    .git или без remote: собирается как есть.
+    """
+    if not os.path.isdir(os.path.join(path, '.git')):
+        return None
+    repo = Repo(path)
+    try:
+        remote = repo.remote()
+    except ValueError:
+        return None
+    current = None if repo.head.is_detached else repo.active_branch.name
+    branch = branch or current
+    args = [remote.name] + ([branch] if branch else [])
+    if cfg.GIT_CLONE_DEPTH:
+        repo.git.fetch(*args, depth=cfg.GIT_CLONE_DEPTH)
+    else:
+        repo.git.fetch(*args)
+    return {
+        'revision': repo.rev_parse('FETCH_HEAD').hexsha,
+        'branch': branch,
+        'previous': repo.head.commit.hexsha,
+        'previous_branch': current,
+    }
+
+
+def _export_tree(path: str, revision: str, dest: str):
+    """Отслеживаемые файлы ревизии (git archive) в каталог dest — контекст сборки без данных бота"""
+    shutil.rmtree(dest, ignore_errors=True)
+    os.makedirs(dest)
+    with tempfile.TemporaryFile() as archive:
+        Repo(path).archive(archive, treeish=revision, format='tar')
+        archive.seek(0)
+        with tarfile.open(fileobj=archive) as tar:
+            if hasattr(tarfile, 'tar_filter'):
+                tar.extractall(dest, filter='tar')
+            else:  # pragma: no cover - Python без фильтров извлечения
+                tar.extractall(dest)
+
+
+def _checkout(path: str, revision: str, branch: Optional[str]):
+    """
+    Перевести рабочий каталог на ревизию: меняются только отслеживаемые файлы
+    (локальные правки сбрасываются), неотслеживаемые — данные бота — остаются.
+    """
+    repo = Repo(path)
+    if branch:
+        repo.git.checkout('-f', '-B', branch, revision)
+    else:
+        repo.git.checkout('-f', '--detach', revision)
+
+
+class _Redeploy:
+    """
+    Один редеплой бота. Старый контейнер работает, пока новый собирается и
+    проверяется под временным именем <имя>-next; после готовности контейнеры
+    меняются именами, старый останавливается и удаляется. При ошибке всё
+    сделанное откатывается, старый контейнер продолжает работу.
+
+    Каталог бота не копируется и не подменяется: данные, которые старый
+    контейнер пишет во время редеплоя, остаются на месте. Образ собирается из
+    выгрузки отслеживаемых файлов новой ревизии в <каталог>.next; перед запуском
+    нового контейнера ревизия извлекается в сам каталог бота (меняются только
+    отслеживаемые файлы), при откате возвращается прежняя.
+    """
+
+    def __init__(self, name: str, branch: Optional[str]):
+        from nodes import get_node_registry
+        self.name = name
+        self.branch = branch or None
+        self.node = get_node_registry().locate(name)
+        self.cli = self.node.client
+        self.temp_name = f'{name}-next'
+        self.prev_name = f'{name}-prev'
+        self.repo_tag = f'bot-{name}'
+        self.phases: Dict[str, int] = {}
+        self.warnings: List[str] = []
+        self.started_at = time.time()
+        self.revision: Optional[str] = None
+        self.previous_image: Optional[str] = None
+        self.image: Optional[str] = None
+        self.new = None
+        self.update: Optional[Dict] = None
+        self.sources_updated = False
+        self.logs: Optional[str] = None
+        self.record_id: Optional[int] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.perf_counter()
+        try:
+            with profiler.span(f'redeploy.{name}', 'redeploy'):
+                yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.phases[name] = round(elapsed * 1000)
+            REDEPLOY_PHASE_SECONDS.observe((name,), elapsed)
+
+    def check(self):
+        """Проверки до начала редеплоя (ValueError — редеплой невозможен)"""
+        try:
+            self.old = self.cli.containers.get(self.name)
+        except NotFound:
+            raise ValueError(f'Контейнер {self.name} не найден')
+        if self.old.labels.get('workspace') == '1':
+            raise ValueError('Редеплой доступен только для ботов')
+        self.bot_dir = _source_dir(self.old, self.name)
+        if not os.path.isdir(self.bot_dir):
+            raise ValueError(f'Каталог бота не найден: {self.bot_dir}')
+        self.staging = self.bot_dir + '.next'
+        self.previous_image = self.old.image.id
+
+    def run(self) -> Dict:
+        old = self.old
+        try:
+            with self.phase('fetch'):
+                self._fetch()
+            with self.phase('build'):
+                self._build(old)
+            with self.phase('start'):
+                self._start()
+            with self.phase('health'):
+                problem = self._wait_ready()
+            if problem:
+                raise RuntimeError(f'новый контейнер не готов: {problem}')
+            with self.phase('swap'):
+                self._swap(old)
+        except Exception as e:
+            started = self.new is not None
+            with self.phase('rollback'):
+                self._rollback()
+            return self._finish('rolled_back' if started else 'failed', str(e))
+        return self._finish('deployed')
+
+    def _fetch(self):
+        self.update = _fetch_sources(self.bot_dir, self.branch)
+        if self.update is None:
+            if os.path.isdir(os.path.join(self.bot_dir, '.git')):
+                self.revision = Repo(self.bot_dir).head.commit.hexsha[:12]
+            return
+        self.revision = self.update['revision'][:12]
+        _export_tree(self.bot_dir, self.update['revision'], self.staging)
+
+    def _build(self, old):
+        from docker_api import build_bot_image
+        # Предыдущий образ остаётся доступен как :previous — для отката и ручного возврата
+        old.image.tag(self.repo_tag, 'previous')
+        context = self.staging if self.update else self.bot_dir
+        image = build_bot_image(self.cli, context, os.path.basename(self.bot_dir), self.repo_tag)
+        self.image = image.id
+
+    def _start(self):
+        from docker_api import run_bot_container
+        from resources import run_kwargs
+        self._remove_stale(self.temp_name)
+        if self.update:
+            # Старый контейнер уже загрузил свой код; его данные в каталоге не трогаются
+            self.sources_updated = True
+            _checkout(self.bot_dir, self.update['revision'], self.update['branch'])
+        self.new = run_bot_container(self.cli, self.image, self.temp_name, self.bot_dir,
+                                     run_kwargs(self.name, 'bot'))
+
+    def _wait_ready(self) -> Optional[str]:
+        """None — контейнер готов, иначе причина отказа"""
+        deadline = time.monotonic() + cfg.REDEPLOY_HEALTH_TIMEOUT
+        since = time.monotonic()
+        first_start = None
+        while True:
+            self.new.reload()
+            state = self.new.attrs.get('State') or {}
+            if first_start is None:
+                first_start = state.get('StartedAt')
+            if not state.get('Running'):
+                self._capture_logs()
+                return f"завершился с кодом {state.get('ExitCode')}"
+            if state.get('StartedAt') != first_start:
+                self._capture_logs()
+                return 'перезапускался'
+            health = (state.get('Health') or {}).get('Status')
+            if health == 'healthy':
+                return None
+            if health == 'unhealthy':
+                self._capture_logs()
+                return 'healthcheck: unhealthy'
+            if health is None and time.monotonic() - since >= cfg.REDEPLOY_STABLE_SECONDS:
+                return None
+            if time.monotonic() >= deadline:
+                return f'нет готовности за {cfg.REDEPLOY_HEALTH_TIMEOUT:g} с'
+            time.sleep(cfg.REDEPLOY_POLL_INTERVAL)
+
+    def _swap(self, old):
+        from docker_api import _expect_stop
+        from nodes import get_node_registry
+        self._remove_stale(self.prev_name)
+        old.rename(self.prev_name)
+        try:
+            self.new.rename(self.name)
+        except Exception:
+            old.rename(self.name)
+            raise
+        # С этого момента под именем бота работает новый контейнер — отката нет
+        get_node_registry().remember(self.name, self.node)
+        self.new = None
+        try:
+            _expect_stop(self.prev_name)
+            old.stop(timeout=cfg.REDEPLOY_STOP_TIMEOUT)
+            old.remove()
+        except Exception as e:
+            self.warnings.append(f'старый контейнер {self.prev_name} не удалён: {e}')
+        shutil.rmtree(self.staging, ignore_errors=True)
+
+    def _rollback(self):
+        from docker_api import _expect_stop
+        if self.new is not None:
+            try:
+                _expect_stop(self.temp_name)
+                self.new.remove(force=True)
+            except Exception as e:
+                self.warnings.append(f'временный контейнер {self.temp_name} не удалён: {e}')
+        if self.sources_updated:
+            try:
+                _checkout(self.bot_dir, self.update['previous'], self.update['previous_branch'])
+            except Exception as e:
+                self.warnings.append(f'исходники не возвращены на {self.update["previous"][:12]}: {e}')
+        shutil.rmtree(self.staging, ignore_errors=True)
+        if self.image and self.previous_image:
+            try:
+                self.cli.images.get(self.previous_image).tag(self.repo_tag, 'latest')
+            except Exception as e:
+                self.warnings.append(f'тег {self.repo_tag} не возвращён на прежний образ: {e}')
+
+    def _remove_stale(self, name: str):
+        """Контейнер, оставшийся от прерванного редеплоя"""
+        try:
+            self.cli.containers.get(name).remove(force=True)
+        except NotFound:
+            pass
+
+    def _capture_logs(self):
+        try:
+            self.logs = self.new.logs(tail=50).decode('utf-8', errors='replace')
+        except Exception:
+            pass
+
+    def record(self, result: str, error: Optional[str] = None, finished_at: Optional[float] = None) -> Dict:
+        return {
+            'name': self.name,
+            'result': result,
+            'error': error,
+            'node': self.node.name,
+            'branch': self.branch,
+            'revision': self.revision,
+            'image': self.image[:19] if self.image else None,
+            'previous_image': self.previous_image[:19] if self.previous_image else None,
+            'phases': {phase: self.phases[phase] for phase in PHASES if phase in self.phases},
+            'total_ms': round((finished_at - self.started_at) * 1000) if finished_at else None,
+            'started_at': _iso(self.started_at),
+            'finished_at': _iso(finished_at),
+            'warnings': self.warnings,
+            'logs': self.logs,
+        }
+
+    def _finish(self, result: str, error: Optional[str] = None) -> Dict:
+        from auth import finish_redeploy_record
+        from docker_api import bump_state_version
+        record = self.record(result, error, time.time())
+        REDEPLOYS.inc((result,))
+        try:
+            finish_redeploy_record(self.record_id, record, cfg.REDEPLOY_HISTORY)
+        except Exception as e:
+            print(f"[redeploy] {self.name}: не удалось сохранить итог: {e}")
+        bump_state_version()
+        phases = ', '.join(f'{phase} {ms} мс' for phase, ms in record['phases'].items())
+        print(f"[redeploy] {self.name}: {result}{f' ({error})' if error else ''}; {phases}")
+        return record
+
+
+def start_redeploy(name: str, branch: Optional[str] = None) -> Dict:
+    """
+    Пересобрать и перезапустить бота без простоя: сборка и проверка нового
+    контейнера идут, пока работает старый. Редеплой выполняется в фоновой
+    задаче SocketIO (шаги Docker, git и ожидание — через tpool, хаб eventlet
+    не останавливается); ошибки проверок (ValueError) — сразу. Результат —
+    в redeploy_status: 'deployed', 'rolled_back' (новый контейнер не прошёл
+    проверку) или 'failed' (ошибка до запуска), длительности фаз в 'phases' (мс).
+    """
+    from auth import add_redeploy_record
+    _claim(name)
+    try:
+        job = _blocking(_Redeploy, name, branch)
+        _blocking(job.check)
+        job.record_id = _blocking(add_redeploy_record, name, job.record('running'))
+    except Exception:
+        _release(name)
+        raise
+
+    def run():
+        try:
+            _blocking(job.run)
+        except Exception as e:
+            print(f"[redeploy] {name}: прерван: {e}")
+        finally:
+            _release(name)
+
+    current_app.extensions['socketio'].start_background_task(run)
+    return {'name': name, 'node': job.node.name, 'branch': job.branch, 'started_at': _iso(job.started_at)}
+
+
+def _lock_path(name: str) -> str:
+    return os.path.join(cfg.LOGS_DIR, f'redeploy-{name}.lock')
+
+
+def _claim(name: str):
+    """Занять редеплой бота во всех воркерах (ValueError — уже выполняется)"""
+    with _active_lock:
+        if name in _active:
+            raise ValueError(f'Редеплой {name} уже выполняется')
+        lock_file = None
+        if fcntl:
+            lock_file = open(_lock_path(name), 'w')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                raise ValueError(f'Редеплой {name} уже выполняется')
+        _active[name] = lock_file
+
+
+def _release(name: str):
+    with _active_lock:
+        lock_file = _active.pop(name, None)
+    if lock_file is not None:
+        lock_file.close()  # снимает блокировку
+
+
+def _lock_held(name: str) -> bool:
+    """Держит ли блокировку редеплоя бота какой-либо процесс"""
+    if name in _active:
+        return True
+    if not fcntl:
+        return False
+    try:
+        with open(_lock_path(name), 'w') as probe:
+            fcntl.flock(probe, fcntl.LOCK_SH | fcntl.LOCK_NB)
+    except OSError:
+        return True
+    return False
+
+
+def redeploy_status(name: str) -> Dict:
+    """Идёт ли редеплой бота и последние завершённые редеплои (новые первыми) — из базы"""
+    from auth import load_redeploy_records
+    records = load_redeploy_records(name, cfg.REDEPLOY_HISTORY + 1)
+    running = bool(records) and records[0]['result'] == 'running'
+    # 'running' без блокировки — процесс, выполнявший редеплой, завершился
+    in_progress = running and _lock_held(name)
+    history = [r for r in records if r['result'] != 'running'][:cfg.REDEPLOY_HISTORY]
+    return {'in_progress': in_progress, 'history': history}
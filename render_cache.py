@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Callable, Dict, Hashable, Optional
+
+
+class FragmentCache:
+    """
+    Кэш отрендеренных HTML-фрагментов.
+
+    Фрагмент хранится вместе с ключом версии (например, версией состояния
+    контейнеров). Пока ключ совпадает и не истёк TTL, отдаётся готовый HTML
+    без обращения к Docker. Одновременные запросы одного фрагмента ждут
+    единственного рендера вместо того, чтобы рендерить его параллельно.
+    """
+
+    def __init__(self, ttl: float = 15):
+        self.ttl = ttl
+        self._entries: Dict[str, dict] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._guard:
+            lock = self._locks.get(name)
+            if lock is None:
+                lock = self._locks[name] = threading.Lock()
+            return lock
+
+    def _lookup(self, name: str, key: Hashable) -> Optional[str]:
+        entry = self._entries.get(name)
+        if not entry or entry['key'] != key:
+            return None
+        if self.ttl and time.monotonic() - entry['rendered_at'] > self.ttl:
+            return None
+        return entry['html']
+
+    def get_or_render(self, name: str, key: Hashable, render: Callable[[], str]) -> str:
+        """Вернуть фрагмент из кэша или отрендерить его заново"""
+        html = self._lookup(name, key)
+        if html is not None:
+            return html
+
+        with self._lock_for(name):
+            # Пока ждали блокировку, фрагмент мог отрендерить другой запрос
+            html = self._lookup(name, key)
+            if html is not None:
+                return html
+            html = render()
+            self._entries[name] = {'key': key, 'html': html, 'rendered_at': time.monotonic()}
+            return html
+
+    def invalidate(self, name: Optional[str] = None):
+        """Сбросить один фрагмент или весь кэш"""
+        if name is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(name, None)
@@ -0,0 +1,400 @@
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from config import cfg
+
+FIELDS = ('mem_limit', 'nano_cpus', 'cpuset_cpus', 'pids_limit', 'blkio_weight')
+KINDS = ('bot', 'workspace')
+
+# Поле профиля -> ключ HostConfig (он же ключ тела POST /containers/{id}/update)
+_HOST_CONFIG_KEYS = {
+    'mem_limit': 'Memory',
+    'nano_cpus': 'NanoCpus',
+    'cpuset_cpus': 'CpusetCpus',
+    'pids_limit': 'PidsLimit',
+    'blkio_weight': 'BlkioWeight',
+}
+
+_MEM_UNITS = {'': 1, 'b': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3, 't': 1024 ** 4}
+_MEM_RE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([bkmgt]?)b?\s*$', re.IGNORECASE)
+_CPUSET_RE = re.compile(r'^\d+(-\d+)?(,\d+(-\d+)?)*$')
+
+# Docker не даёт создать контейнер с лимитом памяти меньше 6 МБ
+MIN_MEMORY = 6 * 1024 * 1024
+
+_host_lock = threading.Lock()
+# Узел -> (ёмкость, время получения)
+_host_cache: Dict[str, Tuple[Dict, float]] = {}
+
+
+def _blank(value) -> bool:
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def parse_memory(value) -> Optional[int]:
+    """'512m' / '1.5g' / 1048576 -> байты; пусто -> None; 0 -> без ограничения"""
+    if _blank(value):
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        amount = int(value)
+    else:
+        match = _MEM_RE.match(str(value))
+        if not match:
+            raise ValueError(f'Неверный размер памяти: {value!r} (пример: 512m, 2g)')
+        amount = int(float(match.group(1)) * _MEM_UNITS[match.group(2).lower()])
+    if amount < 0 or 0 < amount < MIN_MEMORY:
+        raise ValueError('Лимит памяти должен быть не меньше 6m (0 — без ограничения)')
+    return amount
+
+
+def parse_cpus(value) -> Optional[int]:
+    """'1.5' -> 1_500_000_000 (nano_cpus); пусто -> None; 0 -> без ограничения"""
+    if _blank(value):
+        return None
+    try:
+        cpus = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'Неверное число CPU: {value!r} (пример: 0.5, 2)')
+    if cpus < 0:
+        raise ValueError('Число CPU не может быть отрицательным')
+    return int(round(cpus * 1_000_000_000))
+
+
+def cpuset_cores(value: Optional[str]) -> List[int]:
+    """'0-2,5' -> [0, 1, 2, 5]"""
+    cores = set()
+    for part in (value or '').split(','):
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        cores.update(range(int(start), int(end or start) + 1))
+    return sorted(cores)
+
+
+def parse_cpuset(value) -> Optional[str]:
+    if _blank(value):
+        return None
+    value = str(value).replace(' ', '')
+    if not _CPUSET_RE.match(value):
+        raise ValueError(f'Неверный набор ядер: {value!r} (пример: 0-3,6)')
+    for part in value.split(','):
+        start, _, end = part.partition('-')
+        if end and int(end) < int(start):
+            raise ValueError(f'Неверный диапазон ядер: {part}')
+    return value
+
+
+def _parse_int(value, name: str, low: int, high: Optional[int] = None) -> Optional[int]:
+    if _blank(value):
+        return None
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name}: ожидается целое число')
+    if number < low or (high is not None and number > high):
+        raise ValueError(f'{name}: допустимо {low}..{high}' if high is not None else f'{name}: минимум {low}')
+    return number
+
+
+def parse_profile(data: Dict) -> Dict:
+    """
+    Профиль из JSON/формы. Память принимается в виде '512m', CPU — как ``cpus``
+    ('1.5') или ``nano_cpus``. Пустое значение — наследовать уровень выше,
+    0 — явно без ограничения. Возвращаются только переданные поля.
+    """
+    profile = {}
+    if 'mem_limit' in data:
+        profile['mem_limit'] = parse_memory(data['mem_limit'])
+    if 'cpus' in data:
+        profile['nano_cpus'] = parse_cpus(data['cpus'])
+    elif 'nano_cpus' in data:
+        profile['nano_cpus'] = _parse_int(data['nano_cpus'], 'nano_cpus', 0)
+    if 'cpuset_cpus' in data:
+        profile['cpuset_cpus'] = parse_cpuset(data['cpuset_cpus'])
+    if 'pids_limit' in data:
+        profile['pids_limit'] = _parse_int(data['pids_limit'], 'pids_limit', 0)
+    if 'blkio_weight' in data:
+        weight = _parse_int(data['blkio_weight'], 'blkio_weight', 0, 1000)
+        if weight and weight < 10:
+            raise ValueError('blkio_weight: допустимо 10..1000 (0 — по умолчанию)')
+        profile['blkio_weight'] = weight
+    return profile
+
+
+def format_memory(value: Optional[int]) -> str:
+    if not value:
+        return '—'
+    for unit in ('T', 'G', 'M', 'K'):
+        size = _MEM_UNITS[unit.lower()]
+        if value >= size:
+            return f'{value / size:.1f}'.rstrip('0').rstrip('.') + unit
+    return f'{value}B'
+
+
+def default_key(kind: str) -> str:
+    """Имя строки профиля по умолчанию: '@bot' / '@workspace'"""
+    return f'@{kind}'
+
+
+def config_defaults(kind: str) -> Dict:
+    prefix = 'WORKSPACE' if kind == 'workspace' else 'BOT'
+    return {
+        'mem_limit': parse_memory(getattr(cfg, f'{prefix}_MEM_LIMIT')),
+        'nano_cpus': parse_cpus(getattr(cfg, f'{prefix}_CPUS')),
+        'cpuset_cpus': None,
+        'pids_limit': _parse_int(getattr(cfg, f'{prefix}_PIDS_LIMIT'), f'{prefix}_PIDS_LIMIT', 0),
+        'blkio_weight': _parse_int(cfg.RESOURCE_BLKIO_WEIGHT, 'RESOURCE_BLKIO_WEIGHT', 0, 1000),
+    }
+
+
+def container_kind(labels: Optional[Dict]) -> str:
+    return 'workspace' if (labels or {}).get('workspace') == '1' else 'bot'
+
+
+def _row_values(row) -> Dict:
+    return {field: getattr(row, field) for field in FIELDS} if row is not None else {}
+
+
+def _merge(name: str, kind: str, profiles: Dict) -> Dict:
+    """Поле за полем: профиль контейнера -> '@kind' в базе -> переменные окружения"""
+    layers = (
+        ('container', _row_values(profiles.get(name))),
+        ('default', _row_values(profiles.get(default_key(kind)))),
+        ('config', config_defaults(kind)),
+    )
+    values, sources = {}, {}
+    for field in FIELDS:
+        values[field], sources[field] = None, None
+        for source, layer in layers:
+            if layer.get(field) is not None:
+                values[field], sources[field] = layer[field], source
+                break
+    return {'values': values, 'sources': sources}
+
+
+def effective_profiles(containers: Dict[str, str]) -> Dict[str, Dict]:
+    """Действующие профили для {имя: тип}"""
+    from auth import load_resource_profiles
+    keys = set(containers) | {default_key(kind) for kind in KINDS}
+    profiles = load_resource_profiles(keys)
+    return {name: _merge(name, kind, profiles) for name, kind in containers.items()}
+
+
+def effective_profile(name: str, kind: str = 'bot') -> Dict:
+    return effective_profiles({name: kind})[name]
+
+
+def run_kwargs(name: str, kind: str = 'bot') -> Dict:
+    """Аргументы ``containers.run`` для действующего профиля (0 и None не передаются)"""
+    values = effective_profile(name, kind)['values']
+    return {field: value for field, value in values.items() if value}
+
+
+def _update_body(values: Dict, host_config: Dict) -> Tuple[Dict, List[str]]:
+    body, warnings = {}, []
+    for field, value in values.items():
+        if value is None:
+            continue
+        key = _HOST_CONFIG_KEYS[field]
+        current = host_config.get(key) or 0
+        if field == 'pids_limit':
+            # 0 в update означает «не менять», снять ограничение — -1
+            value = value or -1
+            current = current or -1
+        if value == current:
+            continue
+        if not value:
+            warnings.append(f'{field}: снятие ограничения применится после пересоздания контейнера')
+            continue
+        body[key] = value
+    if 'Memory' in body:
+        # Как при создании с mem_limit: память + swap = 2 × память. Иначе Docker
+        # отклоняет увеличение лимита выше ранее заданного MemorySwap
+        body['MemorySwap'] = body['Memory'] * 2
+    return body, warnings
+
+
+def _post_update(client, container_id: str, body: Dict):
+    # container.update() в docker SDK не поддерживает nano_cpus и pids_limit
+    api = client.api
+    response = api._post_json(api._url('/containers/{0}/update', container_id), data=body)
+    return api._result(response, True)
+
+
+def apply_profile(name: str) -> Dict:
+    """Применить действующий профиль к существующему контейнеру без перезапуска"""
+    from docker_api import bump_state_version, client_for
+    client = client_for(name)
+    container = client.containers.get(name)
+    kind = container_kind(container.attrs.get('Config', {}).get('Labels'))
+    values = effective_profile(container.name, kind)['values']
+    body, warnings = _update_body(values, container.attrs.get('HostConfig') or {})
+    if not body:
+        return {'applied': {}, 'warnings': warnings}
+    try:
+        result = _post_update(client, container.id, body)
+    except Exception as e:
+        if 'BlkioWeight' not in body:
+            raise
+        # На cgroup v2 без контроллера io вес блочного ввода-вывода не поддерживается
+        body.pop('BlkioWeight')
+        warnings.append(f'blkio_weight не применён: {e}')
+        result = _post_update(client, container.id, body) if body else {}
+    warnings.extend((result or {}).get('Warnings') or [])
+    bump_state_version()
+    return {'applied': body, 'warnings': warnings}
+
+
+def describe(name: str, kind: Optional[str] = None) -> Dict:
+    """Собственный и действующий профиль контейнера (или профиля по умолчанию '@kind')"""
+    from auth import load_resource_profiles
+    if name.startswith('@'):
+        kind = name[1:]
+        own = _row_values(load_resource_profiles([name]).get(name))
+        return {'name': name, 'kind': kind, 'profile': {f: own.get(f) for f in FIELDS},
+                'config': config_defaults(kind)}
+    if kind is None:
+        kind = 'bot'
+        try:
+            from docker_api import client_for
+            kind = container_kind(client_for(name).containers.get(name).attrs.get('Config', {}).get('Labels'))
+        except Exception:
+            pass
+    own = _row_values(load_resource_profiles([name]).get(name))
+    return {'name': name, 'kind': kind, 'profile': {f: own.get(f) for f in FIELDS},
+            'effective': effective_profile(name, kind)}
+
+
+def set_profile(name: str, data: Dict, apply: bool = True) -> Dict:
+    """
+    Сохранить профиль контейнера или профиль по умолчанию ('@bot', '@workspace').
+    С ``apply`` новые значения сразу применяются к существующему контейнеру
+    (для профиля по умолчанию — ко всем контейнерам этого типа).
+    """
+    from auth import upsert_resource_profile
+    if name.startswith('@') and name[1:] not in KINDS:
+        raise ValueError(f'Профиль по умолчанию: {", ".join(default_key(k) for k in KINDS)}')
+    profile = parse_profile(data)
+    if not profile:
+        raise ValueError('Не передано ни одного поля профиля')
+    if profile.get('cpuset_cpus'):
+        from nodes import get_node_registry
+        registry = get_node_registry()
+        # Профиль по умолчанию должен подходить самому маленькому узлу
+        nodes = registry.nodes() if name.startswith('@') else [registry.locate(name)]
+        ncpu = min((cap['cpus'] for _, cap, error in registry.fan_out(host_capacity, nodes)
+                    if error is None and cap['cpus']), default=0)
+        if ncpu and max(cpuset_cores(profile['cpuset_cpus'])) >= ncpu:
+            raise ValueError(f'На хосте {ncpu} ядер (0-{ncpu - 1})')
+    upsert_resource_profile(name, profile)
+    result = describe(name)
+    if not apply:
+        return result
+    targets = [name]
+    if name.startswith('@'):
+        from nodes import get_node_registry
+        containers, _ = get_node_registry().list_containers(all=True, filters={'label': 'bot-manager=1'})
+        targets = [c.name for _, c in containers if container_kind(c.labels) == name[1:]]
+    applied = {}
+    for target in targets:
+        try:
+            applied[target] = apply_profile(target)
+        except Exception as e:
+            if target == name and 'No such container' in str(e):
+                applied[target] = {'applied': {}, 'warnings': ['контейнера нет — профиль применится при создании']}
+            else:
+                applied[target] = {'error': str(e)}
+    result['apply'] = applied
+    return result
+
+
+def host_capacity(node=None) -> Dict:
+    """Ёмкость Docker-узла (по умолчанию — основного), кэшируется на RESOURCE_HOST_INFO_TTL"""
+    from nodes import get_node_registry
+    node = node or get_node_registry().default
+    with _host_lock:
+        cached = _host_cache.get(node.name)
+        if cached is not None and time.time() - cached[1] < cfg.RESOURCE_HOST_INFO_TTL:
+            return cached[0]
+    try:
+        info = node.client.info()
+        capacity = {'cpus': int(info.get('NCPU') or 0), 'memory': int(info.get('MemTotal') or 0),
+                    'source': 'docker'}
+    except Exception:
+        if node.url != 'env':
+            raise
+        import psutil
+        capacity = {'cpus': psutil.cpu_count() or 0, 'memory': psutil.virtual_memory().total,
+                    'source': 'local'}
+    with _host_lock:
+        _host_cache[node.name] = (capacity, time.time())
+    return capacity
+
+
+def packing(node_name: Optional[str] = None) -> Dict:
+    """
+    Упаковка контейнеров на узле: выделенные лимиты (по HostConfig запущенных
+    и всех контейнеров) против ёмкости хоста, закрепление за ядрами и
+    расхождения между сохранённым профилем и фактическими лимитами.
+    """
+    from nodes import get_node_registry
+    registry = get_node_registry()
+    node = registry.get(node_name)
+    host = host_capacity(node)
+    containers = node.client.containers.list(all=True, filters={'label': 'bot-manager=1'})
+    kinds = {c.name: container_kind(c.labels) for c in containers}
+    profiles = effective_profiles(kinds)
+
+    rows = []
+    totals = {scope: {'memory': 0, 'cpus': 0.0, 'unlimited_memory': 0, 'unlimited_cpus': 0}
+              for scope in ('running', 'all')}
+    cores: Dict[int, List[str]] = {core: [] for core in range(host['cpus'])}
+    for c in containers:
+        hc = c.attrs.get('HostConfig') or {}
+        actual = {field: hc.get(key) or None for field, key in _HOST_CONFIG_KEYS.items()}
+        if (actual['pids_limit'] or 0) < 0:  # -1 — без ограничения
+            actual['pids_limit'] = None
+        pinned = cpuset_cores(actual['cpuset_cpus'])
+        cpus = (actual['nano_cpus'] or 0) / 1_000_000_000 or float(len(pinned))
+        running = c.status == 'running'
+        for scope in ('running', 'all') if running else ('all',):
+            totals[scope]['memory'] += actual['mem_limit'] or 0
+            totals[scope]['cpus'] += cpus
+            totals[scope]['unlimited_memory'] += 0 if actual['mem_limit'] else 1
+            totals[scope]['unlimited_cpus'] += 0 if cpus else 1
+        if running:
+            for core in pinned:
+                cores.setdefault(core, []).append(c.name)
+        effective = profiles[c.name]['values']
+        drift = [field for field in FIELDS if (effective[field] or None) != actual[field]]
+        rows.append({
+            'name': c.name,
+            'kind': kinds[c.name],
+            'status': c.status,
+            'actual': actual,
+            'cpus': round(cpus, 2),
+            'effective': effective,
+            'sources': profiles[c.name]['sources'],
+            'drift': drift,
+        })
+    rows.sort(key=lambda r: (r['status'] != 'running', -(r['actual']['mem_limit'] or 0), r['name']))
+
+    for scope in totals.values():
+        scope['cpus'] = round(scope['cpus'], 2)
+        scope['memory_percent'] = round(scope['memory'] / host['memory'] * 100, 1) if host['memory'] else None
+        scope['cpus_percent'] = round(scope['cpus'] / host['cpus'] * 100, 1) if host['cpus'] else None
+    running = totals['running']
+    return {
+        'node': node.name,
+        'nodes': [n.name for n in registry.nodes()],
+        'host': host,
+        'committed': totals,
+        'available': {
+            'memory': max(0, host['memory'] - running['memory']),
+            'cpus': round(max(0.0, host['cpus'] - running['cpus']), 2),
+        },
+        'cores': [{'core': core, 'containers': names} for core, names in sorted(cores.items())],
+        'containers': rows,
+    }
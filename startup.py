@@ -0,0 +1,117 @@
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from config import cfg
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z' if ts else None
+
+
+class StartupTask:
+    """Шаг инициализации: функция, зависимости и текущее состояние"""
+
+    def __init__(self, name: str, func: Callable[[], object], depends: List[str], retry: bool):
+        self.name = name
+        self.func = func
+        self.depends = depends
+        self.retry = retry
+        self.state = 'pending'  # pending -> running -> ok | retrying -> ... | error
+        self.attempts = 0
+        self.error: Optional[str] = None
+        self.duration_ms: Optional[int] = None
+        self.ready_at: Optional[float] = None
+        self.done = threading.Event()
+
+    def as_dict(self) -> Dict:
+        return {
+            'state': self.state,
+            'attempts': self.attempts,
+            'error': self.error,
+            'duration_ms': self.duration_ms,
+            'ready_at': _iso(self.ready_at),
+        }
+
+
+class StartupManager:
+    """
+    Фоновая инициализация приложения.
+
+    Каждый шаг запускается в своём потоке, как только готовы его зависимости,
+    поэтому импорт приложения не ждёт ни базы, ни Docker. Шаги с ``retry``
+    (Docker может подняться позже сервиса) повторяются с экспоненциальной
+    задержкой до ``STARTUP_RETRY_MAX_DELAY``; ``STARTUP_RETRIES`` = 0 — без
+    ограничения числа попыток.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, StartupTask] = {}
+        self.started_at: Optional[float] = None
+
+    def add(self, name: str, func: Callable[[], object], depends: Optional[List[str]] = None,
+            retry: bool = False):
+        self.tasks[name] = StartupTask(name, func, depends or [], retry)
+
+    def start(self):
+        if self.started_at is not None:
+            return
+        self.started_at = time.time()
+        for task in self.tasks.values():
+            threading.Thread(target=self._run, args=(task,), daemon=True,
+                             name=f'startup-{task.name}').start()
+
+    def _run(self, task: StartupTask):
+        for dep in task.depends:
+            self.tasks[dep].done.wait()
+            if self.tasks[dep].state != 'ok':
+                task.state = 'error'
+                task.error = f'не выполнен шаг {dep}'
+                task.done.set()
+                return
+
+        delay = cfg.STARTUP_RETRY_DELAY
+        while True:
+            task.attempts += 1
+            task.state = 'running'
+            started = time.time()
+            try:
+                task.func()
+            except Exception as e:
+                task.duration_ms = int((time.time() - started) * 1000)
+                task.error = str(e)
+                exhausted = cfg.STARTUP_RETRIES and task.attempts >= cfg.STARTUP_RETRIES
+                if not task.retry or exhausted:
+                    task.state = 'error'
+                    print(f"[startup] {task.name}: ошибка: {e}")
+                    task.done.set()
+                    return
+                task.state = 'retrying'
+                print(f"[startup] {task.name}: попытка {task.attempts} не удалась ({e}), повтор через {delay:.0f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, cfg.STARTUP_RETRY_MAX_DELAY)
+                continue
+            task.duration_ms = int((time.time() - started) * 1000)
+            task.error = None
+            task.state = 'ok'
+            task.ready_at = time.time()
+            print(f"[startup] {task.name}: готово за {task.duration_ms} мс")
+            task.done.set()
+            return
+
+    def is_ready(self, name: Optional[str] = None) -> bool:
+        """Готов шаг ``name`` или (без аргумента) все шаги"""
+        names = [name] if name else list(self.tasks)
+        return all(self.tasks[n].state == 'ok' for n in names)
+
+    def is_settled(self, name: str) -> bool:
+        """Шаг завершён — успешно или окончательной ошибкой"""
+        return self.tasks[name].done.is_set()
+
+    def status(self) -> Dict:
+        return {
+            'ready': self.is_ready(),
+            'started_at': _iso(self.started_at),
+            'components': {name: task.as_dict() for name, task in self.tasks.items()},
+        }
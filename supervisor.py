@@ -0,0 +1,507 @@
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Dict, Optional
+
+from config import cfg
+import metrics
+from docker_events import event_attributes, event_container, get_event_dispatcher
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+POLICIES = ('no', 'on-failure', 'always')
+# Коды выхода после docker stop / kill: при восстановлении после рестарта менеджера
+# такие контейнеры считаются остановленными намеренно
+_STOP_EXIT_CODES = {0, 137, 143}
+_EXITED_STATUS = re.compile(r'Exited \((-?\d+)\)')
+# Как часто наблюдающий воркер перечитывает статистику, которую пишет ведущий
+_FOLLOWER_REFRESH_SECONDS = 5.0
+
+SUPERVISOR_RESTARTS = metrics.Counter('bot_manager_supervisor_restarts_total',
+                                      'Перезапуски контейнеров супервизором', ('reason',))
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() + 'Z' if ts else None
+
+
+class _Track:
+    """Состояние одного контейнера в супервизоре (в памяти процесса)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = 'unknown'  # running | backoff | restarting | crashloop | stopped | exited
+        self.started_at: Optional[float] = None
+        self.down_since: Optional[float] = None
+        self.failures = deque()  # время падений в окне crash-loop
+        self.timer: Optional[threading.Timer] = None
+        self.next_restart_at: Optional[float] = None
+        self.expected_until = 0.0
+        self.restarting = False
+        self.last_exit_code: Optional[int] = None
+        self.last_reason: Optional[str] = None
+
+
+class Supervisor:
+    """
+    Перезапуск упавших контейнеров по событиям Docker (die, health_status).
+
+    Политика задаётся на контейнер (таблица restart_policies), иначе берётся
+    SUPERVISOR_DEFAULT_POLICY: 'no', 'on-failure' (код выхода не 0) или
+    'always'. Перезапуск откладывается с экспоненциальной задержкой; если за
+    SUPERVISOR_CRASHLOOP_WINDOW секунд падений больше max_restarts, контейнер
+    помечается crash loop и не перезапускается до ручного старта. Остановки
+    через менеджер (expect_stop), docker stop и docker kill перезапуск не
+    вызывают. expect_stop из любого воркера записывается в базу (stop_requests),
+    поэтому ведущий узнаёт и об остановках через другие воркеры.
+
+    Перезапускает и пишет статистику только один процесс (блокировка файла в
+    каталоге логов); остальные воркеры ведут состояние для отображения и
+    перечитывают статистику из базы. Запись в базу откладывается до выхода
+    из-под блокировки, чтобы занятая база не задерживала обработку событий.
+    """
+
+    def __init__(self):
+        self._tracks: Dict[str, _Track] = {}
+        self._policies: Dict[str, object] = {}
+        self._lock = threading.RLock()
+        self._pending: Dict[str, Dict] = {}  # статистика, ещё не записанная в базу
+        self._flush_lock = threading.Lock()
+        self._refreshed_at = 0.0
+        self._lock_file = None
+        self._subscribed = False
+        self.leader = False
+        self.started = False
+
+    # --- Политики -------------------------------------------------------------
+
+    def policy_for(self, name: str) -> Dict:
+        row = self._policies.get(name)
+
+        def pick(field, default):
+            value = getattr(row, field, None) if row is not None else None
+            return default if value is None else value
+
+        return {
+            'policy': pick('policy', cfg.SUPERVISOR_DEFAULT_POLICY),
+            'max_restarts': pick('max_restarts', cfg.SUPERVISOR_CRASHLOOP_RESTARTS),
+            'backoff_max': pick('backoff_max', cfg.SUPERVISOR_BACKOFF_MAX),
+            'restart_on_unhealthy': pick('restart_on_unhealthy', cfg.SUPERVISOR_RESTART_UNHEALTHY),
+            'custom': row is not None and row.policy is not None,
+        }
+
+    def set_policy(self, name: str, values: Dict) -> Dict:
+        """Сохранить политику контейнера; None в поле — значение по умолчанию"""
+        clean = {}
+        if 'policy' in values:
+            policy = values['policy'] or None
+            if policy is not None and policy not in POLICIES:
+                raise ValueError(f'Неизвестная политика: {policy} (допустимо: {", ".join(POLICIES)})')
+            clean['policy'] = policy
+        for field in ('max_restarts', 'backoff_max'):
+            if field in values:
+                value = values[field]
+                if value in (None, ''):
+                    clean[field] = None
+                    continue
+                try:
+                    value = int(value)
+                except (TypeError, ValueError):
+                    raise ValueError(f'{field}: ожидается целое число')
+                if value < 1:
+                    raise ValueError(f'{field}: значение должно быть не меньше 1')
+                clean[field] = value
+        if 'restart_on_unhealthy' in values:
+            value = values['restart_on_unhealthy']
+            clean['restart_on_unhealthy'] = None if value is None else bool(value)
+
+        from auth import upsert_restart_policy
+        row = upsert_restart_policy(name, clean)
+        with self._lock:
+            self._policies[name] = row
+            track = self._tracks.get(name)
+            if track and track.state == 'backoff' and self.policy_for(name)['policy'] == 'no':
+                self._cancel(track)
+                track.state = 'exited'
+        return self.describe(name)
+
+    def _save(self, name: str, **values):
+        """Запомнить статистику перезапусков для записи (вызывается под self._lock; пишет только ведущий)"""
+        if self.leader:
+            self._pending.setdefault(name, {}).update(values)
+
+    def _flush(self):
+        """Записать накопленную статистику вне self._lock; ошибка базы не останавливает супервизор"""
+        from auth import upsert_restart_policy
+        with self._flush_lock:  # порядок записей одного контейнера сохраняется
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for name, values in pending.items():
+                try:
+                    row = upsert_restart_policy(name, values)
+                except Exception as e:
+                    print(f"[supervisor] не удалось сохранить статистику {name}: {e}")
+                    continue
+                with self._lock:
+                    self._policies[name] = row
+
+    def _refresh(self):
+        """Наблюдающий воркер: перечитать статистику ведущего не чаще раза в несколько секунд"""
+        if self.leader or not self.started or time.time() - self._refreshed_at < _FOLLOWER_REFRESH_SECONDS:
+            return
+        self._refreshed_at = time.time()
+        try:
+            from auth import load_restart_policies
+            policies = load_restart_policies()
+        except Exception as e:
+            print(f"[supervisor] не удалось перечитать статистику: {e}")
+            return
+        with self._lock:
+            self._policies = policies
+
+    def _stat(self, name: str, field: str, default=0):
+        pending = self._pending.get(name)
+        if pending and field in pending:
+            value = pending[field]
+        else:
+            row = self._policies.get(name)
+            value = getattr(row, field, None) if row is not None else None
+        return default if value is None else value
+
+    # --- Запуск ---------------------------------------------------------------
+
+    def _acquire_process_lock(self) -> bool:
+        if not fcntl:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(cfg.LOGS_DIR, 'supervisor.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """Шаг инициализации: политики из базы, подписка на события, сверка с Docker"""
+        if self.started:
+            return
+        from auth import load_restart_policies
+        self._policies = load_restart_policies()
+        dispatcher = get_event_dispatcher()
+        if not self._subscribed:
+            # Подписка до сверки: события, пришедшие во время неё, не теряются
+            dispatcher.subscribe(self._on_event,
+                                 ('start', 'kill', 'die', 'stop', 'destroy', 'rename', 'health_status'))
+            self._subscribed = True
+        dispatcher.start()
+        self.leader = self._acquire_process_lock()
+        self._reconcile()
+        self._flush()
+        self.started = True
+        print(f"[supervisor] запущен ({'перезапускает контейнеры' if self.leader else 'только наблюдает'})")
+
+    def _reconcile(self):
+        """Состояние контейнеров на момент запуска: одним запросом списка на узел, без inspect"""
+        from nodes import get_node_registry
+        registry = get_node_registry()
+        summaries = []
+        for node, result, error in registry.fan_out(
+                lambda node: node.client.api.containers(all=True, filters={'label': 'bot-manager=1'})):
+            if error is None:
+                summaries.extend(result)
+            elif registry.multi:
+                # Недоступный узел не мешает остальным; его контейнеры подхватятся по событиям
+                print(f"[supervisor] узел {node.name} недоступен при сверке: {error}")
+            else:
+                raise error
+        now = time.time()
+        with self._lock:
+            for summary in summaries:
+                name = (summary.get('Names') or ['/'])[0].lstrip('/')
+                if not name:
+                    continue
+                track = self._track(name)
+                if summary.get('State') == 'running':
+                    track.state = 'running'
+                    track.started_at = track.started_at or now
+                    continue
+                if self._stat(name, 'crash_loop', False):
+                    track.state = 'crashloop'
+                    continue
+                match = _EXITED_STATUS.search(summary.get('Status') or '')
+                code = int(match.group(1)) if match else None
+                track.last_exit_code = code
+                # Упал, пока менеджер не работал; остановленные вручную не трогаем
+                if code is not None and code not in _STOP_EXIT_CODES and self.policy_for(name)['policy'] != 'no':
+                    track.down_since = now
+                    self._failure(track, f'exit {code}', now, 'start')
+                else:
+                    track.state = 'exited' if code else 'stopped'
+
+    # --- События --------------------------------------------------------------
+
+    def _track(self, name: str) -> _Track:
+        track = self._tracks.get(name)
+        if track is None:
+            track = self._tracks[name] = _Track(name)
+        return track
+
+    def _on_event(self, event: Dict):
+        name = event_container(event)
+        if not name:
+            return
+        action = event.get('Action') or event.get('status') or ''
+        now = time.time()
+        requested_at = None
+        if action == 'die':
+            # Остановку мог запросить другой воркер: его отметка только в базе
+            track = self._tracks.get(name)
+            if track is None or now >= track.expected_until:
+                requested_at = self._stop_requested_at(name)
+        with self._lock:
+            track = self._track(name)
+            if action == 'start':
+                self._on_start(track, now)
+            elif action == 'kill':
+                # docker stop / docker kill: следующий die — намеренная остановка
+                track.expected_until = max(track.expected_until, now + cfg.SUPERVISOR_EXPECT_SECONDS)
+            elif action == 'die':
+                try:
+                    code = int(event_attributes(event).get('exitCode', 0))
+                except ValueError:
+                    code = None
+                self._on_die(track, code, now, requested_at)
+            elif action == 'stop':
+                self._cancel(track)
+                if track.state != 'crashloop':
+                    track.state = 'stopped'
+                track.down_since = None
+            elif action == 'destroy':
+                self._cancel(track)
+                self._tracks.pop(name, None)
+            elif action == 'rename':
+                # Состояние следует за контейнером (подмена при редеплое), политика — за именем
+                moved = self._tracks.pop(event_attributes(event).get('oldName', '').lstrip('/'), None)
+                if moved is not None:
+                    self._cancel(moved)
+                    if moved.state == 'backoff':
+                        moved.state = 'exited'
+                    moved.name = name
+                    self._tracks[name] = moved
+            elif action.startswith('health_status') and action.split(':', 1)[-1].strip() == 'unhealthy':
+                self._on_unhealthy(track, now)
+        self._flush()
+
+    def _on_start(self, track: _Track, now: float):
+        by_supervisor = track.restarting
+        track.restarting = False
+        self._cancel(track)
+        if track.down_since is not None:
+            self._save(track.name, downtime_seconds=self._stat(track.name, 'downtime_seconds', 0.0)
+                       + now - track.down_since)
+        track.down_since = None
+        track.expected_until = 0.0
+        track.started_at = now
+        if not by_supervisor and (track.state == 'crashloop' or self._stat(track.name, 'crash_loop', False)):
+            # Ручной запуск после crash loop — начинаем с чистого листа
+            track.failures.clear()
+            self._save(track.name, crash_loop=False)
+        track.state = 'running'
+
+    def _on_die(self, track: _Track, code: Optional[int], now: float, requested_at: Optional[float] = None):
+        track.last_exit_code = code
+        # Отметка из базы действует, если поставлена после последнего запуска контейнера
+        requested = (requested_at is not None and now - requested_at < cfg.SUPERVISOR_EXPECT_SECONDS
+                     and requested_at >= (track.started_at or 0))
+        if now < track.expected_until or requested:
+            track.expected_until = 0.0
+            self._cancel(track)
+            track.state = 'stopped'
+            track.down_since = None
+            return
+        if track.state == 'crashloop':
+            return
+        track.down_since = track.down_since or now
+        policy = self.policy_for(track.name)['policy']
+        if policy == 'no' or (policy == 'on-failure' and code == 0):
+            track.state = 'exited'
+            self._save(track.name, last_exit_code=code)
+            return
+        self._failure(track, f'exit {code}', now, 'start')
+
+    def _on_unhealthy(self, track: _Track, now: float):
+        policy = self.policy_for(track.name)
+        if policy['policy'] == 'no' or not policy['restart_on_unhealthy']:
+            return
+        if track.state in ('backoff', 'restarting', 'crashloop'):
+            return
+        self._failure(track, 'unhealthy', now, 'restart')
+
+    def _failure(self, track: _Track, reason: str, now: float, action: str):
+        """Учесть падение: crash loop или перезапуск с экспоненциальной задержкой"""
+        policy = self.policy_for(track.name)
+        # После продолжительной работы серия падений начинается заново
+        if track.started_at and now - track.started_at >= cfg.SUPERVISOR_STABLE_SECONDS:
+            track.failures.clear()
+        while track.failures and now - track.failures[0] > cfg.SUPERVISOR_CRASHLOOP_WINDOW:
+            track.failures.popleft()
+        track.failures.append(now)
+        track.last_reason = reason
+
+        if len(track.failures) > policy['max_restarts']:
+            self._cancel(track)
+            track.state = 'crashloop'
+            self._save(track.name, crash_loop=True, last_exit_code=track.last_exit_code)
+            print(f"[supervisor] {track.name}: crash loop — {len(track.failures)} падений за "
+                  f"{cfg.SUPERVISOR_CRASHLOOP_WINDOW} с, перезапуск приостановлен")
+            return
+
+        delay = min(cfg.SUPERVISOR_BACKOFF_INITIAL * 2 ** (len(track.failures) - 1), policy['backoff_max'])
+        self._save(track.name, last_exit_code=track.last_exit_code)
+        self._schedule(track, delay, action, reason)
+
+    def _schedule(self, track: _Track, delay: float, action: str, reason: str):
+        self._cancel(track)
+        track.state = 'backoff'
+        track.next_restart_at = time.time() + delay
+        if not self.leader:
+            return
+        timer = threading.Timer(delay, self._restart, args=(track.name, action, reason))
+        timer.daemon = True
+        track.timer = timer
+        timer.start()
+
+    def _cancel(self, track: _Track):
+        if track.timer is not None:
+            track.timer.cancel()
+            track.timer = None
+        track.next_restart_at = None
+
+    def _restart(self, name: str, action: str, reason: str):
+        requested_at = self._stop_requested_at(name)
+        with self._lock:
+            track = self._tracks.get(name)
+            if track is None or track.state != 'backoff':
+                return
+            if requested_at is not None and requested_at >= max(track.started_at or 0, track.down_since or 0):
+                # Пока шла задержка, контейнер остановили через другой воркер
+                self._cancel(track)
+                track.state = 'stopped'
+                return
+            track.state = 'restarting'
+            track.restarting = True
+            track.timer = None
+            track.next_restart_at = None
+            attempt = len(track.failures)
+
+        print(f"[supervisor] {name}: перезапуск ({reason}), попытка {attempt}")
+        try:
+            from docker_api import restart_bot, start_bot
+            if action == 'restart':
+                restart_bot(name)
+            else:
+                start_bot(name)
+        except Exception as e:
+            print(f"[supervisor] {name}: перезапуск не удался: {e}")
+            with self._lock:
+                track.restarting = False
+                if track.state == 'restarting':
+                    self._failure(track, f'ошибка перезапуска: {e}', time.time(), action)
+            self._flush()
+            return
+
+        SUPERVISOR_RESTARTS.inc(('unhealthy' if reason == 'unhealthy' else 'exit',))
+        with self._lock:
+            self._save(name, restart_count=self._stat(name, 'restart_count') + 1, last_restart_at=time.time())
+        self._flush()
+
+    # --- Намеренные остановки и статистика ---------------------------------------
+
+    def expect_stop(self, name: str):
+        """Менеджер сейчас остановит контейнер: следующий die не считается падением"""
+        now = time.time()
+        with self._lock:
+            track = self._track(name)
+            track.expected_until = now + cfg.SUPERVISOR_EXPECT_SECONDS
+            if track.state == 'backoff':
+                self._cancel(track)
+                track.state = 'stopped'
+            # Перезапуск самим супервизором: ведущему хватает отметки в памяти
+            if track.restarting:
+                return
+        # Для ведущего, если остановка идёт через другой воркер
+        try:
+            from auth import record_stop_request
+            record_stop_request(name, now)
+        except Exception as e:
+            print(f"[supervisor] не удалось сохранить остановку {name}: {e}")
+
+    def _stop_requested_at(self, name: str) -> Optional[float]:
+        """Время последнего expect_stop из любого воркера (вне self._lock)"""
+        try:
+            from auth import get_stop_request
+            return get_stop_request(name)
+        except Exception as e:
+            print(f"[supervisor] не удалось прочитать остановку {name}: {e}")
+            return None
+
+    def describe(self, name: str) -> Dict:
+        self._refresh()
+        now = time.time()
+        with self._lock:
+            track = self._tracks.get(name)
+            downtime = self._stat(name, 'downtime_seconds', 0.0)
+            if track and track.down_since:
+                downtime += now - track.down_since
+            return {
+                'policy': self.policy_for(name),
+                'state': track.state if track else 'unknown',
+                'restart_count': self._stat(name, 'restart_count'),
+                'downtime_seconds': round(downtime, 1),
+                'last_exit_code': track.last_exit_code if track and track.last_exit_code is not None
+                else self._stat(name, 'last_exit_code', None),
+                'last_restart_at': _iso(self._stat(name, 'last_restart_at', None)),
+                'crash_loop': bool(track and track.state == 'crashloop'),
+                'failures_in_window': len(track.failures) if track else 0,
+                'next_restart_in': round(max(0.0, track.next_restart_at - now), 1)
+                if track and track.next_restart_at else None,
+                'last_reason': track.last_reason if track else None,
+            }
+
+    def crash_loop_count(self) -> int:
+        return sum(1 for t in list(self._tracks.values()) if t.state == 'crashloop')
+
+    def status(self) -> Dict:
+        self._refresh()
+        with self._lock:
+            names = sorted(set(self._tracks) | set(self._policies))
+        return {
+            'enabled': cfg.SUPERVISOR_ENABLED,
+            'started': self.started,
+            'leader': self.leader,
+            'events': get_event_dispatcher().status(),
+            'containers': {name: self.describe(name) for name in names},
+        }
+
+
+_supervisor_singleton: Optional[Supervisor] = None
+
+
+def get_supervisor() -> Supervisor:
+    global _supervisor_singleton
+    if _supervisor_singleton is None:
+        _supervisor_singleton = Supervisor()
+    return _supervisor_singleton
+
+
+metrics.gauge_func('bot_manager_supervisor_crash_loops', 'Контейнеры в состоянии crash loop',
+                   lambda: get_supervisor().crash_loop_count())
@@ -0,0 +1,218 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional
+
+from config import cfg
+import metrics
+
+# Содержимое /workspace после настройки: при создании workspace копируется в его каталог
+SKELETON_DIR = '/opt/bot-manager/workspace'
+TEMPLATE_LABEL = 'bot-manager-template'
+
+BUILD_SECONDS = metrics.Histogram('bot_manager_template_image_build_seconds', 'Сборка образа шаблона workspace',
+                                  ('template', 'result'),
+                                  buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+SAVED_SECONDS = metrics.Counter('bot_manager_template_provision_saved_seconds_total',
+                                'Время настройки workspace, сэкономленное готовыми образами шаблонов',
+                                ('template',))
+
+
+def template_hash(template: Dict) -> str:
+    """Хеш того, что попадает в образ: базовый образ, команды настройки и пакеты"""
+    spec = {key: template.get(key) for key in ('image', 'setup_commands', 'packages')}
+    return hashlib.sha256(json.dumps(spec, sort_keys=True).encode()).hexdigest()[:12]
+
+
+def image_tag(template_key: str, template: Dict) -> str:
+    return f'{cfg.TEMPLATE_IMAGE_REPO}-{template_key}:{template_hash(template)}'
+
+
+def dockerfile(template: Dict, user: Optional[str] = None) -> str:
+    """
+    Dockerfile образа шаблона. Команды выполняются в /workspace от пользователя
+    базового образа — как при настройке в запущенном контейнере; получившееся
+    содержимое /workspace сохраняется в SKELETON_DIR (при запуске /workspace
+    закрыт каталогом workspace с хоста).
+    """
+    lines = [f'FROM {template["image"]}']
+    if user:
+        lines += ['USER root', f'RUN mkdir -p /workspace && chown {user} /workspace', f'USER {user}']
+    lines.append('WORKDIR /workspace')
+    for cmd in template['setup_commands'] + template['packages']:
+        lines.append('RUN ' + json.dumps(['sh', '-c', cmd]))
+    if user:
+        lines.append('USER root')
+    lines.append(f'RUN mkdir -p {os.path.dirname(SKELETON_DIR)} && cp -R /workspace {SKELETON_DIR}')
+    if user:
+        lines.append(f'USER {user}')
+    return '\n'.join(lines) + '\n'
+
+
+class TemplateImages:
+    """
+    Образы шаблонов workspace: команды настройки и установка пакетов шаблона
+    выполняются один раз при сборке образа с тегом по хешу шаблона, а новые
+    workspace запускаются из готового образа — остаётся скопировать подготовленное
+    содержимое /workspace. Сборка идёт при первом создании workspace из шаблона
+    на узле; изменился шаблон — изменился тег, и образ собирается заново
+    (прежний тег снимается). Если сборка не удалась, workspace настраиваются
+    по-старому, а новая попытка — не раньше TEMPLATE_IMAGE_RETRY секунд.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._build_locks: Dict[tuple, threading.Lock] = {}
+        self._failed: Dict[tuple, float] = {}
+        self.last_error: Optional[str] = None
+
+    def _has_image(self, node, tag: str) -> bool:
+        from docker.errors import ImageNotFound
+        try:
+            node.client.images.get(tag)
+            return True
+        except ImageNotFound:
+            return False
+
+    def ensure(self, node, template_key: str, template: Dict) -> Optional[str]:
+        """Тег готового образа шаблона на узле (собирается при отсутствии); None — настраивать по-старому"""
+        if not cfg.TEMPLATE_IMAGES:
+            return None
+        tag = image_tag(template_key, template)
+        key = (node.name, tag)
+        if self._has_image(node, tag):
+            return tag
+        with self._lock:
+            lock = self._build_locks.setdefault(key, threading.Lock())
+        with lock:
+            # Пока ждали, образ мог собрать соседний запрос
+            if self._has_image(node, tag):
+                return tag
+            if time.time() - self._failed.get(key, 0) < cfg.TEMPLATE_IMAGE_RETRY:
+                return None
+            try:
+                self.build(node, template_key, template)
+            except Exception as e:
+                self._failed[key] = time.time()
+                self.last_error = f'{template_key}: {e}'
+                print(f"[template_images] {tag}: сборка на узле {node.name} не удалась: {e}")
+                return None
+        return tag
+
+    def build(self, node, template_key: str, template: Dict) -> str:
+        from docker.errors import ImageNotFound
+        from auth import record_template_build
+        cli = node.client
+        tag = image_tag(template_key, template)
+        started = time.perf_counter()
+        try:
+            try:
+                base = cli.images.get(template['image'])
+            except ImageNotFound:
+                base = cli.images.pull(template['image'])
+            user = ((base.attrs.get('Config') or {}).get('User') or '').strip() or None
+            with tempfile.TemporaryDirectory(prefix='bot-template-') as context:
+                with open(os.path.join(context, 'Dockerfile'), 'w') as f:
+                    f.write(dockerfile(template, user))
+                cli.images.build(path=context, tag=tag, rm=True, pull=cfg.TEMPLATE_IMAGE_PULL,
+                                 labels={TEMPLATE_LABEL: template_key,
+                                         f'{TEMPLATE_LABEL}-hash': template_hash(template)})
+        except Exception:
+            BUILD_SECONDS.observe((template_key, 'error'), time.perf_counter() - started)
+            raise
+        elapsed = time.perf_counter() - started
+        BUILD_SECONDS.observe((template_key, 'ok'), elapsed)
+        record_template_build(template_key, template_hash(template), tag, elapsed)
+        self._failed.pop((node.name, tag), None)
+        print(f"[template_images] {tag}: собран на узле {node.name} за {elapsed:.1f} с")
+        self._remove_outdated(node, template_key, template_hash(template))
+        return tag
+
+    def _remove_outdated(self, node, template_key: str, current_hash: str):
+        """
+        Снять на узле теги прежних версий образа шаблона — по меткам образа, а не
+        по записи в базе: она общая для всех узлов и после первой пересборки уже
+        указывает на новый тег. Занятый контейнерами образ Docker не удалит.
+        """
+        for image in node.client.images.list(filters={'label': f'{TEMPLATE_LABEL}={template_key}'}):
+            if image.labels.get(f'{TEMPLATE_LABEL}-hash') == current_hash:
+                continue
+            for old_tag in image.tags:
+                try:
+                    node.client.images.remove(old_tag)
+                except Exception as e:
+                    print(f"[template_images] {old_tag}: прежний образ на узле {node.name} не удалён: {e}")
+
+    def provision(self, container, template_key: str, template: Dict, tag: Optional[str]) -> List[str]:
+        """
+        Подготовить /workspace запущенного контейнера: из готового образа — копией
+        содержимого SKELETON_DIR, иначе выполнением команд шаблона. Возвращает ошибки.
+        """
+        from docker_api import provision_workspace
+        if not tag:
+            return provision_workspace(container, template)
+        started = time.perf_counter()
+        result = container.exec_run(['sh', '-c', f'cp -R {SKELETON_DIR}/. /workspace/'], workdir='/workspace')
+        if result.exit_code:
+            output = result.output.decode('utf-8', errors='replace') if result.output else ''
+            return [f'копирование {SKELETON_DIR}: код {result.exit_code} {output[-500:]}']
+        self._record_use(template_key, time.perf_counter() - started)
+        return []
+
+    def _record_use(self, template_key: str, seconds: float):
+        from auth import load_template_images, record_template_use
+        try:
+            row = load_template_images().get(template_key)
+            # Без образа настройка заняла бы примерно столько же, сколько его сборка
+            saved = max(0.0, (row.build_seconds if row else 0.0) - seconds)
+            record_template_use(template_key, saved)
+            SAVED_SECONDS.inc((template_key,), saved)
+        except Exception as e:
+            print(f"[template_images] {template_key}: использование не записано: {e}")
+
+    def report(self) -> Dict:
+        """Образы шаблонов: актуальный тег, на каких узлах собран, сборки и сэкономленное время"""
+        from auth import load_template_images
+        from docker_api import get_workspace_templates
+        from nodes import get_node_registry
+        rows = load_template_images()
+        templates = []
+        for key, template in get_workspace_templates().items():
+            tag = image_tag(key, template)
+            built_on = [node.name for node, found, error in
+                        get_node_registry().fan_out(lambda node: self._has_image(node, tag))
+                        if error is None and found]
+            row = rows.get(key)
+            templates.append({
+                'template': key,
+                'image': template['image'],
+                'tag': tag,
+                'hash': template_hash(template),
+                'built_on': built_on,
+                'outdated_tag': row.image_tag if row and row.image_tag != tag else None,
+                'build_seconds': round(row.build_seconds, 1) if row else None,
+                'built_at': row.built_at and time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(row.built_at))
+                if row else None,
+                'builds': row.build_count if row else 0,
+                'uses': row.use_count if row else 0,
+                'saved_seconds': round(row.saved_seconds, 1) if row else 0.0,
+            })
+        return {
+            'enabled': cfg.TEMPLATE_IMAGES,
+            'error': self.last_error,
+            'saved_seconds': round(sum(t['saved_seconds'] for t in templates), 1),
+            'templates': templates,
+        }
+
+
+_template_images_singleton: Optional[TemplateImages] = None
+
+
+def get_template_images() -> TemplateImages:
+    global _template_images_singleton
+    if _template_images_singleton is None:
+        _template_images_singleton = TemplateImages()
+    return _template_images_singleton
@@ -3,10 +3,19 @@ import threading
 import time
 from datetime import datetime
 from typing import Dict, List
-from flask_socketio import emit
-import docker
+from flask import current_app, request
+from flask_socketio import emit as _socketio_emit
 from docker.errors import DockerException, NotFound as DockerNotFound
+from docker_api import client_for
 from exec_backend import get_backend
+from nodes import get_node_registry
+from metrics import record_emit
+
+try:
+    import greenlet  # type: ignore
+    from eventlet import tpool  # type: ignore
+except ImportError:  # pragma: no cover - без eventlet всё выполняется в потоках
+    tpool = None
 
 TERMINAL_SESSIONS: Dict[str, dict] = {}
 
@@ -14,6 +23,55 @@ TERMINAL_SESSIONS: Dict[str, dict] = {}
 MAX_HISTORY = 200
 
 
+def emit(event, data=None, **kwargs):
+    """emit Flask-SocketIO с учётом событий и байт в метриках"""
+    record_emit(event, data)
+    return _socketio_emit(event, data, **kwargs)
+
+
+def _sid_emitter(sid: str):
+    """
+    emit для фонового потока: контекста запроса там нет, поэтому сервер
+    SocketIO и namespace запоминаются заранее, а событие адресуется по sid.
+    """
+    server = current_app.extensions['socketio']
+    namespace = request.namespace
+
+    def send(event, data=None):
+        record_emit(event, data)
+        server.emit(event, data, to=sid, namespace=namespace)
+    return send
+
+
+def _spawn(func):
+    """
+    Запустить обработку команды в фоне. Под eventlet это greenthread: emit из
+    него сразу будит хаб, тогда как emit из потока ОС ждал бы следующего
+    пробуждения хаба (до ping_interval при тихом соединении).
+    """
+    current_app.extensions['socketio'].start_background_task(func)
+
+
+def _run_backend(command: str, timeout: int = 30, backend=None):
+    """backend.run без блокировки хаба: в greenthread'е — через tpool eventlet"""
+    backend = backend or get_backend()
+    if tpool is not None and greenlet.getcurrent().parent is not None:
+        return tpool.execute(backend.run, command, timeout=timeout)
+    return backend.run(command, timeout=timeout)
+
+
+def _wake(container_name: str):
+    """Разбудить workspace, усыплённый по простою (в greenthread'е — через tpool eventlet)"""
+    from hibernation import get_hibernator
+    try:
+        if tpool is not None and greenlet.getcurrent().parent is not None:
+            return tpool.execute(get_hibernator().wake, container_name)
+        return get_hibernator().wake(container_name)
+    except Exception as e:
+        print(f"[terminal] {container_name}: не удалось разбудить: {e}")
+        return None
+
+
 def _now_iso():
     return datetime.utcnow().isoformat() + 'Z'
 
@@ -33,6 +91,10 @@ def start_terminal_session(sid: str, container_name: str):
         }
 
         emit('terminal_output', {'data': f'=== Подключение к {container_name} ===\n'})
+        resumed = _wake(container_name)
+        if resumed:
+            emit('terminal_output', {'data': f'Workspace был усыплён по простою — разбужен за {resumed["resume_ms"]} мс\n'})
+            emit('terminal_resumed', {'container': container_name, **resumed})
         emit('terminal_output', {'data': 'Проверка Docker окружения...\n'})
 
         # Проверка Docker
@@ -43,7 +105,7 @@ def start_terminal_session(sid: str, container_name: str):
             'image': None
         }
         try:
-            cli = docker.from_env()
+            cli = client_for(container_name)
             cli.ping()
             docker_status['docker'] = 'up'
             try:
@@ -139,10 +201,12 @@ def handle_terminal_input(sid: str, data: str):
         if command == ':start':
             # Попытка запуска контейнера если он существует и не запущен
             try:
-                cli = docker.from_env()
+                cli = client_for(container_name)
                 container = cli.containers.get(container_name)
                 if container.status != 'running':
                     container.start()
+                    from docker_api import bump_state_version
+                    bump_state_version()
                     emit('terminal_output', {'data': 'Контейнер запускается...\n'})
                     time.sleep(1)
                     container.reload()
@@ -176,16 +240,23 @@ def handle_terminal_input(sid: str, data: str):
         # Отображаем в основном выводе
         emit('terminal_output', {'data': f"{command}\n"})
 
+        send = _sid_emitter(sid)
+        # docker CLI должен обращаться к узлу, на котором находится контейнер
+        backend = get_node_registry().locate(container_name).exec_backend()
+
         def run_command():
+            resumed = _wake(container_name)
+            if resumed:
+                send('terminal_output', {'data': f'(workspace разбужен за {resumed["resume_ms"]} мс)\n'})
+                send('terminal_resumed', {'container': container_name, **resumed})
             started = time.time()
             try:
-                backend = get_backend()
                 # Если команда не начинается с docker, явно оборачиваем для exec в контейнере
                 if command.startswith('docker '):
                     exec_cmd = command
                 else:
                     exec_cmd = f"docker exec {container_name} bash -lc {command!r}"
-                stdout, stderr, exit_code = backend.run(exec_cmd, timeout=30)
+                stdout, stderr, exit_code = _run_backend(exec_cmd, timeout=30, backend=backend)
             except Exception as e:
                 stdout = ''
                 stderr = f'Ошибка выполнения: {e}\n'
@@ -202,7 +273,7 @@ def handle_terminal_input(sid: str, data: str):
             )
 
             # Отправляем структурированный результат
-            emit('terminal_command_result', {
+            send('terminal_command_result', {
                 'id': updated['id'],
                 'command': updated['command'],
                 'stdout': stdout,
@@ -215,13 +286,13 @@ def handle_terminal_input(sid: str, data: str):
 
             # Также выводим в обычный поток
             if stdout:
-                emit('terminal_output', {'data': stdout})
+                send('terminal_output', {'data': stdout})
             if stderr:
-                emit('terminal_output', {'data': f'! {stderr}'})
-            emit('terminal_output', {'data': f'root@{container_name}:~$ '})
+                send('terminal_output', {'data': f'! {stderr}'})
+            send('terminal_output', {'data': f'root@{container_name}:~$ '})
 
-        # Запускаем в отдельном потоке чтобы не блокировать SocketIO
-        threading.Thread(target=run_command, daemon=True).start()
+        # Запускаем в фоне чтобы не блокировать SocketIO
+        _spawn(run_command)
 
     except Exception as e:
         print(f"[terminal] input error: {e}")
@@ -321,11 +392,12 @@ def handle_server_console_input(sid: str, data: str):
         emit('server_console_command_started', {'id': cmd_id, 'command': command})
         emit('server_console_output', {'data': f"{command}\n"})
 
+        send = _sid_emitter(sid)
+
         def run_server_command():
             started = time.time()
             try:
-                backend = get_backend()
-                stdout, stderr, exit_code = backend.run(command, timeout=30)
+                stdout, stderr, exit_code = _run_backend(command, timeout=30)
             except Exception as e:
                 stdout = ''
                 stderr = f'Ошибка выполнения: {e}\n'
@@ -347,7 +419,7 @@ def handle_server_console_input(sid: str, data: str):
                         })
                         break
 
-            emit('server_console_command_result', {
+            send('server_console_command_result', {
                 'id': cmd_id,
                 'command': command,
                 'stdout': stdout,
@@ -359,12 +431,12 @@ def handle_server_console_input(sid: str, data: str):
             })
 
             if stdout:
-                emit('server_console_output', {'data': stdout})
+                send('server_console_output', {'data': stdout})
             if stderr:
-                emit('server_console_output', {'data': f'! {stderr}'})
-            emit('server_console_output', {'data': 'root@server:~$ '})
+                send('server_console_output', {'data': f'! {stderr}'})
+            send('server_console_output', {'data': 'root@server:~$ '})
 
-        threading.Thread(target=run_server_command, daemon=True).start()
+        _spawn(run_server_command)
 
     except Exception as e:
         print(f"[server_console] input error: {e}")
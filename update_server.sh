@@ -93,4 +93,5 @@ echo "=== Обновление завершено ==="
 echo "Для диагностики используйте:"
 echo "  systemctl status botmanager"
 echo "  journalctl -u botmanager -f"
-echo "  curl http://localhost:5000/health"
\ No newline at end of file
+echo "  curl http://localhost:5000/health"
+echo "  curl http://localhost:5000/ready"
\ No newline at end of file
@@ -0,0 +1,378 @@
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from config import cfg
+import metrics
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+POOL_PREFIX = 'wpool-'
+PREP_PREFIX = POOL_PREFIX + 'prep-'
+READY_PREFIX = POOL_PREFIX + 'ready-'
+POOL_LABEL = 'bot-manager-pool'
+WARM_POOL_MAX_BACKOFF = 3600
+
+CREATE_SECONDS = metrics.Histogram('bot_manager_workspace_create_seconds',
+                                   'Создание workspace из шаблона: из тёплого пула или с нуля',
+                                   ('template', 'source'),
+                                   buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+PROVISION_SECONDS = metrics.Histogram('bot_manager_warm_pool_provision_seconds',
+                                      'Подготовка контейнера тёплого пула', ('template', 'result'),
+                                      buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+
+def is_pool_member(name: str) -> bool:
+    """Контейнер-заготовка тёплого пула (ещё не выданный пользователю)"""
+    return name.startswith(POOL_PREFIX)
+
+
+def parse_sizes(spec: str) -> Dict[str, int]:
+    """'python-bot=2,devops=1' -> {'python-bot': 2, 'devops': 1}"""
+    sizes = {}
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        key, _, count = item.partition('=')
+        try:
+            sizes[key.strip()] = max(0, int(count or 1))
+        except ValueError:
+            print(f"[warm_pool] неверный размер пула в WARM_POOL: {item!r}")
+    return sizes
+
+
+def pool_root() -> str:
+    return os.path.join(cfg.BOTS_DIR, '.pool')
+
+
+def _ms(seconds: float) -> int:
+    return round(seconds * 1000)
+
+
+class WarmPool:
+    """
+    Тёплый пул workspace: на каждый шаблон из WARM_POOL заранее создаётся и
+    настраивается (команды и пакеты шаблона) заданное число контейнеров.
+
+    Заготовка живёт под именем wpool-prep-<слот>, пока настраивается, и
+    wpool-ready-<слот>, когда готова; её /workspace — каталог bots/.pool/<слот>.
+    Подключить том к существующему контейнеру Docker не позволяет, поэтому при
+    выдаче каталог не монтируется заново: bots/<имя workspace> становится
+    ссылкой на каталог слота, а контейнер переименовывается в имя workspace.
+    Переименование по старому имени атомарно — один контейнер не достанется
+    двум запросам. Пополняет пул один процесс (блокировка файла в каталоге
+    логов) — раз в WARM_POOL_INTERVAL и сразу после выдачи.
+    """
+
+    def __init__(self):
+        self.sizes = parse_sizes(cfg.WARM_POOL)
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_file = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._preparing: Dict[str, Dict] = {}  # имя заготовки -> {'template', 'started'}
+        self._queued: Dict[str, int] = {}  # шаблон -> поставлено в очередь, ещё не создано
+        self._stats: Dict[str, Dict] = {}
+        self._failures: Dict[str, int] = {}  # шаблон -> неудачных подготовок подряд
+        self._retry_at: Dict[str, float] = {}
+        self.leader = False
+        self.started = False
+        self.last_refill_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return any(self.sizes.values())
+
+    def _stat(self, template: str) -> Dict:
+        return self._stats.setdefault(template, {'hits': 0, 'misses': 0, 'last_claim_ms': None,
+                                                 'cold': 0, 'cold_ms_total': 0, 'provisioned': 0,
+                                                 'provision_failed': 0, 'provision_ms_total': 0})
+
+    def members(self, template: Optional[str] = None):
+        """[(узел, контейнер)] заготовок пула на всех узлах"""
+        from nodes import get_node_registry
+        label = f'{POOL_LABEL}={template}' if template else POOL_LABEL
+        containers, errors = get_node_registry().list_containers(all=True, filters={'label': label})
+        for node, error in errors.items():
+            print(f"[warm_pool] узел {node} пропущен: {error}")
+        return [(node, c) for node, c in containers if is_pool_member(c.name)]
+
+    # --- Выдача -----------------------------------------------------------------
+
+    def claim(self, template: str, workspace_name: str, node: Optional[str] = None) -> Optional[str]:
+        """
+        Выдать готовый контейнер шаблона как workspace workspace_name.
+        Возвращает id контейнера или None, если готовых нет (создавать с нуля).
+        """
+        from docker.errors import APIError, NotFound
+        from docker_api import bump_state_version, normalize_docker_name, write_workspace_files
+        from hibernation import get_hibernator
+        from nodes import get_node_registry
+        if not self.sizes.get(template):
+            return None
+        if not workspace_name:
+            raise ValueError('Имя workspace обязательно')
+        workspace_dir = os.path.join(cfg.BOTS_DIR, workspace_name)
+        if os.path.lexists(workspace_dir):
+            raise ValueError('Каталог workspace уже существует')
+        docker_name = normalize_docker_name(workspace_name)
+        started = time.perf_counter()
+        for member_node, container in self.members(template):
+            if not container.name.startswith(READY_PREFIX) or container.status != 'running':
+                continue
+            if node and member_node.name != node:
+                continue
+            try:
+                # По имени, а не по id: второй запрос на ту же заготовку получит 404
+                member_node.client.api.rename(container.name, docker_name)
+            except NotFound:
+                continue
+            except APIError as e:
+                if e.status_code == 409:
+                    raise ValueError(f'Контейнер {docker_name} уже существует')
+                raise
+            slot = container.name[len(READY_PREFIX):]
+            os.symlink(os.path.join('.pool', slot), workspace_dir)
+            write_workspace_files(workspace_dir, workspace_name)
+            get_node_registry().remember(docker_name, member_node)
+            # Простой для усыпления считается с момента выдачи, а не со старта заготовки
+            get_hibernator().touch(docker_name)
+            bump_state_version()
+            elapsed = time.perf_counter() - started
+            CREATE_SECONDS.observe((template, 'pool'), elapsed)
+            with self._lock:
+                stat = self._stat(template)
+                stat['hits'] += 1
+                stat['last_claim_ms'] = _ms(elapsed)
+            print(f"[warm_pool] {docker_name}: выдан из пула {template} за {_ms(elapsed)} мс")
+            self.trigger()
+            return container.id[:12]
+        with self._lock:
+            self._stat(template)['misses'] += 1
+        self.trigger()
+        return None
+
+    def record_cold(self, template: str, seconds: float):
+        """Создание workspace с нуля (пул пуст или выключен) — для сравнения в статусе"""
+        CREATE_SECONDS.observe((template, 'cold'), seconds)
+        with self._lock:
+            stat = self._stat(template)
+            stat['cold'] += 1
+            stat['cold_ms_total'] += _ms(seconds)
+
+    def trigger(self):
+        """Пополнить пул, не дожидаясь интервала (действует в процессе-лидере)"""
+        self._wake.set()
+
+    # --- Пополнение -------------------------------------------------------------
+
+    def refill(self):
+        """Убрать сломанные заготовки и поставить в очередь недостающие"""
+        from docker_api import get_workspace_templates
+        templates = get_workspace_templates()
+        now = time.time()
+        ready: Dict[str, int] = {}
+        for _, container in self.members():
+            template = container.labels.get(POOL_LABEL)
+            with self._lock:
+                preparing = self._preparing.get(container.name)
+            if container.name.startswith(PREP_PREFIX):
+                if preparing is None:
+                    # Осталась от прерванного процесса — настроена неизвестно насколько
+                    self._discard(container, 'незавершённая подготовка')
+                elif now - preparing['started'] > cfg.WARM_POOL_PREPARE_TIMEOUT:
+                    # exec прервётся с ошибкой, поток подготовки уберёт слот
+                    self._discard(container, f'подготовка дольше {cfg.WARM_POOL_PREPARE_TIMEOUT:g} с',
+                                  keep_slot=True)
+                continue
+            if container.status != 'running':
+                self._discard(container, f'контейнер в состоянии {container.status}')
+                continue
+            if ready.get(template, 0) >= self.sizes.get(template, 0):
+                self._discard(container, 'сверх размера пула')
+                continue
+            ready[template] = ready.get(template, 0) + 1
+
+        for template, size in self.sizes.items():
+            # После неудачной подготовки шаблон ждёт с растущей паузой, а не гоняет установку по кругу
+            if template not in templates or now < self._retry_at.get(template, 0):
+                continue
+            with self._lock:
+                pending = self._queued.get(template, 0) + \
+                    sum(1 for p in self._preparing.values() if p['template'] == template)
+                missing = size - ready.get(template, 0) - pending
+                if missing > 0:
+                    self._queued[template] = self._queued.get(template, 0) + missing
+            for _ in range(max(0, missing)):
+                self._pool_executor().submit(self._prepare, template, templates[template])
+        self.last_refill_at = now
+
+    def _pool_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=max(1, cfg.WARM_POOL_PARALLEL),
+                                                thread_name_prefix='warm-pool')
+        return self._executor
+
+    def _prepare(self, template_key: str, template: Dict):
+        """Создать и настроить одну заготовку (в потоке пула)"""
+        from docker_api import run_workspace_container, write_workspace_files
+        from nodes import get_node_registry
+        from resources import run_kwargs
+        from template_images import get_template_images
+        slot = f'{template_key}-{uuid.uuid4().hex[:10]}'
+        slot_dir = os.path.join(pool_root(), slot)
+        name = PREP_PREFIX + slot
+        started = time.perf_counter()
+        container = None
+        with self._lock:
+            self._queued[template_key] -= 1
+            self._preparing[name] = {'template': template_key, 'started': time.time()}
+        try:
+            os.makedirs(slot_dir)
+            write_workspace_files(slot_dir)
+            limits = run_kwargs(name, 'workspace')
+            node = get_node_registry().place(limits)
+            images = get_template_images()
+            tag = images.ensure(node, template_key, template)
+            container = run_workspace_container(node.client, tag or template['image'], name, slot_dir, limits,
+                                                labels={POOL_LABEL: template_key})
+            failed = images.provision(container, template_key, template, tag)
+            if failed:
+                raise RuntimeError('; '.join(failed))
+            node.client.api.rename(name, READY_PREFIX + slot)
+            elapsed = time.perf_counter() - started
+            PROVISION_SECONDS.observe((template_key, 'ok'), elapsed)
+            with self._lock:
+                stat = self._stat(template_key)
+                stat['provisioned'] += 1
+                stat['provision_ms_total'] += _ms(elapsed)
+                self._failures.pop(template_key, None)
+                self._retry_at.pop(template_key, None)
+            print(f"[warm_pool] {READY_PREFIX + slot}: готов за {elapsed:.1f} с ({node.name})")
+        except Exception as e:
+            PROVISION_SECONDS.observe((template_key, 'error'), time.perf_counter() - started)
+            with self._lock:
+                self._stat(template_key)['provision_failed'] += 1
+                failures = self._failures[template_key] = self._failures.get(template_key, 0) + 1
+                self._retry_at[template_key] = time.time() + min(cfg.WARM_POOL_INTERVAL * 2 ** (failures - 1),
+                                                                 WARM_POOL_MAX_BACKOFF)
+            self.last_error = f'{template_key}: {e}'
+            print(f"[warm_pool] {name}: подготовка не удалась: {e}")
+            if container is not None:
+                self._discard(container, 'ошибка подготовки', log=False)
+            shutil.rmtree(slot_dir, ignore_errors=True)
+        finally:
+            with self._lock:
+                self._preparing.pop(name, None)
+
+    def _discard(self, container, reason: str, keep_slot: bool = False, log: bool = True):
+        from docker_api import _expect_stop
+        if log:
+            print(f"[warm_pool] {container.name}: удаляется ({reason})")
+        try:
+            _expect_stop(container.name)
+            container.remove(force=True)
+        except Exception as e:
+            print(f"[warm_pool] {container.name}: не удалось удалить: {e}")
+            return
+        if not keep_slot:
+            slot = container.name[len(READY_PREFIX if container.name.startswith(READY_PREFIX) else PREP_PREFIX):]
+            shutil.rmtree(os.path.join(pool_root(), slot), ignore_errors=True)
+
+    # --- Запуск -----------------------------------------------------------------
+
+    def _acquire_process_lock(self) -> bool:
+        if not fcntl:
+            return True
+        if self._lock_file is not None:
+            return True
+        lock_file = open(os.path.join(cfg.LOGS_DIR, 'warm_pool.lock'), 'w')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def start(self):
+        """Шаг инициализации: фоновое пополнение пула (в одном процессе)"""
+        if self.started:
+            return
+        from docker_api import get_workspace_templates
+        unknown = set(self.sizes) - set(get_workspace_templates())
+        if unknown:
+            print(f"[warm_pool] неизвестные шаблоны в WARM_POOL пропущены: {', '.join(sorted(unknown))}")
+            for key in unknown:
+                del self.sizes[key]
+        self.leader = self._acquire_process_lock()
+        if self.leader:
+            threading.Thread(target=self._loop, daemon=True, name='warm-pool').start()
+        self.started = True
+        sizes = ', '.join(f'{key}={size}' for key, size in self.sizes.items())
+        print(f"[warm_pool] запущен ({'пополняет' if self.leader else 'только выдаёт'}; {sizes})")
+
+    def _loop(self):
+        while True:
+            try:
+                self.refill()
+            except Exception as e:
+                if str(e) != self.last_error:
+                    print(f"[warm_pool] ошибка пополнения: {e}")
+                self.last_error = str(e)
+            self._wake.wait(cfg.WARM_POOL_INTERVAL)
+            self._wake.clear()
+
+    def status(self) -> Dict:
+        counts: Dict[str, Dict[str, int]] = {}
+        for _, container in self.members():
+            template = container.labels.get(POOL_LABEL)
+            state = 'ready' if container.name.startswith(READY_PREFIX) and container.status == 'running' \
+                else 'preparing'
+            counts.setdefault(template, {'ready': 0, 'preparing': 0})[state] += 1
+        templates = []
+        with self._lock:
+            for key in sorted(set(self.sizes) | set(counts) | set(self._stats)):
+                stat = self._stat(key)
+                templates.append({
+                    'template': key,
+                    'size': self.sizes.get(key, 0),
+                    **counts.get(key, {'ready': 0, 'preparing': 0}),
+                    'hits': stat['hits'],
+                    'misses': stat['misses'],
+                    'last_claim_ms': stat['last_claim_ms'],
+                    'avg_cold_create_ms': round(stat['cold_ms_total'] / stat['cold']) if stat['cold'] else None,
+                    'provisioned': stat['provisioned'],
+                    'provision_failed': stat['provision_failed'],
+                    'retry_at': self._retry_at.get(key) and time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                                          time.gmtime(self._retry_at[key])),
+                    'avg_provision_ms': round(stat['provision_ms_total'] / stat['provisioned'])
+                    if stat['provisioned'] else None,
+                })
+        return {
+            'enabled': self.enabled,
+            'leader': self.leader,
+            'last_refill_at': self.last_refill_at and time.strftime('%Y-%m-%dT%H:%M:%SZ',
+                                                                    time.gmtime(self.last_refill_at)),
+            'error': self.last_error,
+            'templates': templates,
+        }
+
+
+_warm_pool_singleton: Optional[WarmPool] = None
+
+
+def get_warm_pool() -> WarmPool:
+    global _warm_pool_singleton
+    if _warm_pool_singleton is None:
+        _warm_pool_singleton = WarmPool()
+    return _warm_pool_singleton